@@ -0,0 +1,8 @@
+""" Benchmarks of the zinc reader and the zinc, json and csv writers
+on synthetic payloads.
+
+Run from the repository root:
+
+    python -m benchmark --sizes 1000,100000 --out results.json
+    python -m benchmark --out new.json --compare results.json
+"""
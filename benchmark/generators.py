@@ -0,0 +1,105 @@
+""" Seedable generators of synthetic haystack zinc payloads.
+
+All generators return zinc text and produce the same payload
+for the same arguments and seed.
+"""
+import datetime
+import random
+
+# timezone name and offset used for generated timestamps
+TZ = ("New_York", "-05:00")
+
+KINDS = [
+    ("Number", "kW"),
+    ("Number", "kWh"),
+    ("Number", "cfm"),
+    ("Number", "%"),
+    ("Number", None),
+    ("Bool", None),
+]
+
+EQUIPS = ["AHU", "RTU", "VAV", "Boiler", "Chiller", "Meter", "Pump"]
+POINTS = ["Discharge Air Temp", "Return Air Temp", "Fan Status", "Power",
+          "Energy", "Damper Cmd", "Valve Cmd", "Zone Temp", "Occupied"]
+
+
+def point_grid(num_rows, seed=0):
+    """Return grid of point records with refs, markers, strings,
+    numbers with units, uris and datetimes.
+
+    Args:
+        num_rows: number of points
+        seed: random seed
+    """
+    rnd = random.Random(seed)
+    lines = ['ver:"2.0" database:"demo" generated\n'
+             'id,dis,point,his,cur,kind,unit,curVal,siteRef,equipRef,tz,hisUri,mod\n']
+    for i in range(num_rows):
+        kind, unit = rnd.choice(KINDS)
+        equip = "%s-%d" % (rnd.choice(EQUIPS), rnd.randint(1, 40))
+        if kind == "Bool":
+            cur = rnd.choice("TF")
+        else:
+            cur = "%.2f%s" % (rnd.uniform(-50, 500), unit or "")
+        lines.append('@p.%d,"%s %s",M,M,%s,"%s",%s,%s,@s.%d "Site %d",@e.%s,"%s",`/his/%d`,%s\n' % (
+            i, equip, rnd.choice(POINTS), "M" if rnd.random() < 0.7 else "",
+            kind, '"%s"' % unit if unit else "N", cur,
+            i % 7, i % 7, equip, TZ[0], i, _timestamp(rnd.randint(0, 10 ** 8))))
+    return "".join(lines)
+
+
+def his_grid(num_rows, seed=0, unit="kWh", interval=900, nulls=0.01, point=0):
+    """Return history grid of ts,val rows.
+
+    Args:
+        num_rows: number of rows
+        seed: random seed
+        unit: unit of values or None
+        interval: seconds between timestamps
+        nulls: fraction of rows with null values
+        point: id of the point in the grid meta
+    """
+    rnd = random.Random(seed)
+    lines = ['ver:"2.0" id:@p.%d hisStart:%s hisEnd:%s\nts,val\n' % (
+        point, _timestamp(0), _timestamp(num_rows * interval))]
+    append = lines.append
+    unit = unit or ""
+    val = 100.0
+    for i in range(num_rows):
+        val = max(0.0, val + rnd.gauss(0, 5))
+        if rnd.random() < nulls:
+            append("%s,\n" % _timestamp(i * interval))
+        else:
+            append("%s,%.3f%s\n" % (_timestamp(i * interval), val, unit))
+    return "".join(lines)
+
+
+def multigrid(num_rows, num_grids=10, seed=0):
+    """Return multigrid payload of history grids.
+
+    Args:
+        num_rows: total number of rows of all grids
+        num_grids: number of grids
+        seed: random seed
+    """
+    rnd = random.Random(seed)
+    grids = []
+    for i in range(num_grids):
+        unit = rnd.choice(KINDS)[1]
+        grids.append(his_grid(num_rows / num_grids, rnd.randint(0, 2 ** 31),
+                              unit=unit, point=i))
+    return "\n".join(grids)
+
+
+GENERATORS = {
+    "points": point_grid,
+    "his": his_grid,
+    "multigrid": multigrid,
+}
+
+START = datetime.datetime(2015, 1, 1)
+
+
+def _timestamp(seconds):
+    dt = START + datetime.timedelta(seconds=seconds)
+    return "%s%s %s" % (dt.strftime("%Y-%m-%dT%H:%M:%S"), TZ[1], TZ[0])
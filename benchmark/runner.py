@@ -0,0 +1,163 @@
+""" Benchmark runner.
+
+Each case runs in a fresh worker process, which generates the payload,
+then times the case and records the growth of the peak resident set
+size of the process while the case runs.
+
+usage:
+    python -m benchmark [--payloads points,his,multigrid] [--sizes 1000,100000]
+                        [--cases zinc_read,...] [--repeat 3] [--seed 0]
+                        [--out results.json] [--compare baseline.json]
+"""
+import argparse
+import datetime
+import gc
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import time
+from hs.io import ZincReader, ZincWriter, JsonReader, JsonWriter, CsvWriter
+from hs.binary import BinaryReader, BinaryWriter
+from hs.jsonbackend import available_backends
+from generators import GENERATORS
+
+DEFAULT_SIZES = [1000, 100000]
+
+# name -> (function(payload, grids), payloads the case applies to or None for all)
+CASES = [
+    ("zinc_read", lambda payload, grids: ZincReader(payload).readGrids(), None),
+    ("zinc_read_his", lambda payload, grids: ZincReader(payload).readHis(), ["his"]),
+    ("zinc_write", lambda payload, grids: ZincWriter.gridsToString(grids), None),
+    ("json_write", lambda payload, grids: JsonWriter.gridsToString(grids), None),
+    ("csv_write", lambda payload, grids: CsvWriter.gridsToString(grids), None),
+    ("binary_read", lambda payload, grids: BinaryReader(payload).readGrids(), None),
+    ("binary_write", lambda payload, grids: BinaryWriter.gridsToString(grids), None),
+]
+
+# json read of the payload written as json, with each installed JSON backend
+# (readAll results are point grids, use --payloads points to compare those)
+for _backend in available_backends():
+    CASES.append(("json_read_" + _backend,
+                  lambda payload, grids, backend=_backend: JsonReader(payload, backend=backend).readGrids(),
+                  None))
+
+
+def run_case(payload_name, num_rows, case_name, seed=0, repeat=3):
+    """Time a single case in the current process.
+
+    Returns:
+        dict with the timing and memory of the case
+    """
+    func = dict((name, f) for name, f, _ in CASES)[case_name]
+    payload = GENERATORS[payload_name](num_rows, seed=seed)
+    grids = ZincReader(payload).readGrids() if case_name.endswith("_write") else None
+    if case_name.startswith("json_read"):
+        payload = JsonWriter.gridsToString(ZincReader(payload).readGrids())
+    elif case_name == "binary_read":
+        payload = BinaryWriter.gridsToString(ZincReader(payload).readGrids())
+    gc.collect()
+    rss = peak_rss_kb()
+    best = None
+    for i in range(repeat):
+        t = time.time()
+        func(payload, grids)
+        elapsed = time.time() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return {
+        "payload": payload_name,
+        "rows": num_rows,
+        "case": case_name,
+        "bytes": len(payload),
+        "seconds": best,
+        "rows_per_sec": num_rows / best if best else None,
+        "peak_rss_kb": peak_rss_kb() - rss,
+    }
+
+
+def run(payloads, sizes, cases, seed=0, repeat=3):
+    """Run all combinations of payloads, sizes and cases, each
+    in a new process.
+
+    Returns:
+        list of result dicts
+    """
+    results = []
+    for payload_name in payloads:
+        for num_rows in sizes:
+            for case_name, func, applies in CASES:
+                if case_name not in cases or (applies and payload_name not in applies):
+                    continue
+                pool = multiprocessing.Pool(1)
+                try:
+                    result = pool.apply(run_case, (payload_name, num_rows, case_name, seed, repeat))
+                finally:
+                    pool.terminate()
+                print_result(result)
+                results.append(result)
+    return results
+
+
+def peak_rss_kb():
+    """Return peak resident set size of the process in kB."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on mac os, in kB elsewhere
+    return rss / 1024 if sys.platform == "darwin" else rss
+
+
+def compare(baseline, results):
+    """Print rows/sec of results relative to a baseline result list."""
+    old = dict(((r["payload"], r["rows"], r["case"]), r) for r in baseline)
+    print "\n%-10s %9s %-14s %12s %12s %7s" % ("payload", "rows", "case", "base rows/s", "rows/s", "ratio")
+    for r in results:
+        b = old.get((r["payload"], r["rows"], r["case"]))
+        if b is None or not b["rows_per_sec"] or not r["rows_per_sec"]:
+            continue
+        print "%-10s %9d %-14s %12.0f %12.0f %6.2fx" % (
+            r["payload"], r["rows"], r["case"], b["rows_per_sec"], r["rows_per_sec"],
+            r["rows_per_sec"] / b["rows_per_sec"])
+
+
+def print_result(r):
+    print "%-10s %9d %-14s %8.3fs %12.0f rows/s %10d kB" % (
+        r["payload"], r["rows"], r["case"], r["seconds"], r["rows_per_sec"] or 0, r["peak_rss_kb"])
+    sys.stdout.flush()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="pyhs parser and writer benchmarks")
+    parser.add_argument("--payloads", default=",".join(sorted(GENERATORS)))
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    parser.add_argument("--cases", default=",".join(name for name, _, _ in CASES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results to json file")
+    parser.add_argument("--compare", help="compare with results json file")
+    args = parser.parse_args(argv)
+
+    results = run(args.payloads.split(","), [int(float(n)) for n in args.sizes.split(",")],
+                  args.cases.split(","), args.seed, args.repeat)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "date": datetime.datetime.now().isoformat(),
+                "seed": args.seed,
+                "repeat": args.repeat,
+                "results": results,
+            }, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f)["results"], results)
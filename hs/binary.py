@@ -0,0 +1,1099 @@
+# coding: utf8
+""" Compact binary encoding of grids, dicts and values.
+
+The binary format is meant for caching grids and passing them between
+processes, where zinc would have to be parsed character by character.
+Grids are stored column by column and cells are decoded a column block
+at a time from packed arrays.
+
+Payload layout, integers are little endian:
+
+    payload := MAGIC record*
+    record  := kind strings varint(len) body       kind: 'G' grid, 'D' dict, 'V' value
+    strings := varint(count) (varint(len) utf8)*   strings added to the string table
+    grid    := dict(meta) varint(numCols) (varint(name) dict(meta))*
+               varint(numRows) varint(blockRows) (varint(len) column)*
+    column  := (varint(len) block)*                blocks of blockRows rows
+    dict    := varint(count) (varint(name) scalar)*
+
+The string table holds tag names, ref ids and display names, units and
+timezone names. It grows over the records of a payload, so grids of a
+multigrid share it; strings of HStr and HUri values are stored inline.
+
+A block starts with the kind of its cells. Blocks of a single kind store
+the non-null cells in packed arrays: float64 numbers, narrowest integer
+width for string table indices, dates, times and timestamps (the local
+time in milliseconds since 1970-01-01, delta encoded), constant runs as a
+single value. Strings which repeat within a block are stored once. Blocks
+of mixed kinds store the kind of each cell, then a block of the cells of
+each kind.
+
+Grids, columns and blocks are length prefixed, so BinaryReader skips grids,
+columns and rows which are not requested without decoding them.
+
+Columnar grids keep numbers, timestamps, booleans and strings in typed
+HColumn arrays: they are read from and written to the packed arrays of
+the blocks without making a value for each cell.
+
+Example:
+    s = BinaryWriter.gridsToString(grids)
+    grids = BinaryReader(s).readGrids()
+"""
+import array
+import datetime
+import gc
+import string
+import struct
+from grid import HGrid, HColumnGrid, HColumn, HCol, HDict, EPOCH_ORDINAL, TS_TYPECODE
+from val import HMarker, HBool, HStr, HNum, HDate, HRef, HTime, HTimeZone, HDateTime, HUri
+from io import BaseWriter, WRITE_CHUNK_SIZE, _grid_to_string, _grids_to_string
+
+MAGIC = 'HSB\x01'
+
+# default number of rows of a column block
+BLOCK_ROWS = 4096
+
+REC_GRID, REC_DICT, REC_VAL = 'G', 'D', 'V'
+
+# kinds of scalars and blocks
+(K_NULL, K_MARKER, K_BOOL, K_STR, K_NUM, K_REF, K_URI,
+ K_DATE, K_TIME, K_DATETIME, K_MIXED) = range(11)
+
+DAY_MILLIS = 86400000
+
+NoneType = type(None)
+
+############################################################
+######################### Packing ##########################
+############################################################
+
+# signed integer widths by struct code
+INT_RANGES = [
+    ('b', -(1 << 7), (1 << 7) - 1),
+    ('h', -(1 << 15), (1 << 15) - 1),
+    ('i', -(1 << 31), (1 << 31) - 1),
+    ('q', -(1 << 63), (1 << 63) - 1),
+]
+INT_SIZES = {'b': 1, 'h': 2, 'i': 4, 'q': 8}
+
+_DOUBLE = struct.Struct('<d')
+_LONG = struct.Struct('<q')
+_INT = struct.Struct('<i')
+
+
+def _varint(n):
+    """Encode non-negative integer as varint, 7 bits per byte."""
+    if n < 0x80:
+        return chr(n)
+    parts = []
+    while n >= 0x80:
+        parts.append(chr(n & 0x7f | 0x80))
+        n >>= 7
+    parts.append(chr(n))
+    return ''.join(parts)
+
+def _read_varint(buf, pos):
+    b = ord(buf[pos])
+    pos += 1
+    if b < 0x80:
+        return b, pos
+    n = b & 0x7f
+    shift = 7
+    while True:
+        b = ord(buf[pos])
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+def _pack_ints(vals):
+    """Pack non-empty list of integers with the narrowest width,
+    'c' and a single value when all of them are equal."""
+    lo = min(vals)
+    hi = max(vals)
+    if lo == hi:
+        return 'c' + _LONG.pack(lo)
+    for code, low, high in INT_RANGES:
+        if low <= lo and hi <= high:
+            return code + struct.pack('<%d%s' % (len(vals), code), *vals)
+    raise ValueError("Integer out of range: %s, %s" % (lo, hi))
+
+def _unpack_ints(buf, pos, n):
+    """Unpack n integers packed by _pack_ints.
+
+    Returns:
+        list or tuple of integers and the position after them
+    """
+    code = buf[pos]
+    pos += 1
+    if code == 'c':
+        return [_LONG.unpack_from(buf, pos)[0]] * n, pos + 8
+    size = INT_SIZES.get(code)
+    if size is None:
+        raise ValueError("Invalid integer packing: %r" % code)
+    return struct.unpack_from('<%d%s' % (n, code), buf, pos), pos + n * size
+
+def _utf8(s):
+    return s.encode('utf-8') if isinstance(s, unicode) else s
+
+def _days(date, cache):
+    """Return days of HDate since 1970-01-01, cache is a dict by HDate."""
+    d = cache.get(date)
+    if d is None:
+        d = cache[date] = datetime.date(date.year, date.month, date.day).toordinal() - EPOCH_ORDINAL
+    return d
+
+def _millis(time, cache):
+    """Return milliseconds of day of HTime, cache is a dict by HTime."""
+    ms = cache.get(time)
+    if ms is None:
+        ms = cache[time] = ((time.hour * 60 + time.min) * 60 + time.sec) * 1000 + int(time.ms)
+    return ms
+
+############################################################
+######################### Writer ###########################
+############################################################
+
+class BinaryWriter(BaseWriter):
+    """BinaryWriter writes grids, dicts and values in the binary format
+    described in the module documentation.
+
+    Records written by one writer share the string table, so they have
+    to be read in order by one BinaryReader.
+    """
+    def __init__(self, out, chunk_size=WRITE_CHUNK_SIZE, block_rows=BLOCK_ROWS):
+        """ctor
+        Args:
+            out: binary file stream or StringIO to use for output
+            chunk_size: see BaseWriter
+            block_rows: number of rows of a column block, the unit in
+                which readers skip rows
+        """
+        BaseWriter.__init__(self, out, chunk_size)
+        self.block_rows = block_rows
+        self._started = False
+        # string table: string -> index
+        self._strings = {}
+        # strings added to the table by the record being encoded
+        self._newStrings = []
+
+    @staticmethod
+    def gridToString(grid):
+        return _grid_to_string(grid, BinaryWriter)
+
+    @staticmethod
+    def gridsToString(grids):
+        return _grids_to_string(grids, BinaryWriter)
+
+    @staticmethod
+    def dictToString(d):
+        w = BinaryWriter(None)
+        return w._record(REC_DICT, w._encodeDict(d))
+
+    @staticmethod
+    def valToString(val):
+        w = BinaryWriter(None)
+        return w._record(REC_VAL, w._encodeScalar(val))
+
+    def writeGrid(self, grid):
+        """Write a grid to stream.
+
+        Args:
+            grid: HGrid instance
+        """
+        self._write(self._gridRecord(grid))
+        self.flush()
+
+    def writeGrids(self, grids):
+        """Write grids of an iterable, each grid is a record.
+
+        Args:
+            grids: iterable of HGrid instances
+        """
+        for grid in grids:
+            self._write(self._gridRecord(grid))
+        self.flush()
+
+    def writeDict(self, d):
+        """Write dict (HDict or dict of HVals) to stream."""
+        self._write(self._record(REC_DICT, self._encodeDict(d)))
+        self.flush()
+
+    def writeVal(self, val):
+        """Write a value (HVal or None) to stream."""
+        self._write(self._record(REC_VAL, self._encodeScalar(val)))
+        self.flush()
+
+    ############################################################
+    ######################### Implementation ###################
+    ############################################################
+
+    def _record(self, kind, body):
+        parts = []
+        if not self._started:
+            self._started = True
+            parts.append(MAGIC)
+        strings = self._newStrings
+        parts.append(kind)
+        parts.append(_varint(len(strings)))
+        for s in strings:
+            parts.append(_varint(len(s)))
+            parts.append(s)
+        del strings[:]
+        parts.append(_varint(len(body)))
+        parts.append(body)
+        return ''.join(parts)
+
+    def _str(self, s):
+        """Return string table index of string, adding it if needed."""
+        i = self._strings.get(s)
+        if i is None:
+            s = _utf8(s)
+            i = self._strings.get(s)
+            if i is None:
+                i = self._strings[s] = len(self._strings)
+                self._newStrings.append(s)
+        return i
+
+    def _gridRecord(self, grid):
+        # encoding allocates many acyclic objects, cyclic garbage
+        # collection would only walk them over and over
+        gcEnabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._record(REC_GRID, self._encodeGrid(grid))
+        finally:
+            if gcEnabled:
+                gc.enable()
+
+    def _encodeGrid(self, grid):
+        parts = [self._encodeDict(grid.meta), _varint(len(grid.cols))]
+        for col in grid.cols:
+            parts.append(_varint(self._str(col.name)))
+            parts.append(self._encodeDict(col.meta))
+        numRows = grid.num_rows()
+        blockRows = self.block_rows
+        parts.append(_varint(numRows))
+        parts.append(_varint(blockRows))
+        columns = [[] for col in grid.cols]
+        typed = [None] * len(grid.cols)
+        if isinstance(grid, HColumnGrid):
+            typed = map(_typed_column, grid._columns)
+        if typed.count(None) < len(typed):
+            # typed columns are encoded from their arrays, without cells
+            cells = [grid._colCells(i) if column is None else None for i, column in enumerate(typed)]
+            colSlices = lambda start, end: [c if c is None else c[start:end] for c in cells]
+        else:
+            colSlices = grid.col_slices
+        for i in xrange(0, numRows, blockRows):
+            for blocks, vals, column in zip(columns, colSlices(i, i + blockRows), typed):
+                if column is None:
+                    block = self._encodeBlock(vals)
+                else:
+                    block = self._encodeTyped(column, i, i + blockRows)
+                blocks.append(_varint(len(block)))
+                blocks.append(block)
+        for blocks in columns:
+            column = ''.join(blocks)
+            parts.append(_varint(len(column)))
+            parts.append(column)
+        return ''.join(parts)
+
+    def _encodeDict(self, d):
+        parts = []
+        n = 0
+        for name, val in d.iteritems():
+            if val is None:
+                continue
+            parts.append(_varint(self._str(name)))
+            parts.append(self._encodeScalar(val))
+            n += 1
+        return _varint(n) + ''.join(parts)
+
+    def _encodeScalar(self, val):
+        encoder = SCALAR_ENCODERS.get(type(val))
+        if encoder is None:
+            raise ValueError("value type not supported: %s" % type(val))
+        return encoder(self, val)
+
+    def _scalarStr(self, val):
+        s = _utf8(val.val)
+        return chr(K_STR) + _varint(len(s)) + s
+
+    def _scalarUri(self, val):
+        s = _utf8(val.val)
+        return chr(K_URI) + _varint(len(s)) + s
+
+    def _scalarNum(self, val):
+        return (chr(K_NUM) + _DOUBLE.pack(val.val) +
+                _varint(0 if val.unit is None else self._str(val.unit) + 1))
+
+    def _scalarRef(self, val):
+        return (chr(K_REF) + _varint(self._str(val.val)) +
+                _varint(0 if val._dis is None else self._str(val._dis) + 1))
+
+    def _scalarDate(self, val):
+        # ordinal, which unlike days since 1970 is not negative
+        return chr(K_DATE) + _varint(_days(val, {}) + EPOCH_ORDINAL)
+
+    def _scalarTime(self, val):
+        return chr(K_TIME) + _varint(_millis(val, {}))
+
+    def _scalarDateTime(self, val):
+        stamp = _days(val.date, {}) * DAY_MILLIS + _millis(val.time, {})
+        return (chr(K_DATETIME) + _LONG.pack(stamp) +
+                _INT.pack(int(val.tz_offset)) + _varint(self._str(val.tz.name)))
+
+    def _encodeBlock(self, vals):
+        """Encode cells of a column block."""
+        kinds = set(map(type, vals))
+        hasNulls = NoneType in kinds
+        kinds.discard(NoneType)
+        if not kinds:
+            return chr(K_NULL)
+        if len(kinds) > 1:
+            return self._encodeMixed(vals)
+        kind = kinds.pop()
+        encoder = BLOCK_ENCODERS.get(kind)
+        if encoder is None:
+            raise ValueError("value type not supported: %s" % kind)
+        code, encode = encoder
+        if hasNulls:
+            present = [v for v in vals if v is not None]
+            flags = '\x01' + ''.join(['\x00' if v is None else '\x01' for v in vals])
+        else:
+            present = vals
+            flags = '\x00'
+        return chr(code) + flags + encode(self, present)
+
+    def _encodeTyped(self, column, start, end):
+        """Encode rows start to end of a HColumn as a column block."""
+        present = column.values[start:end]
+        offsets = None
+        if column.kind == "datetime":
+            offsets = column.tz_offset
+            offsets = [0] * len(present) if offsets is None else offsets[start:end]
+        nulls = column.mask[start:end] if column.mask is not None else ()
+        if 1 in nulls:
+            if 0 not in nulls:
+                return chr(K_NULL)
+            flags = '\x01' + ''.join(['\x00' if null else '\x01' for null in nulls])
+            present = [v for v, null in zip(present, nulls) if not null]
+            if offsets is not None:
+                offsets = [v for v, null in zip(offsets, nulls) if not null]
+        else:
+            flags = '\x00'
+        code, encode = TYPED_ENCODERS[column.kind]
+        return chr(code) + flags + encode(self, column, present, offsets)
+
+    def _typedBools(self, column, vals, offsets):
+        return ''.join(['\x01' if v else '\x00' for v in vals])
+
+    def _typedStrs(self, column, vals, offsets):
+        return self._packStrs(vals)
+
+    def _typedNums(self, column, vals, offsets):
+        unit = 0 if column.unit is None else self._str(column.unit) + 1
+        return struct.pack('<%dd' % len(vals), *vals) + 'c' + _LONG.pack(unit)
+
+    def _typedDateTimes(self, column, vals, offsets):
+        # epoch milliseconds to local times
+        stamps = [stamp + offset * 1000 for stamp, offset in zip(vals, offsets)]
+        tz = self._str(column.tz or HTimeZone.UTC.name)
+        return self._packStamps(stamps, offsets, 'c' + _LONG.pack(tz))
+
+    def _encodeMixed(self, vals):
+        """Encode block of cells of different kinds: the kind of each
+        cell, then the cells of each kind as length prefixed block."""
+        byKind = {}
+        tags = []
+        for v in vals:
+            if v is None:
+                tags.append(K_NULL)
+                continue
+            encoder = BLOCK_ENCODERS.get(type(v))
+            if encoder is None:
+                raise ValueError("value type not supported: %s" % type(v))
+            tags.append(encoder[0])
+            byKind.setdefault(encoder, []).append(v)
+        parts = [chr(K_MIXED), ''.join(map(chr, tags))]
+        for (code, encode), present in sorted(byKind.items()):
+            block = encode(self, present)
+            parts.append(_varint(len(block)))
+            parts.append(block)
+        return ''.join(parts)
+
+    def _blockBools(self, vals):
+        return ''.join(['\x01' if v.val else '\x00' for v in vals])
+
+    def _blockStrs(self, vals):
+        return self._packStrs([v.val for v in vals])
+
+    def _packStrs(self, strs):
+        joined = ''.join(strs)
+        # joined is unicode if any of the strings is
+        if isinstance(joined, unicode):
+            strs = map(_utf8, strs)
+            joined = ''.join(strs)
+        distinct = set(strs)
+        if len(distinct) * 2 > len(strs):
+            return '\x00' + _pack_ints(map(len, strs)) + joined
+        # repeated strings are stored once, cells are indexes of them
+        distinct = sorted(distinct)
+        index = dict([(s, i) for i, s in enumerate(distinct)])
+        return ''.join(['\x01', _varint(len(distinct)), _pack_ints(map(len, distinct)),
+                        ''.join(distinct), _pack_ints([index[s] for s in strs])])
+
+    def _blockNums(self, vals):
+        strIndex = self._str
+        units = {}
+        unitIndexes = []
+        for v in vals:
+            unit = v.unit
+            i = units.get(unit)
+            if i is None:
+                i = units[unit] = 0 if unit is None else strIndex(unit) + 1
+            unitIndexes.append(i)
+        return (struct.pack('<%dd' % len(vals), *[v.val for v in vals]) +
+                _pack_ints(unitIndexes))
+
+    def _blockRefs(self, vals):
+        ids = self._strIndexes([v.val for v in vals])
+        dis = [v._dis for v in vals]
+        if set(dis) == set([None]):
+            dis = [0] * len(vals)
+        else:
+            dis = [0 if i is None else i + 1 for i in self._strIndexes(dis)]
+        return _pack_ints(ids) + _pack_ints(dis)
+
+    def _strIndexes(self, strs):
+        """Return string table indexes of strings, None for None."""
+        strings = self._strings
+        indexes = map(strings.get, strs)
+        if None in indexes:
+            strIndex = self._str
+            newStrings = self._newStrings
+            for i, s in enumerate(strs):
+                if indexes[i] is not None or s is None:
+                    continue
+                if type(s) is str:
+                    # inlined _str, for the many new ids of a grid
+                    n = strings.get(s)
+                    if n is None:
+                        n = strings[s] = len(strings)
+                        newStrings.append(s)
+                    indexes[i] = n
+                else:
+                    indexes[i] = strIndex(s)
+        return indexes
+
+    def _blockDates(self, vals):
+        days = {}
+        return _pack_ints([_days(v, days) for v in vals])
+
+    def _blockTimes(self, vals):
+        times = {}
+        return _pack_ints([_millis(v, times) for v in vals])
+
+    def _blockDateTimes(self, vals):
+        days = {}
+        times = {}
+        stamps = []
+        append = stamps.append
+        for v in vals:
+            date = v.date
+            d = days.get(date)
+            if d is None:
+                d = _days(date, days)
+            time = v.time
+            t = times.get(time)
+            if t is None:
+                t = times[time] = ((time.hour * 60 + time.min) * 60 + time.sec) * 1000 + int(time.ms)
+            append(d * DAY_MILLIS + t)
+        zones = set([v.tz for v in vals])
+        if len(zones) == 1:
+            tzIndexes = 'c' + _LONG.pack(self._str(zones.pop().name))
+        else:
+            tzIndexes = _pack_ints(self._strIndexes([v.tz.name for v in vals]))
+        return self._packStamps(stamps, [int(v.tz_offset) for v in vals], tzIndexes)
+
+    def _packStamps(self, stamps, offsets, tzIndexes):
+        """Pack local timestamps delta encoded, their offsets and the
+        packed string table indexes of their timezones."""
+        deltas = [b - a for a, b in zip(stamps, stamps[1:])]
+        return ''.join([_LONG.pack(stamps[0]),
+                        _pack_ints(deltas) if deltas else '',
+                        _pack_ints(offsets),
+                        tzIndexes])
+
+SCALAR_ENCODERS = {
+    NoneType: lambda self, val: chr(K_NULL),
+    HMarker: lambda self, val: chr(K_MARKER),
+    HBool: lambda self, val: chr(K_BOOL) + ('\x01' if val.val else '\x00'),
+    HStr: BinaryWriter._scalarStr.im_func,
+    HNum: BinaryWriter._scalarNum.im_func,
+    HRef: BinaryWriter._scalarRef.im_func,
+    HUri: BinaryWriter._scalarUri.im_func,
+    HDate: BinaryWriter._scalarDate.im_func,
+    HTime: BinaryWriter._scalarTime.im_func,
+    HDateTime: BinaryWriter._scalarDateTime.im_func,
+}
+
+# block kind and encoder of the non-null cells by cell type
+BLOCK_ENCODERS = {
+    HMarker: (K_MARKER, lambda self, vals: ''),
+    HBool: (K_BOOL, BinaryWriter._blockBools.im_func),
+    HStr: (K_STR, BinaryWriter._blockStrs.im_func),
+    HNum: (K_NUM, BinaryWriter._blockNums.im_func),
+    HRef: (K_REF, BinaryWriter._blockRefs.im_func),
+    HUri: (K_URI, BinaryWriter._blockStrs.im_func),
+    HDate: (K_DATE, BinaryWriter._blockDates.im_func),
+    HTime: (K_TIME, BinaryWriter._blockTimes.im_func),
+    HDateTime: (K_DATETIME, BinaryWriter._blockDateTimes.im_func),
+}
+
+# block kind and encoder of the non-null values by HColumn kind
+TYPED_ENCODERS = {
+    "bool": (K_BOOL, BinaryWriter._typedBools.im_func),
+    "str": (K_STR, BinaryWriter._typedStrs.im_func),
+    "number": (K_NUM, BinaryWriter._typedNums.im_func),
+    "datetime": (K_DATETIME, BinaryWriter._typedDateTimes.im_func),
+}
+
+def _typed_column(column):
+    """Return column if it is a HColumn which is encoded from its
+    arrays, None for cell columns and NumPy columns."""
+    if not isinstance(column, HColumn) or column.kind not in TYPED_ENCODERS:
+        return None
+    sequences = (array.array, list, tuple)
+    if not isinstance(column.values, sequences) or not isinstance(column.mask, sequences + (NoneType,)):
+        return None
+    if column.kind == "datetime":
+        if getattr(column.values, "typecode", None) == 'd' or \
+                not isinstance(column.tz_offset, sequences + (NoneType,)):
+            return None
+    return column
+
+############################################################
+######################### Reader ###########################
+############################################################
+
+class BinaryReader(object):
+    """BinaryReader reads grids, dicts and values written by BinaryWriter.
+
+    Records are read in the order they were written. Values are decoded
+    into the same types as by ZincReader, strings as utf-8 encoded str.
+    """
+    def __init__(self, source):
+        """ctor
+        Args:
+            source: str or buffer with the payload, or file-like object
+                which is read completely
+        """
+        if hasattr(source, "read"):
+            source = source.read()
+        self.buf = source
+        self.pos = 0
+        self._strings = []
+        # decoded dates and times by day and millisecond of day
+        self._dates = {}
+        self._times = {}
+        # decoded refs by string table indexes of id and dis
+        self._refs = {}
+
+    def readGrid(self, cols=None, start=0, end=None, columnar=False):
+        """Read the next grid.
+
+        Args:
+            cols: names of the columns to read, columns which are not in
+                the grid are ignored; None for all columns
+            start: index of the first row to read
+            end: index after the last row to read, None for all rows
+            columnar: return a HColumnGrid of the decoded columns,
+                without making rows; columns of numbers of one unit,
+                timestamps of one timezone, booleans or strings are
+                decoded into typed HColumn arrays, their cells are only
+                made when they are accessed
+        Returns:
+            HGrid instance or None if there are no more records
+        """
+        body = self._readRecord(REC_GRID)
+        if body is None:
+            return None
+        buf, pos, recordEnd = body
+        gcEnabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._readGrid(buf, pos, cols, start, end, columnar)
+        except (struct.error, IndexError):
+            raise ValueError("Truncated binary grid")
+        finally:
+            self.pos = recordEnd
+            if gcEnabled:
+                gc.enable()
+
+    def readGrids(self, columnar=False):
+        """Read all remaining grids.
+
+        Args:
+            columnar: see readGrid
+        Returns:
+            list of HGrid instances
+        """
+        grids = []
+        grid = self.readGrid(columnar=columnar)
+        while grid is not None:
+            grids.append(grid)
+            grid = self.readGrid(columnar=columnar)
+        return grids
+
+    def readDict(self):
+        """Read the next dict.
+
+        Returns:
+            HDict instance or None if there are no more records
+        """
+        body = self._readRecord(REC_DICT)
+        if body is None:
+            return None
+        buf, pos, self.pos = body
+        try:
+            return self._readDict(buf, pos)[0]
+        except (struct.error, IndexError):
+            raise ValueError("Truncated binary dict")
+
+    def readVal(self):
+        """Read the next value, which may be None.
+
+        Raises:
+            ValueError if there are no more records
+        """
+        body = self._readRecord(REC_VAL)
+        if body is None:
+            raise ValueError("End of binary payload")
+        buf, pos, self.pos = body
+        try:
+            return self._readScalar(buf, pos)[0]
+        except (struct.error, IndexError):
+            raise ValueError("Truncated binary value")
+
+    ############################################################
+    ######################### Implementation ###################
+    ############################################################
+
+    def _readRecord(self, kind):
+        """Read record header and string table entries.
+
+        Returns:
+            (buf, body start, body end) or None at the end of the payload
+        """
+        buf = self.buf
+        pos = self.pos
+        if pos == 0:
+            if buf[:len(MAGIC)] != MAGIC:
+                if not len(buf):
+                    return None
+                raise ValueError("Not a binary grid payload")
+            pos = len(MAGIC)
+        if pos >= len(buf):
+            self.pos = pos
+            return None
+        try:
+            if buf[pos] != kind:
+                raise ValueError("Expected record %r, found %r" % (kind, buf[pos]))
+            count, pos = _read_varint(buf, pos + 1)
+            strings = self._strings
+            for i in xrange(count):
+                n, pos = _read_varint(buf, pos)
+                strings.append(buf[pos:pos + n])
+                pos += n
+            n, pos = _read_varint(buf, pos)
+        except IndexError:
+            raise ValueError("Truncated binary record")
+        if pos + n > len(buf):
+            raise ValueError("Truncated binary record")
+        self.pos = pos
+        return buf, pos, pos + n
+
+    def _readGrid(self, buf, pos, names, start, end, columnar):
+        strings = self._strings
+        meta, pos = self._readDict(buf, pos)
+        numCols, pos = _read_varint(buf, pos)
+        colNames = []
+        colMetas = []
+        for i in xrange(numCols):
+            name, pos = _read_varint(buf, pos)
+            colNames.append(strings[name])
+            colMeta, pos = self._readDict(buf, pos)
+            colMetas.append(colMeta)
+        numRows, pos = _read_varint(buf, pos)
+        blockRows, pos = _read_varint(buf, pos)
+        start, end, step = slice(start, end).indices(numRows)
+        end = max(start, end)
+        names = None if names is None else set(names)
+
+        cols = []
+        columns = []
+        for name, colMeta in zip(colNames, colMetas):
+            n, pos = _read_varint(buf, pos)
+            if names is None or name in names:
+                cols.append(HCol(len(cols), name, colMeta))
+                column = None
+                if columnar:
+                    column = self._readTypedColumn(name, colMeta, buf, pos, numRows, blockRows, start, end)
+                if column is None:
+                    column = self._readColumn(buf, pos, numRows, blockRows, start, end)
+                columns.append(column)
+            pos += n
+        if columnar:
+            return HColumnGrid(meta, cols, columns, end - start)
+        if columns:
+            rows = zip(*columns)
+        else:
+            rows = [[] for i in xrange(end - start)]
+        return HGrid(meta, cols, rows)
+
+    def _readColumn(self, buf, pos, numRows, blockRows, start, end):
+        """Decode cells of rows start to end of a column, blocks
+        outside of the range are skipped."""
+        vals = []
+        first = start - start % blockRows
+        for blockStart in xrange(0, end, blockRows):
+            n, pos = _read_varint(buf, pos)
+            if blockStart >= first:
+                count = min(blockRows, numRows - blockStart)
+                vals.extend(self._readBlock(buf, pos, count))
+            pos += n
+        return vals[start - first:end - first]
+
+    def _readTypedColumn(self, name, meta, buf, pos, numRows, blockRows, start, end):
+        """Decode rows start to end of a column whose blocks are of one
+        kind of HColumn into its typed arrays, without making cells.
+
+        Returns:
+            HColumn or None for columns of other kinds, or of numbers of
+            several units or timestamps of several timezones
+        """
+        blocks = []
+        first = start - start % blockRows
+        for blockStart in xrange(0, end, blockRows):
+            n, pos = _read_varint(buf, pos)
+            if blockStart >= first:
+                blocks.append((pos, min(blockRows, numRows - blockStart)))
+            pos += n
+        kinds = set([ord(buf[blockPos]) for blockPos, count in blocks])
+        kinds.discard(K_NULL)
+        if len(kinds) != 1:
+            return None
+        kind = kinds.pop()
+        decoder = TYPED_DECODERS.get(kind)
+        if decoder is None:
+            return None
+        columnKind, null, decode = decoder
+        values = []
+        offsets = []
+        mask = []
+        keys = set()
+        for blockPos, count in blocks:
+            if buf[blockPos] == chr(K_NULL):
+                values.extend([null] * count)
+                offsets.extend([0] * count)
+                mask.append('\x01' * count)
+                continue
+            if buf[blockPos + 1] == '\x00':
+                flags = None
+                typed = decode(self, buf, blockPos + 2, count)
+                mask.append('\x00' * count)
+            else:
+                flags = buf[blockPos + 2:blockPos + 2 + count]
+                typed = decode(self, buf, blockPos + 2 + count, flags.count('\x01'))
+                mask.append(flags.translate(NULL_FLAGS))
+            if typed is None:
+                return None
+            vals, offs, key = typed
+            keys.add(key)
+            if len(keys) > 1:
+                return None
+            if flags is not None:
+                it = iter(vals)
+                vals = [next(it) if f == '\x01' else null for f in flags]
+                if offs is not None:
+                    it = iter(offs)
+                    offs = [next(it) if f == '\x01' else 0 for f in flags]
+            values.extend(vals)
+            if offs is not None:
+                offsets.extend(offs)
+        key = keys.pop()
+        first = start - first
+        end = first + end - start
+        column = HColumn(name, columnKind, None, array.array('b', ''.join(mask)[first:end]), meta)
+        if columnKind == "number":
+            column.values = array.array('d', values[first:end])
+            column.unit = self._strings[key - 1] if key else None
+        elif columnKind == "datetime":
+            column.values = array.array(TS_TYPECODE, values[first:end])
+            column.tz_offset = array.array('i', offsets[first:end])
+            column.tz = self._strings[key]
+        elif columnKind == "bool":
+            column.values = array.array('b', values[first:end])
+        else:
+            column.values = values[first:end]
+        return column
+
+    def _readBlock(self, buf, pos, count):
+        kind = ord(buf[pos])
+        pos += 1
+        if kind == K_NULL:
+            return [None] * count
+        if kind == K_MIXED:
+            return self._readMixed(buf, pos, count)
+        decoder = BLOCK_DECODERS.get(kind)
+        if decoder is None:
+            raise ValueError("Invalid block kind: %d" % kind)
+        if buf[pos] == '\x00':
+            return decoder(self, buf, pos + 1, count)
+        flags = buf[pos + 1:pos + 1 + count]
+        present = decoder(self, buf, pos + 1 + count, flags.count('\x01'))
+        it = iter(present)
+        return [next(it) if f == '\x01' else None for f in flags]
+
+    def _readMixed(self, buf, pos, count):
+        tags = buf[pos:pos + count]
+        pos += count
+        cells = {'\x00': iter(())}
+        for tag in sorted(set(tags) - set('\x00')):
+            n, pos = _read_varint(buf, pos)
+            decoder = BLOCK_DECODERS.get(ord(tag))
+            if decoder is None:
+                raise ValueError("Invalid block kind: %d" % ord(tag))
+            cells[tag] = iter(decoder(self, buf, pos, tags.count(tag)))
+            pos += n
+        return [next(cells[tag], None) for tag in tags]
+
+    def _readDict(self, buf, pos):
+        count, pos = _read_varint(buf, pos)
+        if not count:
+            return HDict.EMPTY, pos
+        strings = self._strings
+        tags = {}
+        readScalar = self._readScalar
+        for i in xrange(count):
+            name, pos = _read_varint(buf, pos)
+            tags[strings[name]], pos = readScalar(buf, pos)
+        return HDict(tags), pos
+
+    def _readScalar(self, buf, pos):
+        kind = ord(buf[pos])
+        pos += 1
+        if kind == K_NULL:
+            return None, pos
+        if kind == K_MARKER:
+            return HMarker.VAL, pos
+        if kind == K_BOOL:
+            return (HBool.TRUE if buf[pos] == '\x01' else HBool.FALSE), pos + 1
+        if kind == K_STR or kind == K_URI:
+            n, pos = _read_varint(buf, pos)
+            s = buf[pos:pos + n]
+            return (HStr(s) if kind == K_STR else HUri(s)), pos + n
+        strings = self._strings
+        if kind == K_NUM:
+            val = _DOUBLE.unpack_from(buf, pos)[0]
+            unit, pos = _read_varint(buf, pos + 8)
+            return HNum(val, strings[unit - 1] if unit else None), pos
+        if kind == K_REF:
+            i, pos = _read_varint(buf, pos)
+            dis, pos = _read_varint(buf, pos)
+            return self._ref(i, dis), pos
+        if kind == K_DATE:
+            ordinal, pos = _read_varint(buf, pos)
+            return self._date(ordinal - EPOCH_ORDINAL), pos
+        if kind == K_TIME:
+            ms, pos = _read_varint(buf, pos)
+            return self._time(ms), pos
+        if kind == K_DATETIME:
+            millis = _LONG.unpack_from(buf, pos)[0]
+            offset = _INT.unpack_from(buf, pos + 8)[0]
+            tz, pos = _read_varint(buf, pos + 12)
+            day, ms = divmod(millis, DAY_MILLIS)
+            return HDateTime(self._date(day), self._time(ms),
+                             HTimeZone.make(strings[tz]), offset), pos
+        raise ValueError("Invalid value kind: %d" % kind)
+
+    def _ref(self, i, dis):
+        """Return HRef of string table indexes of id and dis + 1."""
+        key = (i, dis)
+        ref = self._refs.get(key)
+        if ref is None:
+            val = self._strings[i]
+            dis = self._strings[dis - 1] if dis else None
+            # shared instances of recently used refs, without making
+            # them recently used: a payload of refs would evict them all
+            ref = HRef.CACHE.get(val if dis is None else (val, dis))
+            if ref is None:
+                ref = HRef(val, dis)
+            self._refs[key] = ref
+        return ref
+
+    def _date(self, day):
+        """Return HDate of day since 1970-01-01."""
+        date = self._dates.get(day)
+        if date is None:
+            d = datetime.date.fromordinal(day + EPOCH_ORDINAL)
+            date = self._dates[day] = HDate(d.year, d.month, d.day)
+        return date
+
+    def _time(self, ms):
+        """Return HTime of millisecond of day."""
+        time = self._times.get(ms)
+        if time is None:
+            s, milli = divmod(ms, 1000)
+            m, sec = divmod(s, 60)
+            time = self._times[ms] = HTime(m / 60, m % 60, sec, milli)
+        return time
+
+    def _blockMarkers(self, buf, pos, n):
+        return [HMarker.VAL] * n
+
+    def _blockBools(self, buf, pos, n):
+        t = HBool.TRUE
+        f = HBool.FALSE
+        return [t if c == '\x01' else f for c in buf[pos:pos + n]]
+
+    def _blockStrs(self, buf, pos, n, cls=HStr):
+        if buf[pos] == '\x00':
+            return self._readStrs(buf, pos + 1, n, cls)[0]
+        count, pos = _read_varint(buf, pos + 1)
+        distinct, pos = self._readStrs(buf, pos, count, cls)
+        indexes, pos = _unpack_ints(buf, pos, n)
+        return [distinct[i] for i in indexes]
+
+    def _readStrs(self, buf, pos, n, cls):
+        lengths, pos = _unpack_ints(buf, pos, n)
+        vals = []
+        append = vals.append
+        for length in lengths:
+            end = pos + length
+            append(cls(buf[pos:end]))
+            pos = end
+        return vals, pos
+
+    def _blockUris(self, buf, pos, n):
+        return self._blockStrs(buf, pos, n, HUri)
+
+    def _blockNums(self, buf, pos, n):
+        nums = struct.unpack_from('<%dd' % n, buf, pos)
+        pos += 8 * n
+        if buf[pos] == 'c':
+            unit = _LONG.unpack_from(buf, pos + 1)[0]
+            if not unit:
+                return map(HNum, nums)
+            unit = self._strings[unit - 1]
+            return [HNum(v, unit) for v in nums]
+        strings = self._strings
+        units, pos = _unpack_ints(buf, pos, n)
+        return [HNum(v, strings[u - 1] if u else None) for v, u in zip(nums, units)]
+
+    def _blockRefs(self, buf, pos, n):
+        ids, pos = _unpack_ints(buf, pos, n)
+        dis, pos = _unpack_ints(buf, pos, n)
+        refs = self._refs
+        ref = self._ref
+        return [refs.get(key) or ref(*key) for key in zip(ids, dis)]
+
+    def _blockDates(self, buf, pos, n):
+        days, pos = _unpack_ints(buf, pos, n)
+        date = self._date
+        return [date(d) for d in days]
+
+    def _blockTimes(self, buf, pos, n):
+        millis, pos = _unpack_ints(buf, pos, n)
+        time = self._time
+        return [time(ms) for ms in millis]
+
+    def _blockDateTimes(self, buf, pos, n):
+        stamp = _LONG.unpack_from(buf, pos)[0]
+        pos += 8
+        deltas = ()
+        if n > 1:
+            deltas, pos = _unpack_ints(buf, pos, n - 1)
+        offsets, pos = _unpack_ints(buf, pos, n)
+        zones, pos = _unpack_ints(buf, pos, n)
+        strings = self._strings
+        tzs = dict([(i, HTimeZone.make(strings[i])) for i in set(zones)])
+        dates = self._dates
+        times = self._times
+        date = self._date
+        time = self._time
+        vals = []
+        append = vals.append
+        i = 0
+        for delta in (0,) + tuple(deltas):
+            stamp += delta
+            day, ms = divmod(stamp, DAY_MILLIS)
+            d = dates.get(day) or date(day)
+            t = times.get(ms) or time(ms)
+            append(HDateTime(d, t, tzs[zones[i]], offsets[i]))
+            i += 1
+        return vals
+
+    def _typedNums(self, buf, pos, n):
+        nums = struct.unpack_from('<%dd' % n, buf, pos)
+        pos += 8 * n
+        if buf[pos] == 'c':
+            return nums, None, _LONG.unpack_from(buf, pos + 1)[0]
+        units = set(_unpack_ints(buf, pos, n)[0])
+        if len(units) > 1:
+            return None
+        return nums, None, units.pop()
+
+    def _typedBools(self, buf, pos, n):
+        return array.array('b', buf[pos:pos + n]), None, 0
+
+    def _typedStrs(self, buf, pos, n):
+        return self._blockStrs(buf, pos, n, str), None, 0
+
+    def _typedDateTimes(self, buf, pos, n):
+        stamp = _LONG.unpack_from(buf, pos)[0]
+        pos += 8
+        deltas = ()
+        if n > 1:
+            deltas, pos = _unpack_ints(buf, pos, n - 1)
+        offsets, pos = _unpack_ints(buf, pos, n)
+        zones = set(_unpack_ints(buf, pos, n)[0])
+        if len(zones) > 1:
+            return None
+        # local times to epoch milliseconds
+        stamps = [stamp - offsets[0] * 1000]
+        append = stamps.append
+        for delta, offset in zip(deltas, offsets[1:]):
+            stamp += delta
+            append(stamp - offset * 1000)
+        return stamps, offsets, zones.pop()
+
+# decoders of the non-null cells of a block by block kind
+BLOCK_DECODERS = {
+    K_MARKER: BinaryReader._blockMarkers.im_func,
+    K_BOOL: BinaryReader._blockBools.im_func,
+    K_STR: BinaryReader._blockStrs.im_func,
+    K_NUM: BinaryReader._blockNums.im_func,
+    K_REF: BinaryReader._blockRefs.im_func,
+    K_URI: BinaryReader._blockUris.im_func,
+    K_DATE: BinaryReader._blockDates.im_func,
+    K_TIME: BinaryReader._blockTimes.im_func,
+    K_DATETIME: BinaryReader._blockDateTimes.im_func,
+}
+
+# HColumn kind, value of null cells and decoder of the typed values of
+# the non-null cells of a block by block kind, the decoders return
+# (values, timezone offsets, string table key of unit or timezone) or
+# None for cells which do not fit a HColumn
+TYPED_DECODERS = {
+    K_BOOL: ("bool", 0, BinaryReader._typedBools.im_func),
+    K_STR: ("str", None, BinaryReader._typedStrs.im_func),
+    K_NUM: ("number", float('nan'), BinaryReader._typedNums.im_func),
+    K_DATETIME: ("datetime", 0, BinaryReader._typedDateTimes.im_func),
+}
+
+# block flags (1 for non-null cells) to HColumn mask (1 for null cells)
+NULL_FLAGS = string.maketrans('\x00\x01', '\x01\x00')
@@ -11,8 +11,9 @@ import json
 from hs.val import HStr
 from session import HSession
 from core import Storage
-from io import ZincReader, ZincWriter
+from io import ZincReader, ZincWriter, ZincStreamReader, JsonReader
 from grid import HGridBuilder
+from jsonbackend import get_backend
 class HClient(object):
     """ Haystack client.
     
@@ -32,9 +33,18 @@ class HClient(object):
 
         
     """
-    def __init__(self, url, username = None, password = None):
+    def __init__(self, url, username = None, password = None, json_backend = None):
+        """ctor
+        Args:
+            url: haystack api url
+            username: user name
+            password: password
+            json_backend: JSON library used to parse json responses, name or
+                JsonBackend (see hs.jsonbackend), by default the fastest installed
+        """
         self.session = HSession(url, username, password)
         self.url = url
+        self.json_backend = get_backend(json_backend)
 
     @property
     def contentType(self):
@@ -46,7 +56,7 @@ class HClient(object):
 
     def _parseResponse(self, res):
         if self.contentType == "json":
-            ret = Storage(json.loads(res))
+            ret = JsonReader(res, backend=self.json_backend).readGrid()
         elif self.contentType == "csv":
             #ret = res.decode("utf-8")
             ret = res
@@ -106,6 +116,26 @@ class HClient(object):
         res = self.session.get('%s/hisRead?id=%s&range="%s"' % (self.url, nid, hrange))
         return self._parseResponse(res)
 
+    def hisReadStream(self, nid, hrange):
+        """Read history for a given point incrementally.
+
+        The response body is parsed while it is downloaded, rows are
+        returned one at a time by the returned reader. Requires zinc
+        content type.
+
+        Args:
+            nid: node id
+            hrange: history range in haystack format
+
+        Returns:
+            ZincStreamReader; use readHeader() and iterRows() to process the grid
+        """
+        if self.contentType != "zinc":
+            raise ValueError("Streaming is only supported for zinc, not %s" % self.contentType)
+        hrange = hrange.replace(' ', '%20')
+        chunks = self.session.get('%s/hisRead?id=%s&range="%s"' % (self.url, nid, hrange), stream=True)
+        return ZincStreamReader(chunks)
+
     def eval(self, expr):
         """Eval .
 
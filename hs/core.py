@@ -29,8 +29,9 @@ class Storage(dict):
     __getitem__ = dict.get
     __getattr__ = dict.get
     __repr__ = lambda self: '<Storage %s>' % dict.__repr__(self)
-    # http://stackoverflow.com/questions/5247250/why-does-pickle-getstate-accept-as-a-return-value-the-very-instance-it-requi
-    __getstate__ = lambda self: None
+    # pickled as a dict, the default pickling of classes with __slots__
+    # would need __getstate__, which __getattr__ hides
+    __reduce__ = lambda self: (Storage, (dict(self),))
     __copy__ = lambda self: Storage(self)
     
     def as_dict(self):
@@ -41,6 +42,63 @@ class Storage(dict):
         return ret
 
 
+class LRUCache(object):
+    """
+    Bounded cache which evicts the least recently used entries.
+
+    A hit costs a dict lookup and an update of the entry's use counter.
+    When the cache grows beyond its capacity, the least recently used
+    entries are evicted in one pass, down to three quarters of the capacity.
+
+        >>> c = LRUCache(4)
+        >>> for k in 'abcd': c.set(k, k.upper())
+        >>> print c.get('a')
+        A
+        >>> c.set('e', 'E')
+        >>> sorted(c.keys())
+        ['a', 'd', 'e']
+        >>> print c.get('b')
+        None
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._entries = {}
+        self._tick = 0
+
+    def get(self, key, default=None):
+        """Return cached value for key and mark it as recently used."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        self._tick += 1
+        entry[1] = self._tick
+        return entry[0]
+
+    def set(self, key, value):
+        """Add or replace value for key."""
+        self._tick += 1
+        self._entries[key] = [value, self._tick]
+        if len(self._entries) > self.capacity:
+            self._evict()
+
+    def keys(self):
+        return self._entries.keys()
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _evict(self):
+        keep = self.capacity - max(1, self.capacity / 4)
+        entries = sorted(self._entries.iteritems(), key=lambda item: item[1][1], reverse=True)
+        self._entries = dict(entries[:keep])
+
+
 def parseHisItemNumberValues(hisItems, unit):
     """
     Parse history item numerical values.
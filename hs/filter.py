@@ -1,16 +1,23 @@
+# coding: utf8
 """
 Implementation of HFilter related classes.
 
 """
 import StringIO
-from io import ZincReader as zr
-from val import HRef
+from val import HRef, HBool, HStr, HNum, HUri, HDate, HTime, HDateTime, HTimeZone, is_id_char
 
-class ZincReader(zr):
+class ZincReader(object):
+    """Char at a time reader of filter expressions."""
+
+    def __init__(self, s):
+        self.stream = StringIO.StringIO(s)
+        self.lineNum = 1
+        self.cur = chr(0)
+        self.peek = chr(0)
+        self._consume()
+        self._consume()
 
     def readFilter(self):
-        self._init_grid_read()
-        self.is_filter = True
         self._skipSpace()
         q = self.readFilterOr()
         self._skipSpace()
@@ -92,6 +99,328 @@ class ZincReader(zr):
 
         return HFilter.has(path);
 
+    def _readId(self):
+        if not isIdStart(self.cur):
+            self._err("Invalid name start char")
+        s = StringIO.StringIO()
+        while isId(self.cur):
+            s.write(self.cur)
+            self._consume()
+        ret = s.getvalue()
+        s.close()
+        return ret
+
+
+
+    ############################################################
+    ############################ HVals #########################
+    ############################################################
+
+    def _readVal(self):
+        """ Read a single scalar value from the stream."""
+        if isDigit(self.cur):
+            return self._readNumVal()
+        if isAlpha(self.cur):
+            return self._readWordVal()
+        if self.cur == '@':
+            return self._readRefVal()
+        elif self.cur == '"':
+            return self._readStrVal()
+        elif self.cur == '`':
+            return self._readUriVal()
+        elif self.cur == '-':
+            if self.peek == 'I':
+                return self._readWordVal()
+            else:
+                return self._readNumVal()
+        else:
+            self._err("Unexpected char for start of value")
+
+    def _readRefVal(self):
+        self._consume()
+        s = StringIO.StringIO()
+        while is_id_char(self.cur):
+            if self.cur == "":
+                self._err("Unexpected end of ref literal")
+            if self.cur == "\n" or self.cur == "\r":
+                self._err("Unexpected newline of ref literal")
+            s.write(self.cur)
+            self._consume()
+        self._skipSpace()
+        dis = None
+        if self.cur == '"':
+            dis = self._readStrLiteral()
+        return HRef.make(s.getvalue(), dis)
+
+
+    def _readUriVal(self):
+        s = StringIO.StringIO()
+        # read string between backticks `...`
+        self._consume()
+        while self.cur != '`':
+            s.write(self.cur)
+            self._consume()
+        self._consume()
+        return HUri.make(s.getvalue())
+
+
+
+    def _readWordVal(self):
+        s = StringIO.StringIO()
+        while True:
+            s.write(self.cur)
+            self._consume()
+            try:
+                if not isAlpha(self.cur) and not isSpecialUnit(self.cur):
+                    break
+            except Exception, e:
+                self._err(e)
+
+
+        word = s.getvalue()
+
+        if word == "true":
+            return HBool.TRUE
+        if word == "false":
+            return HBool.FALSE
+        if word == "NaN":
+            return HNum.NaN
+        elif word == "INF":
+            return HNum.POS_INF
+        elif word == "-INF":
+            return HNum.NEG_INF
+        self._err("Unknown value identifier: %s" % word)
+
+
+    def _readStrLiteral(self):
+        self._consume()
+        s = StringIO.StringIO()
+        while self.cur != '"':
+            if self.cur < 0:
+                self._err("Unexpected end of str literal")
+            if self.cur == '\n' or self.cur == '\r':
+                self._err("Unexpected newline in str literal")
+            if self.cur == '\\':
+                s.write(self._readEscChar())
+            else:
+                s.write(self.cur)
+                self._consume()
+        self._consume()
+        return s.getvalue()
+
+    def _readStrVal(self):
+        return HStr.make(self._readStrLiteral())
+
+    def _readNumVal(self):
+        # parse numeric part
+        s = StringIO.StringIO()
+        s.write(self.cur)
+        self._consume()
+        while isDigit(self.cur) or self.cur in [".", "_"]:
+            if self.cur != '_':
+                s.write(self.cur)
+            self._consume()
+            if self.cur in ['e', 'E']:
+                if self.peek in ['-', '+'] or isDigit(self.peek):
+                    s.write(self.cur)
+                    self._consume()
+                    s.write(self.cur)
+                    self._consume()
+        val = float(s.getvalue())
+
+        #  HDate - check for dash
+        date = None
+        time = None
+        hour = -1
+        if self.cur == "-":
+            try:
+                year = int(s.getvalue())
+            except Exception, ex:
+                self._err("Invalid year for date value: %s" % s)
+            self._consume()
+            month = self._readTwoDigits("Invalid digit for month in date value: %s" % s)
+            if self.cur != '-':
+                self._err("Expected '-' for date value: %s" % s)
+            self._consume()
+            day = self._readTwoDigits("Invalid digit for day in date value: %s" % s)
+            date = HDate.make(year, month, day)
+
+            if self.cur != 'T':
+                return date
+            self._consume()
+            hour = self._readTwoDigits("Invalid digit for hour in date time value")
+
+        # HTime - check for colon
+        if self.cur == ':':
+            if hour < 0:
+                if s.len != 2:
+                    self._err("Hour must be two digits for time value: %s" % s)
+                try:
+                    hour = int(s.getvalue())
+                except Exception, err:
+                    self._err("Invalid hour for time value: %s" % s)
+            self._consume()
+            min = self._readTwoDigits("Invalid digit for minute in time value")
+            if self.cur != ':':
+                self._err("Expected ':' for time value")
+            self._consume()
+            sec =     self._readTwoDigits("Invalid digit for seconds in time value")
+            ms = 0
+            if self.cur == '.':
+                self._consume()
+                places = 0
+                while isDigit(self.cur):
+                    ms = (ms*10) + (ord(self.cur) - ord('0'))
+                    self._consume()
+                    places += 1
+                if places == 1:
+                    ms *= 100
+                elif places == 2:
+                    ms *= 10
+                elif places == 3:
+                    pass
+                else:
+                    self._err("Too many digits for milliseconds in time value")
+
+            time = HTime.make(hour, min, sec, ms)
+            if date == None:
+                return time
+
+        zutc = False
+        if date != None:
+            tz_offset = 0
+            if self.cur == 'Z':
+                self._consume()
+                zutc = True
+            else:
+                neg = self.cur == '-'
+                if self.cur != '-' and self.cur != '+':
+                    self._err("Expected -/+ for timezone offset")
+                self._consume()
+                tz_hours = self._readTwoDigits("Invalid digit for timezone offset")
+                if self.cur != ':':
+                    self._err("Expected colon for timezone offset")
+                self._consume()
+                tz_mins = self._readTwoDigits("Invalid digit for timezone offset")
+                tz_offset = tz_hours * 3600 + tz_mins * 60
+                if neg:
+                    tz_offset = -tz_offset
+
+            # timezone name
+            if self.cur != ' ':
+                if not zutc:
+                    self._err("Expected space between timezone offset and name")
+                else:
+                    tz = HTimeZone.UTC
+            elif zutc and not (self.peek >= 'A' and self.peek <= 'Z' ):
+                tz = HTimeZone.UTC
+            else:
+                self._consume()
+                if not isTz(self.cur):
+                    self._err("Expected timezone name")
+                s = StringIO.StringIO()
+                while isTz(self.cur):
+                    s.write(self.cur)
+                    self._consume()
+                tz = HTimeZone.make(s.getvalue())
+            return HDateTime.make(date, time, tz, tz_offset)
+
+        # this was not validated as time or date, it is then HNum
+        # if we have unit, parse that
+        unit = None
+        if isUnit(self.cur):
+            s = StringIO.StringIO()
+            while isUnit(self.cur):
+                s.write(self.cur)
+                self._consume()
+            unit = s.getvalue()
+        return HNum.make(val, unit);
+
+    def _readTwoDigits(self, errMsg):
+        if not isDigit(self.cur):
+            self._err(errMsg)
+        tens = (ord(self.cur) - ord('0')) * 10
+        self._consume()
+        if not isDigit(self.cur):
+            self._err(errMsg)
+        val = tens + (ord(self.cur) - ord('0'))
+        self._consume()
+        return val
+
+    def _readEscChar(self):
+        self._consume()
+        if self.cur == 'b':
+            self._consume()
+            return '\b'
+        elif self.cur == 'f':
+            self._consume()
+            return '\f'
+        elif self.cur == 'n':
+            self._consume()
+            return '\n'
+        elif self.cur == 'r':
+            self._consume()
+            return '\r'
+        elif self.cur == 't':
+            self._consume()
+            return '\t'
+        elif self.cur == '"':
+            self._consume()
+            return '"'
+        elif self.cur == '$':
+            self._consume()
+            return '$'
+        elif self.cur == '\\':
+            self._consume()
+            return '\\'
+
+        if self.cur == 'u':
+            self._consume()
+            n3 = self._toNibble(self.cur)
+            self._consume()
+            n2 = self._toNibble(self.cur)
+            self._consume()
+            n1 = self._toNibble(self.cur)
+            self._consume()
+            n0 = self._toNibble(self.cur)
+            self._consume()
+            return n3 << 12 | n2 << 8 | n1 << 4 | n0
+        self._err("Invalid hex char")
+
+    def _consume(self):
+        try:
+            self.cur = self.peek
+            self.peek = self.stream.read(1)
+            if self.cur == '\n':
+                self.lineNum += 1
+        except Exception, e:
+            self._err(e)
+
+
+    def _consumeCmp(self):
+        self._consume()
+        if self.cur == '=':
+            self._consume()
+        self._skipSpace()
+
+    def _skipSpace(self):
+        while self.cur == ' ' or self.cur == '\t':
+            self._consume()
+
+
+    def _err(self, msg):
+        s = "%s [Line %d]" % (msg, self.lineNum)
+        s += "; follows: %s" % self.stream.getvalue()[self.stream.tell():]
+        raise ValueError(s)
+
+    def _toNibble(self, c):
+        cc = ord(c)
+        if c >= ord('0') and c <= ord('9'): return cc - ord('0')
+        if c >= ord('a') and c <= ord('f'): return cc - ord('a') + 10
+        if c >= ord('A') and c <= ord('Z'): return cc - ord('A') + 10
+        self._err("Invalid hex char")
+
+
 ############################################################
 ######################### Initialization ###################
 ############################################################
@@ -476,3 +805,89 @@ class Or(CompoundFilter):
         return "or"
     def include(self, d, pather):
         return self.a.include(d, pather) or self.b.include(d, pather)
+
+
+############################################################
+######################### Char Types #######################
+############################################################
+
+def isDigit(c):
+    if c == "":
+        return False
+    cc = ord(c)
+    return cc > 0 and cc < 128 and (CHAR_TYPES[cc] & DIGIT) != 0
+
+def isAlpha(c):
+    if c == "":
+        return False
+    cc = ord(c)
+    return cc > 0 and cc < 128 and (CHAR_TYPES[cc] & ALPHA) != 0
+
+def isUnit(c):
+    if c == "":
+        return False
+    cc = ord(c)
+    return cc > 0 and cc < 128 and (CHAR_TYPES[cc] & UNIT) != 0
+
+def isTz(c):
+    if c == "":
+        return False
+    cc = ord(c)
+    return cc > 0 and cc < 128 and (CHAR_TYPES[cc] & TZ) != 0
+
+def isIdStart(c):
+    if c == "":
+        return False
+    cc = ord(c)
+    return cc > 0 and cc < 128 and (CHAR_TYPES[cc] & ID_START) != 0
+
+def isId(c):
+    if c == "":
+        return False
+    cc = ord(c)
+    return cc > 0 and cc < 128 and (CHAR_TYPES[cc] & ID) != 0
+
+def isSpecialUnit(c):
+    if c == "":
+        return False
+    #ret = c in SPECIAL_UNIT_CHARS
+
+    try:
+        ret = c in SPECIAL_UNIT_CHARS
+    except:
+        #source = unicode(c, 'utf-8')
+        # ascii decode fail, first encode in utf-8
+        source = c.encode("utf-8")
+        ret = source in SPECIAL_UNIT_CHARS
+    return ret
+
+CHAR_TYPES = [0] * 128
+DIGIT    = 0x01
+ALPHA_LO = 0x02
+ALPHA_UP = 0x04
+ALPHA    = ALPHA_UP | ALPHA_LO
+UNIT     = 0x08
+TZ       = 0x10
+ID_START = 0x20
+ID       = 0x40
+SPECIAL_UNIT_CHARS = "²"
+
+def _init_chartypes():
+    for i in range(ord('a'), ord('z')+1):
+        CHAR_TYPES[i] = ALPHA_LO | UNIT | TZ | ID_START | ID
+    for i in range(ord('A'), ord('Z')+1):
+        CHAR_TYPES[i] = ALPHA_UP | UNIT | TZ | ID
+    for i in range(ord('0'), ord('9')+1):
+        CHAR_TYPES[i] = DIGIT | TZ | ID
+
+    CHAR_TYPES[ord('%')] = UNIT
+    CHAR_TYPES[ord('_')] = UNIT | TZ | ID
+    CHAR_TYPES[ord('/')] = UNIT
+    CHAR_TYPES[ord('$')] = UNIT
+    #CHAR_TYPES[ord('²')] = UNIT
+    CHAR_TYPES[ord('-')] = TZ
+    CHAR_TYPES[ord('+')] = TZ
+
+
+
+_init_chartypes()
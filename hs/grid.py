@@ -5,26 +5,18 @@ This includes the implemetatio of row, col, dict, grid and related classes and f
 
 
 """
+import array
+import collections
 import copy
+import datetime
+import gc
+import re
 import sys
 import traceback
+from core import LRUCache
 from val import *
 
-# tag characters validation table
-TAG_CHARS = [False] * 128
-
-def init_tag_chars():
-    """Initialize static validation table"""
-    for i in range(ord('a'), ord('z')+1):
-        TAG_CHARS[i] = True
-    for i in range(ord('A'), ord('Z')+1):
-        TAG_CHARS[i] = True
-    for i in range(ord('0'), ord('9')+1):
-        TAG_CHARS[i] = True
-    TAG_CHARS[ord('_')] = True
-
-
-init_tag_chars()
+TAG_NAME_RE = re.compile(r'[a-z][a-zA-Z0-9_]*\Z')
 
 def istagname(n):
     """
@@ -32,13 +24,23 @@ def istagname(n):
      first char must be ASCII lower case letter.  Rest of
      chars must be ASCII letter, digit, or underbar.
     """
-    if not len(n): return False
-    first = ord(n[0])
-    if first < ord('a') or first > ord('z'): return False
-    for c in n:
-        if ord(c) >= 128 or not TAG_CHARS[ord(c)]:
-            return False
-    return True
+    return TAG_NAME_RE.match(n) is not None
+
+TAG_WORD_RE = re.compile(r'[a-zA-Z0-9_]+')
+
+def to_tag_name(n):
+    """
+     Returns a legal tag name for an arbitrary string, e.g. a column
+     label: words are joined in camel case, "Zone Temp" -> "zoneTemp".
+     Names not starting with a letter are prefixed with "v".
+    """
+    words = TAG_WORD_RE.findall(n)
+    if not words:
+        return "v"
+    name = words[0][0].lower() + words[0][1:] + "".join(w[0].upper() + w[1:] for w in words[1:])
+    if not ('a' <= name[0] <= 'z'):
+        name = "v" + name
+    return name
 
 
 
@@ -68,6 +70,9 @@ class HCol(object):
     def __eq__(self, other):
         return isinstance(other, HCol) and self.name == other.name and self._meta == other._meta
 
+    def __reduce__(self):
+        return (HCol, (self.index, self.name, self._meta))
+
 
 class HDictBuilder(dict):
     """HDictBuilder is used to construct an immutable HDict instance.
@@ -187,6 +192,12 @@ class HDict(dict):
     def __hash__(self):
         return hash(tuple(sorted(self.items())))
 
+    def __reduce__(self):
+        # the default dict pickling would add the items by __setitem__
+        if not len(self):
+            return (getattr, (HDict, "EMPTY"))
+        return (HDict, (dict(self),))
+
     @property
     def dis(self):
         v = self.get("dis")
@@ -236,28 +247,36 @@ class HDict(dict):
         return s.getvalue()
 
 
-class HRow(HDict):
-    """HRow is a row in a HGrid.  It  also implements the HDict "interface".
+class HRow(object):
+    """HRow is a row in a HGrid.  It  also implements the read interface
+    of HDict: get, has, missing, dis, [], in, has_key, keys, values,
+    items and their iterators. Rows are not dict instances, use to_dict
+    where a HDict is needed.
         @see <a href='http://project-haystack.org/doc/Grids'>Project Haystack</a>
+
+    A row holds the tuple of its cells and the map of column names to
+    cell indexes, which is shared by all rows of the grid; rows do not
+    reference the grid.
     """
-    def __init__(self, grid, cells):
-        self.grid = grid
-        self.cells = cells
-        # populate name, value pairs into the internal dict so that
-        #  HDict "interface" works properly
-        for i, col in enumerate(grid.cols):
-            self[col.name] = cells[i]
+    __slots__ = ("cells", "_index")
 
-    def __setitem__(self, key, value):
-        """Override setitme to avoid HDict exception when
-        invoking ctor:
-        raise Exception("Can't modify the immutable HDict instance")
+    def __init__(self, index, cells):
+        """ctor
+        Args:
+            index: dict of column name to cell index, see HGrid.col_index
+            cells: cells in column order
         """
-        dict.__setitem__(self, key, value)
+        self._index = index
+        self.cells = tuple(cells)
 
+    def __reduce__(self):
+        return (HRow, (self._index, self.cells))
 
     def size(self):
-        return len(self.grid.cols)
+        return len(self.cells)
+
+    def __len__(self):
+        return len(self.cells)
 
     def get(self, col):
         """Get a cell by column.
@@ -266,16 +285,78 @@ class HRow(HDict):
             Error or return  None based on checked flag.
 
         """
-        ret = None
         if isinstance(col, HCol):
-            ret = self.cells[col.index]
+            return self.cells[col.index]
+        i = self._index.get(col)
+        if i is None:
+            return None
+        return self.cells[i]
+
+    def __getitem__(self, name):
+        return self.cells[self._index[name]]
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def has(self, name):
+        return self.get(name) is not None
+
+    def has_key(self, name):
+        return name in self._index
+
+    def missing(self, name):
+        return self.get(name) is None
+
+    def is_empty(self):
+        return not len(self)
+
+    @property
+    def dis(self):
+        v = self.get("dis")
+        if isinstance(v, HStr):
+            return v.val
+        v = self.get("id")
+        if v != None:
+            return v.dis
         else:
-            name = col
-            col = self.grid.col(name)
-            if col:
-                ret = self.cells[col.index]
-        return ret
+            return "????"
+
+    def keys(self):
+        """Return column names, in column order."""
+        index = self._index
+        return sorted(index, key=index.__getitem__)
 
+    def values(self):
+        """Return cells of all columns, in column order."""
+        return list(self.cells)
+
+    def items(self):
+        """Return (name, cell) pairs of all columns, in column order."""
+        return zip(self.keys(), self.cells)
+
+    def iterkeys(self):
+        return iter(self.keys())
+
+    def itervalues(self):
+        return iter(self.cells)
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def to_dict(self):
+        """Return HDict of the non-null cells."""
+        return HDict([(name, val) for name, val in self.items() if val is not None])
+
+    def __eq__(self, other):
+        if isinstance(other, HRow):
+            return self.cells == other.cells and self._index == other._index
+        return isinstance(other, dict) and dict(self.items()) == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.cells)
 
     def __iter__(self):
         """
@@ -315,7 +396,7 @@ class HRowIterator(object):
 
 
 
-class HGrid():
+class HGrid(object):
     """HGrid is an immutable two dimension data structure of cols and rows.
         Use HGridBuilder to construct a HGrid instance.
         @see {@link http://project-haystack.org/doc/Grids|Project Haystack}
@@ -325,12 +406,17 @@ class HGrid():
     def __init__(self, meta, cols, rows):
         self.meta = meta
         self.cols = cols
-        
+        # column name -> cell index, shared by the rows
+        self.col_index = dict([(col.name, i) for i, col in enumerate(cols)])
+
+        index = self.col_index
+        numCols = len(cols)
         self.rows = []
+        append = self.rows.append
         for cells in rows:
-            if len(cells) != len(cols):
+            if len(cells) != numCols:
                 raise ValueError("Row cells size != cols size")
-            self.rows.append(HRow(self, cells))
+            append(HRow(index, cells))
             
         self.cols_dict = {}
         for col in cols:
@@ -362,9 +448,110 @@ class HGrid():
         else:
             raise ValueError("index of incorrect type: %s" % index)
 
+    def col_vals(self, col):
+        """Return list with the cell of a column for each row.
+
+        Args:
+            col: HCol or column name
+        """
+        col = self.cols_dict.get(col.name if isinstance(col, HCol) else col)
+        if col is None:
+            return [None] * self.num_rows()
+        index = col.index
+        return [row.cells[index] for row in self.rows]
+
+    def col_slices(self, start, end):
+        """Return list with the cells of the rows start to end of each
+        column, the writers encode grids by these column slices.
+        """
+        cells = [row.cells for row in self.rows[start:end]]
+        if not cells:
+            return [()] * len(self.cols)
+        return zip(*cells)
+
+    def to_columns(self, cols=None):
+        """Convert the cells of each column to typed arrays, see HColumn.
+
+        Args:
+            cols: names of the columns to convert, None for all columns
+        Returns:
+            OrderedDict of column name to HColumn, values and masks are
+            array.array arrays, or lists for str and object columns
+        """
+        columns = collections.OrderedDict()
+        for col in self.cols:
+            if cols is None or col.name in cols:
+                columns[col.name] = HColumn.from_cells(col, self.col_vals(col))
+        return columns
+
+    def to_numpy(self, cols=None):
+        """Convert the cells of each column to NumPy arrays, see HColumn.
+
+        Numbers are float64, timestamps datetime64[ms] in UTC, booleans
+        and masks bool arrays, other columns object arrays. Requires
+        numpy, to_columns returns array.array arrays without it.
+
+        Args:
+            cols: names of the columns to convert, None for all columns
+        Returns:
+            OrderedDict of column name to HColumn
+        """
+        import numpy
+        columns = self.to_columns(cols)
+        for column in columns.itervalues():
+            column._toNumpy(numpy)
+        return columns
+
+    @staticmethod
+    def from_columns(columns, meta=None, columnar=False):
+        """Make grid of columns as returned by to_columns or to_numpy.
+
+        Args:
+            columns: list of HColumn or mapping of names to HColumn,
+                all columns have the same number of values
+            meta: grid meta, HDict or dict of HVals
+            columnar: return HColumnGrid storing the typed columns,
+                cells are only made when they are accessed
+        Returns:
+            HGrid instance
+        """
+        if isinstance(columns, dict):
+            columns = columns.values()
+        if columnar:
+            cols = [HCol(i, column.name, _to_hdict(column.meta)) for i, column in enumerate(columns)]
+            return HColumnGrid(_to_hdict(meta), cols, columns)
+        # building the cells allocates many acyclic objects, cyclic
+        # garbage collection would only walk them over and over
+        gcEnabled = gc.isenabled()
+        gc.disable()
+        try:
+            cols = []
+            cells = []
+            for i, column in enumerate(columns):
+                cols.append(HCol(i, column.name, _to_hdict(column.meta)))
+                cells.append(column.cells())
+            if len(set(map(len, cells))) > 1:
+                raise ValueError("Columns have different numbers of values")
+            return HGrid(_to_hdict(meta), cols, zip(*cells))
+        finally:
+            if gcEnabled:
+                gc.enable()
+
     def __iter__(self):
         return HGridIterator(self.rows)
 
+    def __reduce__(self):
+        """Pickle as meta, cols and a list of cells for each column,
+        rows are not pickled with their back reference to the grid.
+        """
+        columns = zip(*[row.cells for row in self.rows]) if self.cols else []
+        return (_unpickle_grid, (self.meta, self.cols, columns))
+
+
+def _unpickle_grid(meta, cols, columns):
+    """Return HGrid for the cells of each column, see HGrid.__reduce__"""
+    return HGrid(meta, cols, zip(*columns))
+
 
 class HGridIterator(object):
 
@@ -384,6 +571,500 @@ class HGridIterator(object):
             return self.rows[self.current-1]
 
 
+class HLazyGrid(HGrid):
+    """HLazyGrid is a HGrid whose rows are decoded from the source
+    payload on first access, as returned by ZincReader.readGrid(lazy=True).
+
+    Only row boundaries are indexed when the grid is read, cells are
+    decoded when a row is requested by row(), iteration or rows[i].
+    col_vals() decodes just the cells of the requested column for rows
+    which are not decoded yet.
+
+    Decoded rows are cached, by default all of them; with cache_size
+    only the most recently used rows are kept. The grid holds a reference
+    to the source payload for its lifetime.
+    """
+    def __init__(self, meta, cols, source, cache_size=None):
+        """ctor
+        Args:
+            meta: grid meta
+            cols: list of HCol
+            source: row source with len(), readRow(index) returning the
+                cells of a row and readCell(index, colIndex)
+            cache_size: max number of decoded rows to keep, None keeps
+                all rows and 0 disables caching
+        """
+        self.meta = meta
+        self.cols = cols
+        self.cols_dict = {}
+        for col in cols:
+            self.cols_dict[col.name] = col
+        self.col_index = dict([(col.name, i) for i, col in enumerate(cols)])
+        self._source = source
+        self._numRows = len(source)
+        if cache_size is None:
+            cache_size = max(1, self._numRows)
+        self._cache = LRUCache(cache_size) if cache_size else None
+        self.rows = HLazyRows(self)
+
+    def num_rows(self):
+        return self._numRows
+
+    def row(self, index):
+        if index < 0:
+            index += self._numRows
+        if not 0 <= index < self._numRows:
+            raise IndexError("row index out of range: %s" % index)
+        cache = self._cache
+        if cache is None:
+            return HRow(self.col_index, self._source.readRow(index))
+        row = cache.get(index)
+        if row is None:
+            row = HRow(self.col_index, self._source.readRow(index))
+            cache.set(index, row)
+        return row
+
+    def __reduce__(self):
+        """Pickle as HGrid, the cells of each column are read from the
+        source, without decoding whole rows; unpickled grids are not lazy.
+        """
+        return (_unpickle_grid, (self.meta, self.cols, [self.col_vals(col) for col in self.cols]))
+
+    def col_vals(self, col):
+        if not isinstance(col, HCol):
+            col = self.cols_dict.get(col)
+            if col is None:
+                return [None] * self._numRows
+        name = col.name
+        cache = self._cache
+        readCell = self._source.readCell
+        vals = []
+        for i in xrange(self._numRows):
+            row = cache.get(i) if cache is not None else None
+            vals.append(row.get(name) if row is not None else readCell(i, col.index))
+        return vals
+
+
+class HLazyRows(object):
+    """Read only sequence of the rows of a HLazyGrid or HColumnGrid"""
+    def __init__(self, grid):
+        self.grid = grid
+
+    def __len__(self):
+        return self.grid.num_rows()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.grid.row(i) for i in xrange(*index.indices(len(self)))]
+        return self.grid.row(index)
+
+    def __iter__(self):
+        row = self.grid.row
+        for i in xrange(len(self)):
+            yield row(i)
+
+
+class HColumnGrid(HGrid):
+    """HColumnGrid is a HGrid which stores its cells column by column,
+    as returned by HGridBuilder.toGrid(columnar=True) and
+    ZincReader.readGrid(columnar=True).
+
+    Scanning a column with col_vals or to_columns does not touch the
+    cells of the other columns. Rows are views of the cells at a row
+    index, made when a row is requested by row(), iteration or rows[i].
+
+    Columns may also be stored typed, as HColumn instances, see
+    HGrid.from_columns(columnar=True): to_columns returns them without
+    conversion, their cells are made on first access.
+    """
+    def __init__(self, meta, cols, columns, num_rows=0):
+        """ctor
+        Args:
+            meta: grid meta
+            cols: list of HCol
+            columns: for each col, list or tuple of its cells, or HColumn
+            num_rows: number of rows of a grid without cols
+        """
+        if len(columns) != len(cols):
+            raise ValueError("Columns size != cols size")
+        self.meta = meta
+        self.cols = cols
+        self.cols_dict = {}
+        for col in cols:
+            self.cols_dict[col.name] = col
+        self.col_index = dict([(col.name, i) for i, col in enumerate(cols)])
+        self._columns = list(columns)
+        sizes = set(map(len, self._columns))
+        if len(sizes) > 1:
+            raise ValueError("Columns have different numbers of cells")
+        self._numRows = sizes.pop() if sizes else num_rows
+        # cells of each column, None for typed columns until accessed
+        self._cells = [None if isinstance(c, HColumn) else c for c in self._columns]
+        self.rows = HLazyRows(self)
+
+    def num_rows(self):
+        return self._numRows
+
+    def row(self, index):
+        if index < 0:
+            index += self._numRows
+        if not 0 <= index < self._numRows:
+            raise IndexError("row index out of range: %s" % index)
+        return HColumnRow(self.col_index, self._cellColumns(), index)
+
+    def col_vals(self, col):
+        col = self.cols_dict.get(col.name if isinstance(col, HCol) else col)
+        if col is None:
+            return [None] * self._numRows
+        return list(self._colCells(self.col_index[col.name]))
+
+    def col_slices(self, start, end):
+        return [cells[start:end] for cells in self._cellColumns()]
+
+    def to_columns(self, cols=None):
+        columns = collections.OrderedDict()
+        for i, col in enumerate(self.cols):
+            if cols is None or col.name in cols:
+                column = self._columns[i]
+                if isinstance(column, HColumn):
+                    column = copy.copy(column)
+                else:
+                    column = HColumn.from_cells(col, column)
+                columns[col.name] = column
+        return columns
+
+    def __reduce__(self):
+        return (HColumnGrid, (self.meta, self.cols, self._columns, self._numRows))
+
+    def _colCells(self, i):
+        cells = self._cells[i]
+        if cells is None:
+            cells = self._cells[i] = self._columns[i].cells()
+        return cells
+
+    def _cellColumns(self):
+        if None in self._cells:
+            for i in xrange(len(self._cells)):
+                self._colCells(i)
+        return self._cells
+
+
+class HColumnRow(HRow):
+    """HColumnRow is a row of a HColumnGrid, a view of the cells at a
+    row index of the columns of the grid.
+    """
+    __slots__ = ("_columns", "_row")
+
+    def __init__(self, index, columns, row):
+        """ctor
+        Args:
+            index: dict of column name to column index, see HGrid.col_index
+            columns: cells of each column
+            row: index of the row
+        """
+        self._index = index
+        self._columns = columns
+        self._row = row
+
+    @property
+    def cells(self):
+        row = self._row
+        return tuple([cells[row] for cells in self._columns])
+
+    def __reduce__(self):
+        return (HRow, (self._index, self.cells))
+
+    def size(self):
+        return len(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+    def get(self, col):
+        if isinstance(col, HCol):
+            return self._columns[col.index][self._row]
+        i = self._index.get(col)
+        if i is None:
+            return None
+        return self._columns[i][self._row]
+
+    def __getitem__(self, name):
+        return self._columns[self._index[name]][self._row]
+
+
+
+class HHisGrid(object):
+    """HHisGrid is a compact columnar representation of a history grid
+    with ts and val columns, as returned by ZincReader.readHis.
+
+    Timestamps and values are kept in typed arrays instead of HDateTime and
+    HNum instances. The timezone and unit, which are the same for all rows,
+    are stored once in the grid meta as "tz" and "unit" tags.
+
+    Attributes:
+        meta: grid meta
+        cols: ts and val columns
+        ts: array of timestamps in epoch milliseconds
+        tz_offset: array of timezone offsets in seconds for each timestamp
+        val: array of float values; null is NaN, true/false are 1.0/0.0
+    """
+    def __init__(self, meta, cols, ts, tz_offset, val):
+        self.meta = meta
+        self.cols = cols
+        self.ts = ts
+        self.tz_offset = tz_offset
+        self.val = val
+
+    @property
+    def tz(self):
+        """Return timezone name of timestamps or None"""
+        tz = self.meta.get("tz")
+        return tz.val if isinstance(tz, HStr) else None
+
+    @property
+    def unit(self):
+        """Return unit of values or None"""
+        unit = self.meta.get("unit")
+        return unit.val if isinstance(unit, HStr) else None
+
+    def num_rows(self):
+        return len(self.ts)
+
+    def is_empty(self):
+        return not self.num_rows()
+
+    def toGrid(self):
+        """Convert to HGrid with HDateTime ts and HNum val cells.
+        NaN values are converted to HNum.NaN, not to null.
+        """
+        tz = HTimeZone.make(self.tz) if self.tz else HTimeZone.UTC
+        unit = self.unit
+        rows = []
+        for ts, offset, val in zip(self.ts, self.tz_offset, self.val):
+            dt = EPOCH + datetime.timedelta(milliseconds=ts + offset * 1000)
+            date = HDate.make(dt.year, dt.month, dt.day)
+            time = HTime.make(dt.hour, dt.minute, dt.second, dt.microsecond / 1000)
+            rows.append([HDateTime.make(date, time, tz, offset), HNum.make(val, unit)])
+        return HGrid(self.meta, self.cols, rows)
+
+
+class HColumn(object):
+    """HColumn holds the cells of a grid column as typed arrays, as
+    returned by HGrid.to_columns and to_numpy.
+
+    The kind of a column is given by the types of its cells:
+        number: HNum cells with the same unit, values are floats
+        datetime: HDateTime cells of one timezone, values are epoch
+            milliseconds and tz_offset the timezone offsets in seconds
+        bool: HBool cells, values are 1 or 0
+        str: HStr cells, values are the strings
+        object: other columns, values are the cells
+    Null cells are flagged in mask, their values are NaN, 0 or None.
+
+    Attributes:
+        name: column name
+        meta: column meta
+        kind: kind of the column, see above
+        values: array of the values of the cells; list for str and
+            object columns unless converted to NumPy
+        mask: array of 1 for null cells, 0 for others
+        unit: unit of a number column or None
+        tz: timezone name of a datetime column or None
+        tz_offset: array of timezone offsets of a datetime column
+    """
+    def __init__(self, name, kind, values, mask=None, meta=None, unit=None, tz=None, tz_offset=None):
+        """ctor
+        Args:
+            name: column name
+            kind: "number", "datetime", "bool", "str" or "object"
+            values: sequence of values, see class documentation; a NumPy
+                datetime column may be datetime64 or epoch milliseconds
+            mask: sequence flagging null cells, None for no nulls
+            meta: column meta or None
+            unit: unit of a number column
+            tz: timezone name of a datetime column, default is UTC
+            tz_offset: timezone offsets of a datetime column, default is 0
+        """
+        if kind not in COLUMN_KINDS:
+            raise ValueError("Invalid column kind: %s" % kind)
+        self.name = name
+        self.kind = kind
+        self.values = values
+        self.mask = mask
+        self.meta = meta
+        self.unit = unit
+        self.tz = tz
+        self.tz_offset = tz_offset
+
+    def __len__(self):
+        return len(self.values)
+
+    @staticmethod
+    def from_cells(col, cells):
+        """Make column of the cells of HCol col."""
+        types = set(map(type, cells))
+        types.discard(NoneType)
+        kind = "object"
+        unit = tz = None
+        if len(types) == 1:
+            cls = types.pop()
+            if cls is HNum:
+                units = set([v.unit for v in cells if v is not None])
+                if len(units) == 1:
+                    kind = "number"
+                    unit = units.pop()
+            elif cls is HDateTime:
+                zones = set([v.tz for v in cells if v is not None])
+                if len(zones) == 1:
+                    kind = "datetime"
+                    tz = zones.pop().name
+            elif cls is HBool:
+                kind = "bool"
+            elif cls is HStr:
+                kind = "str"
+        column = HColumn(col.name, kind, None, array.array('b', [v is None for v in cells]),
+                         col.meta, unit, tz)
+        if kind == "number":
+            nan = float('nan')
+            column.values = array.array('d', [nan if v is None else v.val for v in cells])
+        elif kind == "datetime":
+            column.values, column.tz_offset = _epoch_millis_arrays(cells)
+        elif kind == "bool":
+            column.values = array.array('b', [1 if v is not None and v.val else 0 for v in cells])
+        elif kind == "str":
+            column.values = [None if v is None else v.val for v in cells]
+        else:
+            column.values = list(cells)
+        return column
+
+    def cells(self):
+        """Return list of the HVal cells of the column, None for nulls."""
+        values = self.values
+        if self.kind == "datetime" and getattr(values, "dtype", None) is not None:
+            # NumPy datetime64 to epoch milliseconds
+            values = values.astype("datetime64[ms]").astype("int64")
+        values = values.tolist() if hasattr(values, "tolist") else list(values)
+        mask = self.mask
+        if mask is not None and hasattr(mask, "tolist"):
+            mask = mask.tolist()
+        nulls = [i for i, null in enumerate(mask or ()) if null]
+        kind = self.kind
+        if kind == "number":
+            unit = self.unit
+            cells = [HNum(v, unit) for v in values]
+        elif kind == "datetime":
+            offsets = self.tz_offset
+            if offsets is None:
+                offsets = [0] * len(values)
+            elif hasattr(offsets, "tolist"):
+                offsets = offsets.tolist()
+            tz = HTimeZone.make(self.tz) if self.tz else HTimeZone.UTC
+            # values of null cells may not be valid timestamps
+            for i in nulls:
+                values[i] = 0
+            cells = _epoch_millis_to_datetimes(values, offsets, tz)
+        elif kind == "bool":
+            t = HBool.TRUE
+            f = HBool.FALSE
+            cells = [t if v else f for v in values]
+        elif kind == "str":
+            cells = [None if v is None else HStr(v) for v in values]
+        else:
+            cells = values
+        for i in nulls:
+            cells[i] = None
+        return cells
+
+    def _toNumpy(self, numpy):
+        """Convert values, mask and offsets to NumPy arrays."""
+        kind = self.kind
+        if kind == "number":
+            self.values = numpy.array(self.values, dtype=numpy.float64)
+        elif kind == "datetime":
+            values = numpy.asarray(self.values)
+            if values.dtype.kind != "M":
+                values = values.astype(numpy.int64)
+            self.values = values.astype("datetime64[ms]")
+            self.tz_offset = numpy.array(self.tz_offset, dtype=numpy.int32)
+        elif kind == "bool":
+            self.values = numpy.array(self.values, dtype=numpy.bool_)
+        else:
+            values = numpy.empty(len(self.values), dtype=object)
+            values[:] = self.values
+            self.values = values
+        self.mask = numpy.array(self.mask, dtype=numpy.bool_)
+
+COLUMN_KINDS = ("number", "datetime", "bool", "str", "object")
+
+NoneType = type(None)
+
+
+def _to_hdict(d):
+    """Return HDict of dict of HVals or None."""
+    if isinstance(d, HDict):
+        return d
+    return HDict(d) if d else HDict.EMPTY
+
+
+def _epoch_millis_arrays(cells):
+    """Return arrays of epoch milliseconds and timezone offsets in
+    seconds of HDateTime cells, 0 for None cells."""
+    stamps = array.array(TS_TYPECODE)
+    offsets = array.array('i')
+    # days since 1970-01-01 by HDate instance, timestamps share dates
+    days = {}
+    for dt in cells:
+        if dt is None:
+            stamps.append(0)
+            offsets.append(0)
+            continue
+        date = dt.date
+        day = days.get(date)
+        if day is None:
+            day = days[date] = datetime.date(date.year, date.month, date.day).toordinal() - EPOCH_ORDINAL
+        t = dt.time
+        offset = int(dt.tz_offset)
+        stamps.append((day * 86400 + t.hour * 3600 + t.min * 60 + t.sec - offset) * 1000 + int(t.ms))
+        offsets.append(offset)
+    return stamps, offsets
+
+
+def _epoch_millis_to_datetimes(stamps, offsets, tz):
+    """Return HDateTime cells of epoch milliseconds and offsets."""
+    dates = {}
+    times = {}
+    cells = []
+    append = cells.append
+    for stamp, offset in zip(stamps, offsets):
+        day, ms = divmod(int(stamp) + offset * 1000, 86400000)
+        date = dates.get(day)
+        if date is None:
+            d = datetime.date.fromordinal(day + EPOCH_ORDINAL)
+            date = dates[day] = HDate(d.year, d.month, d.day)
+        time = times.get(ms)
+        if time is None:
+            s, milli = divmod(ms, 1000)
+            m, sec = divmod(s, 60)
+            time = times[ms] = HTime(m / 60, m % 60, sec, milli)
+        append(HDateTime(date, time, tz, offset))
+    return cells
+
+
+def epoch_millis(dt):
+    """Return epoch milliseconds of HDateTime instance."""
+    days = datetime.date(dt.date.year, dt.date.month, dt.date.day).toordinal() - EPOCH_ORDINAL
+    t = dt.time
+    return ((days * 86400 + t.hour * 3600 + t.min * 60 + t.sec - int(dt.tz_offset)) * 1000) + t.ms
+
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+# typecode of HHisGrid.ts arrays, python 2 arrays do not support 'q'
+try:
+    array.array('q')
+    TS_TYPECODE = 'q'
+except ValueError:
+    TS_TYPECODE = 'l' if array.array('l').itemsize == 8 else 'd'
 
 
 class BCol():
@@ -479,8 +1160,9 @@ class HGridBuilder():
         b.meta.add_dict(meta)
         b.addCol("ts")
         b.addCol("val")
+        tz = HTimeZone.make(tzname) if tzname else None
         for ts, val in items:
-            hts = HDateTime.make_from_dt(ts, tzname)
+            hts = HDateTime.make_from_dt(ts, tz)
             if isinstance(val, basestring):
                 hval = HStr.make(val)
             elif isinstance(val, int) or isinstance(val, float) or isinstance(val, long):
@@ -519,14 +1201,24 @@ class HGridBuilder():
         self.rows.append(list(cells))
         return self
 
-    def toGrid(self):
+    def toGrid(self, columnar=False):
         """Convert current state to an immutable HGrid instance .
+
+        Args:
+            columnar: return HColumnGrid, which stores the cells
+                column by column
         """
         meta = self.meta.toDict()
         cols = []
         for i in range(len(self.cols)):
             col = self.cols[i]
             cols.append(HCol(i, col.name, col.meta.toDict()))
+        if columnar:
+            rows = self.rows
+            if len(set(map(len, rows)) - set([len(cols)])):
+                raise ValueError("Row cells size != cols size")
+            columns = zip(*rows) if rows else [()] * len(cols)
+            return HColumnGrid(meta, cols, columns, len(rows))
         return HGrid(meta, cols, self.rows)
 
 """
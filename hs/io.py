@@ -1,15 +1,281 @@
 # coding: utf8
 """ Implementation of zincreader and zincwriter
 """
+import csv
+import gzip
+from json.encoder import encode_basestring_ascii
+import mmap
+import os
 import re
-import json
-import StringIO
 import string
-from grid import HGridBuilder, HDictBuilder
-from val import HMarker, HBool, HStr, HNum, HDate, HRef, HTime, HTimeZone, HDateTime, HUri, is_id_char
+import StringIO
+import zlib
+from grid import HGridBuilder, HDictBuilder, HGrid, HRow, istagname, to_tag_name
+from val import HVal, HMarker, HBool, HStr, HNum, HDate, HRef, HTime, HTimeZone, HDateTime, HUri
+from val import num_to_zinc, tz_offset_to_zinc
+from scanner import ZincScanner, grid_ranges
+from parallel import read_grids_parallel, PARALLEL_THRESHOLD
+from jsonbackend import get_backend
+
+# number of characters buffered by writers before they are written to the output
+WRITE_CHUNK_SIZE = 65536
 
 class BaseWriter(object):
-    pass
+    """Base class of the grid writers.
+
+    Writers encode each line (or row) into a single string. Lines are
+    buffered and written to the output joined, in chunks of about
+    chunk_size characters, instead of one write for every token.
+    """
+    def __init__(self, out, chunk_size=WRITE_CHUNK_SIZE, encoding=None):
+        """ctor
+        Args:
+            out: file stream, file or StringIO, to use for output
+            chunk_size: number of characters to buffer before writing to out
+            encoding: encoding of unicode output, e.g. 'utf-8' to write bytes
+                to binary streams; by default str and unicode are written as is
+        """
+        self.out = out
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+        self._buf = []
+        self._bufSize = 0
+
+    def flush(self):
+        """Write buffered output to out."""
+        if self._buf:
+            s = ''.join(self._buf)
+            del self._buf[:]
+            self._bufSize = 0
+            self.out.write(s)
+
+    def _write(self, s):
+        if self.encoding is not None and isinstance(s, unicode):
+            s = s.encode(self.encoding)
+        self._buf.append(s)
+        self._bufSize += len(s)
+        if self._bufSize >= self.chunk_size:
+            self.flush()
+
+############################################################
+###################### Column encoders #####################
+############################################################
+
+# Writers encode the rows of a grid in batches, one column at a time.
+# When all cells of a column in the batch are of one kind (markers,
+# numbers, timestamps, ...) a specialized encoder writes the
+# whole column without dispatching on the type of each cell.
+
+# number of rows encoded at a time by writeGrid
+ENCODE_BATCH_SIZE = 1000
+
+NoneType = type(None)
+
+def _column_kind(vals):
+    """Return the type of the non-null cells of a column or None when
+    the column is all null or of mixed types."""
+    kinds = set(map(type, vals))
+    kinds.discard(NoneType)
+    return kinds.pop() if len(kinds) == 1 else None
+
+def _zinc_nums(vals, null):
+    # the zinc of each value is cached on it, see HNum.to_zinc
+    ret = []
+    append = ret.append
+    for v in vals:
+        if v is None:
+            append(null)
+            continue
+        s = v._zinc
+        if s is None:
+            s = v._zinc = num_to_zinc(v.val) + (v.unit or '')
+        append(s)
+    return ret
+
+def _zinc_datetimes(vals, null):
+    # the zinc of each value is cached on it, see HDateTime.to_zinc;
+    # offset and timezone suffixes are shared by the values of a column
+    zones = {}
+    ret = []
+    append = ret.append
+    for v in vals:
+        if v is None:
+            append(null)
+            continue
+        s = v._zinc
+        if s is None:
+            key = (v.tz_offset, v.tz.name)
+            zone = zones.get(key)
+            if zone is None:
+                zone = zones[key] = '%s %s' % (tz_offset_to_zinc(v.tz_offset), v.tz)
+            s = v._zinc = v.date.to_zinc() + 'T' + v.time.to_zinc() + zone
+        append(s)
+    return ret
+
+ZINC_COLUMN_ENCODERS = {
+    HMarker: lambda vals, null: [null if v is None else 'M' for v in vals],
+    HBool: lambda vals, null: [null if v is None else ('T' if v.val else 'F') for v in vals],
+    HNum: _zinc_nums,
+    HDateTime: _zinc_datetimes,
+}
+
+def zinc_column(vals, null=''):
+    """Encode cells of a column as zinc.
+
+    Args:
+        vals: sequence of cells
+        null: encoding of null cells
+    Returns:
+        list of strings
+    """
+    encoder = ZINC_COLUMN_ENCODERS.get(_column_kind(vals))
+    if encoder is not None:
+        encoded = encoder(vals, null)
+        if encoded is not None:
+            return encoded
+    return [null if v is None else v.to_zinc() for v in vals]
+
+def json_encoders(encode_str):
+    """Return table of haystack JSON encoders of values by type.
+
+    Args:
+        encode_str: function encoding str or unicode as JSON string literal
+    """
+    def num(v):
+        if v.unit:
+            return encode_str('n:%s %s' % (num_to_zinc(v.val), v.unit))
+        return '"n:%s"' % num_to_zinc(v.val)
+
+    def ref(v):
+        if v._dis is None:
+            return encode_str('r:' + v.val)
+        return encode_str('r:%s %s' % (v.val, v._dis))
+
+    def string(v):
+        s = v.val
+        # strings which look like a type prefix are written with the s: prefix
+        if s[1:2] == ':':
+            s = 's:' + s
+        return encode_str(s)
+
+    return {
+        HMarker: lambda v: '"m:"',
+        HBool: lambda v: 'true' if v.val else 'false',
+        HStr: string,
+        HNum: num,
+        HRef: ref,
+        HUri: lambda v: encode_str('u:' + v.val),
+        HDate: lambda v: '"d:%s"' % v.to_zinc(),
+        HTime: lambda v: '"h:%s"' % v.to_zinc(),
+        HDateTime: lambda v: '"t:%s"' % v.to_zinc(),
+        # plain strings, used for other values
+        basestring: encode_str,
+    }
+
+JSON_ENCODERS = json_encoders(encode_basestring_ascii)
+
+def encode_json(val, encoders=JSON_ENCODERS):
+    """Encode value in haystack JSON encoding.
+
+    Args:
+        val: HVal instance
+        encoders: table of encoders, see json_encoders
+    Returns:
+        JSON text of the value
+    """
+    encoder = encoders.get(type(val))
+    if encoder is None:
+        return encoders[basestring](val.to_zinc())
+    return encoder(val)
+
+def _json_nums(vals):
+    units = set([v.unit for v in vals if v is not None])
+    if len(units) != 1:
+        return None
+    unit = units.pop()
+    suffix = encode_basestring_ascii(' ' + unit)[1:-1] if unit else ''
+    return [None if v is None else '"n:' + num_to_zinc(v.val) + suffix + '"' for v in vals]
+
+def _json_datetimes(vals):
+    encoded = _zinc_datetimes(vals, None)
+    if encoded is None:
+        return None
+    return [None if s is None else '"t:' + s + '"' for s in encoded]
+
+JSON_COLUMN_ENCODERS = {
+    HMarker: lambda vals: [None if v is None else '"m:"' for v in vals],
+    HBool: lambda vals: [None if v is None else ('true' if v.val else 'false') for v in vals],
+    HNum: _json_nums,
+    HDateTime: _json_datetimes,
+}
+
+def json_column(vals, encoders=JSON_ENCODERS):
+    """Encode cells of a column in haystack JSON encoding.
+
+    Args:
+        vals: sequence of cells
+        encoders: table of encoders, see json_encoders
+    Returns:
+        list of JSON texts, None for null cells
+    """
+    kind = _column_kind(vals)
+    encoder = JSON_COLUMN_ENCODERS.get(kind)
+    if encoder is not None:
+        encoded = encoder(vals)
+        if encoded is not None:
+            return encoded
+    encoder = encoders.get(kind)
+    if encoder is None:
+        return [None if v is None else encode_json(v, encoders) for v in vals]
+    return [None if v is None else encoder(v) for v in vals]
+
+# whitespace characters of regex \s other than newlines mapped to space
+CSV_SPACE_TABLE = string.maketrans('\t\f\v', '   ')
+
+# CSV text of values by type, zinc encoding for other values
+CSV_ENCODERS = {
+    HMarker: lambda v: HMarker.JSON_VALUE,
+    HStr: lambda v: v.val,
+    HUri: lambda v: v.val,
+    HTimeZone: lambda v: v.name,
+}
+
+def encode_csv(val):
+    """Return CSV text of value, not quoted; '' for null."""
+    if val is None:
+        return ''
+    encoder = CSV_ENCODERS.get(type(val))
+    if encoder is None:
+        return val.to_zinc()
+    return encoder(val)
+
+CSV_COLUMN_ENCODERS = {
+    HMarker: lambda vals: ['' if v is None else HMarker.JSON_VALUE for v in vals],
+    HBool: lambda vals: ['' if v is None else ('T' if v.val else 'F') for v in vals],
+    HStr: lambda vals: ['' if v is None else v.val for v in vals],
+    HUri: lambda vals: ['' if v is None else v.val for v in vals],
+    HNum: lambda vals: _zinc_nums(vals, ''),
+    HDateTime: lambda vals: _zinc_datetimes(vals, ''),
+}
+
+def csv_column(vals):
+    """Return CSV text of cells of a column, not quoted.
+
+    Args:
+        vals: sequence of cells
+    Returns:
+        list of str or unicode, '' for null cells
+    """
+    kind = _column_kind(vals)
+    encoder = CSV_COLUMN_ENCODERS.get(kind)
+    if encoder is not None:
+        encoded = encoder(vals)
+        if encoded is not None:
+            return encoded
+    if kind is None:
+        return [encode_csv(v) for v in vals]
+    return ['' if v is None else v.to_zinc() for v in vals]
+
 
 def _grid_to_string(grid, cls):
     """Write a grid to a string using the given writer type.
@@ -54,15 +320,20 @@ class CsvWriter(BaseWriter):
     payload - see writeGrids function.
 
     """
-    def __init__(self, out, delimiter=','):
+    def __init__(self, out, delimiter=',', chunk_size=WRITE_CHUNK_SIZE, encoding=None):
         """ctor
         Args:
             out: file stream, file or StringIO, to use for output
-            Will write using utf-i
+            delimiter: cell delimiter
+            chunk_size: see BaseWriter
+            encoding: encoding of the output, default is utf-8
 
         """
-        self.out = out
+        BaseWriter.__init__(self, out, chunk_size, encoding)
         self.delimiter = delimiter
+        # cells with the delimiter, quote, newline or leading/trailing whitespace
+        self._specialRe = re.compile(r'[%s"\n\r]' % re.escape(delimiter))
+        self._quoteRe = re.compile(self._specialRe.pattern + r'|^\s|\s$')
 
     @staticmethod
     def gridToString(grid):
@@ -79,15 +350,16 @@ class CsvWriter(BaseWriter):
             grid: grid to write
 
         """
-        for i, col in enumerate(grid.cols):
-            if i > 0:
-                self.out.write(self.delimiter)
-            self._writeCell(col.dis)
-        self.out.write("\n")
+        self._writeGrid(grid)
+        self.flush()
+
+    def _writeGrid(self, grid):
+        self._write(self.delimiter.join(self._quoteColumn([col.dis for col in grid.cols])) + "\n")
         # rows
-        for row in grid.rows:
-            self._writeRow(grid, row)
-            self.out.write("\n")
+        numRows = grid.num_rows()
+        for i in xrange(0, numRows, ENCODE_BATCH_SIZE):
+            self._writeColumns(grid.col_slices(i, i + ENCODE_BATCH_SIZE),
+                               min(ENCODE_BATCH_SIZE, numRows - i))
 
     def writeGrids(self, grids):
         """Write grids in extended haystack format (multigrid).
@@ -109,52 +381,73 @@ class CsvWriter(BaseWriter):
         """
         for i, grid in enumerate(grids):
             if i > 0:
-                self.out.write('\n')
-            self.writeGrid(grid)
+                self._write('\n')
+            self._writeGrid(grid)
+        self.flush()
 
 
-    def _writeRow(self, grid, row):
-        for i, col in enumerate(grid.cols):
-            val = row.get(col)
-            if i > 0:
-                self.out.write(self.delimiter)
-            self._writeCell(self._valToString(val))
-
-    def _valToString(self, val):
-        if val == None:
-            return ""
-        if val == HMarker.VAL:
-            return HMarker.JSON_VALUE
-        if isinstance(val, HRef):
-            return val.to_zinc()
-        return unicode(val)
-
-    def _writeCell(self, cell):
+    def _writeColumns(self, columns, numRows):
+        """Write rows of the cells of each column, encoded column by column."""
+        if not columns:
+            self._write('\n' * numRows)
+            return
+        quoteColumn = self._quoteColumn
+        columns = [quoteColumn(csv_column(vals)) for vals in columns]
+        delimiter = self.delimiter
+        self._write(''.join([delimiter.join(line) + '\n' for line in zip(*columns)]))
+
+    def _quoteColumn(self, cells):
+        """Encode and quote the cells of a column which require quoting.
+
+        The cells are joined by NUL characters, encoded and searched at
+        once, cells are only checked one by one when some of them need quotes.
+
+        Args:
+            cells: list of str (utf-8) or unicode, '' for null cells
+        Returns:
+            list of quoted cells, str in the encoding of the writer
+        """
+        encoding = self.encoding or 'utf-8'
+        try:
+            text = u'\x00'.join(cells)
+        except UnicodeDecodeError:
+            cells = [s.decode('utf-8') if isinstance(s, str) else s for s in cells]
+            text = u'\x00'.join(cells)
+        text = text.encode(encoding)
+        encoded = text.split('\x00')
+        if len(encoded) != len(cells):
+            # cells with NUL characters
+            encoded = [(s.decode('utf-8') if isinstance(s, str) else s).encode(encoding) for s in cells]
+        if self._specialRe.search(text) is None:
+            # leading or trailing whitespace, substring search is faster than a regex
+            text = text.translate(CSV_SPACE_TABLE)
+            if not (text[:1] == ' ' or text[-1:] == ' ' or '\x00 ' in text or ' \x00' in text):
+                # empty and null cells are written as ""
+                return [s or '""' for s in encoded]
+        quote = self._quote
+        return [quote(s) for s in encoded]
+
+    def _quote(self, cell):
         if not self.is_quoted_required(cell):
-            self.out.write(unicode(cell))
-        else:
-            self.out.write('"')
-            self.out.write(cell)
-            self.out.write('"')
+            return cell
+        return '"' + cell.replace('"', '""') + '"'
 
     def is_quoted_required(self, s):
-        if not len(s):
-            return True
-        if s[0] in string.whitespace or s[-1] in string.whitespace:
-            return True
-        for c in s:
-            if c == self.delimiter or c == '"' or c == '\n' or c == '\r':
-                return True
-        return False
+        return not s or self._quoteRe.search(s) is not None
 
 
-class JsonWriter(object):
+class JsonWriter(BaseWriter):
 
     """
     HJsonWriter is used to write grids in JavaScript Object Notation.
     It is a plain text format commonly used for serialization of data.
     It is specified in RFC 4627.
 
+    Values are written in the haystack JSON encoding with type prefixes
+    ("m:", "n:72.5 kW", "r:id dis", ...), null cells are omitted from
+    the row objects. Rows are encoded and written incrementally, the
+    grid is never held as one JSON document.
+
     @see <a href='http://project-haystack.org/doc/Json'>Project Haystack</a>
 
     haystack "multigrid" extension is supported which allows multiple grids in one
@@ -163,14 +456,24 @@ class JsonWriter(object):
 
 
     """
-    def __init__(self, out):
+    def __init__(self, out, chunk_size=WRITE_CHUNK_SIZE, encoding=None, backend=None):
         """ctor
         Args:
             out: file stream, file or StringIO, to use for output
-            Will write using utf-i
+            chunk_size: see BaseWriter
+            encoding: see BaseWriter
+            backend: JSON library used to encode strings, name or JsonBackend,
+                see hs.jsonbackend; by default the fastest importable one
 
         """
-        self.out = out
+        BaseWriter.__init__(self, out, chunk_size, encoding)
+        self.backend = get_backend(backend)
+        self._encodeStr = self.backend.encode_str
+        self._encoders = json_encoders(self._encodeStr)
+        # column names and encoded object keys of the grid being written
+        self._cols = None
+        self._keys = None
+        self._numRows = 0
 
     def writeGrid(self, grid):
         """Write a grid to stream.
@@ -179,28 +482,84 @@ class JsonWriter(object):
             grid: grid to write
 
         """
-        json_dict = {}
-        json_dict['meta'] = {
-            "ver:": "2.0"
-        }
-        self._writeDictTags(grid.meta, json_dict['meta'])
-
+        self._writeGrid(grid)
+        self.flush()
+
+    def _writeGrid(self, grid):
+        self.writeHeader(grid.meta, grid.cols)
+        numRows = grid.num_rows()
+        for i in xrange(0, numRows, ENCODE_BATCH_SIZE):
+            self._writeColumns(grid.col_slices(i, i + ENCODE_BATCH_SIZE),
+                               min(ENCODE_BATCH_SIZE, numRows - i))
+        self._write(']}')
+        self._cols = None
+
+    def writeHeader(self, meta, cols):
+        """Write meta and cols of a grid, rows are then written one at a
+        time with writeRow or writeRows and the grid is closed by writeEnd.
+
+            w = JsonWriter(out)
+            w.writeHeader(HDict.EMPTY, ["ts", "val"])
+            for ts, val in items:
+                w.writeRow([ts, val])
+            w.writeEnd()
 
-        # columns
-        cols = []
-        for col in grid.cols:
-            cols.append({"name":  col.name})
-        json_dict["cols"] = cols
-
-        # rows
-        rows = []
-        for row in grid.rows:
-            json_row = {}
-            self._writeDictTags(row, json_row)
-            rows.append(json_row)
+        Args:
+            meta: HDict grid meta or None
+            cols: list of HCol or column names
+        """
+        line = ['{"meta":{"ver":"2.0"']
+        if meta is not None:
+            self._writeTags(line, meta)
+        line.append('},"cols":[')
+        self._cols = []
+        for i, col in enumerate(cols):
+            if i > 0:
+                line.append(',')
+            if isinstance(col, basestring):
+                name = col
+                line.append('{"name":%s}' % self._encodeStr(name))
+            else:
+                name = col.name
+                line.append('{"name":%s' % self._encodeStr(name))
+                self._writeTags(line, col.meta, "name")
+                line.append('}')
+            self._cols.append(name)
+        line.append('],"rows":[')
+        self._keys = [self._encodeStr(name) + ':' for name in self._cols]
+        self._numRows = 0
+        self._write(''.join(line))
+
+    def writeRow(self, row):
+        """Write a row of the grid started with writeHeader. Rows are
+        buffered, flush() writes them to the output.
 
-        json_dict["rows"] = rows
-        self.out.write(json.dumps(json_dict))
+        Args:
+            row: list of cells in column order, or dict (or HRow)
+                 of cells by column name
+        """
+        if self._cols is None:
+            raise ValueError("writeHeader must be called before writeRow")
+        if isinstance(row, (dict, HRow)):
+            row = [row.get(name) for name in self._cols]
+        elif len(row) != len(self._cols):
+            raise ValueError("Row cells size != cols size")
+        cells = [None if val is None else encode_json(val, self._encoders) for val in row]
+        self._writeObjects([cells])
+
+    def writeRows(self, rows):
+        """Write rows of an iterable, see writeRow, and flush them."""
+        for row in rows:
+            self.writeRow(row)
+        self.flush()
+
+    def writeEnd(self):
+        """Close the grid started with writeHeader and flush the output."""
+        if self._cols is None:
+            raise ValueError("writeHeader must be called before writeEnd")
+        self._write(']}')
+        self._cols = None
+        self.flush()
 
     def writeGrids(self, grids):
         """Write grids in extended haystack format (multigrid).
@@ -211,7 +570,7 @@ class JsonWriter(object):
         "grids": [
             {
                 "meta": {
-                    "ver:": "2.0"
+                    "ver": "2.0"
                 },
                 "cols": [
                 {
@@ -223,23 +582,26 @@ class JsonWriter(object):
             },
             {
                 "meta": {
-                    "ver:": "2.0"
+                    "ver": "2.0"
                 },
                 ...
             },
         ]
         }
 
+        Grids are written as they are taken from the iterable, so a
+        generator of grids is written without holding all of them.
 
-        :param grids:
+        :param grids: iterable of grids
         :return:
         """
-        self.out.write('{"grids":[')
+        self._write('{"grids":[')
         for i, grid in enumerate(grids):
             if i > 0:
-                self.out.write(',')
-            self.writeGrid(grid)
-        self.out.write(']}')
+                self._write(',')
+            self._writeGrid(grid)
+        self._write(']}')
+        self.flush()
 
     @staticmethod
     def gridToString(grid):
@@ -253,23 +615,47 @@ class JsonWriter(object):
     ######################### Implementation ###################
     ############################################################
 
-    def _writeDictTags(self, meta, meta_dict):
-        for name, val in meta.iteritems():
-            meta_dict[name] = unicode(val)
+    def _writeTags(self, line, tags, skip=None):
+        """Append the tags of a dict, tag skip is left out (the name of a
+        column dict is written first, by writeHeader)."""
+        for name, val in tags.iteritems():
+            if val is not None and name != skip:
+                line.append(',%s:%s' % (self._encodeStr(name), encode_json(val, self._encoders)))
+
+    def _writeColumns(self, columns, numRows):
+        """Write rows of the cells of each column, encoded column by column."""
+        if not self._cols:
+            self._writeObjects([()] * numRows)
+            return
+        self._writeObjects(zip(*[json_column(vals, self._encoders) for vals in columns]))
 
+    def _writeObjects(self, rows):
+        """Write rows of encoded cells, None for null cells, as objects."""
+        keys = self._keys
+        objs = ['{' + ','.join([k + v for k, v in zip(keys, cells) if v is not None]) + '}'
+                for cells in rows]
+        s = ','.join(objs)
+        if self._numRows:
+            s = ',' + s
+        self._numRows += len(objs)
+        self._write(s)
 
-class ZincWriter(object):
+
+class ZincWriter(BaseWriter):
     """HZincWriter is used to write grids in the Zinc format
         @see <a href='http://project-haystack.org/doc/Zinc'>Project Haystack</a>
 
     """
-    def __init__(self, out):
+    def __init__(self, out, chunk_size=WRITE_CHUNK_SIZE, encoding=None):
         """ctor
         Args:
             out: file stream, file or StringIO, to use for output
-            Will write using utf-i
+            chunk_size: see BaseWriter
+            encoding: see BaseWriter
         """
-        self.out = out
+        BaseWriter.__init__(self, out, chunk_size, encoding)
+        # column names of the grid being written
+        self._cols = None
 
     @staticmethod
     def gridToString(grid):
@@ -279,23 +665,102 @@ class ZincWriter(object):
     def gridsToString(grid):
         return _grids_to_string(grid, ZincWriter)
 
+    @staticmethod
+    def gridsToGzip(grids, path, append=True, compresslevel=6):
+        """Write grids to a gzip compressed multigrid file.
+
+        Each call appends a gzip member, so grids can be added to an
+        archive over time without rewriting it; gzip tools and
+        ZincStreamReader.from_gzip read all members as one stream.
+
+        Args:
+            grids: list of grids
+            path: path of the file
+            append: append to the file, otherwise the file is replaced
+            compresslevel: gzip compression level, 1 to 9
+        """
+        f = gzip.open(path, 'ab' if append else 'wb', compresslevel)
+        try:
+            ZincWriter(f, encoding='utf-8').writeGrids(grids)
+        finally:
+            f.close()
+
     def writeGrid(self, grid):
-        self.out.write('ver:"2.0"')
-        self._writeMeta(grid.meta)
-        self.out.write('\n')
+        self.writeHeader(grid.meta, grid.cols)
+        numRows = grid.num_rows()
+        for i in xrange(0, numRows, ENCODE_BATCH_SIZE):
+            self._writeColumns(grid.col_slices(i, i + ENCODE_BATCH_SIZE),
+                               min(ENCODE_BATCH_SIZE, numRows - i))
+        self.flush()
+
+    def writeHeader(self, meta, cols):
+        """Write version/meta line and column line of a grid, rows are
+        then written one at a time with writeRow or writeRows and the
+        grid is closed by writeEnd.
+
+        This allows writing large results without building a HGrid:
+
+            w = ZincWriter(out)
+            w.writeHeader(HDict.EMPTY, ["ts", "val"])
+            for ts, val in items:
+                w.writeRow([ts, val])
+            w.writeEnd()
+
+        Args:
+            meta: HDict grid meta or None
+            cols: list of HCol or column names
+        """
+        line = ['ver:"2.0"']
+        if meta is not None:
+            self._writeMeta(line, meta)
+        line.append('\n')
 
         # cols
-        for i, col in enumerate(grid.cols):
+        self._cols = []
+        for i, col in enumerate(cols):
             if i > 0:
-                self.out.write(",")
-            self._writeCol(col)
+                line.append(",")
+            if isinstance(col, basestring):
+                line.append(col)
+            else:
+                self._writeCol(line, col)
+                col = col.name
+            self._cols.append(col)
 
-        self.out.write("\n")
+        line.append("\n")
+        self._write(''.join(line))
 
-        # rows
-        for row in grid.rows:
-            self._writeRow(grid, row)
-            self.out.write("\n")
+    def writeRow(self, row):
+        """Write a row of the grid started with writeHeader. Rows are
+        buffered, flush() writes them to the output.
+
+        Args:
+            row: list of cells in column order, or dict (or HRow)
+                 of cells by column name
+        """
+        if self._cols is None:
+            raise ValueError("writeHeader must be called before writeRow")
+        if isinstance(row, (dict, HRow)):
+            row = [row.get(name) for name in self._cols]
+        elif len(row) != len(self._cols):
+            raise ValueError("Row cells size != cols size")
+        self._writeCells(row)
+
+    def writeRows(self, rows):
+        """Write rows of an iterable, see writeRow, and flush them."""
+        for row in rows:
+            self.writeRow(row)
+        self.flush()
+
+    def writeEnd(self):
+        """Close the grid started with writeHeader with an empty line,
+        which separates it from the next grid of a multigrid, and flush
+        the output."""
+        if self._cols is None:
+            raise ValueError("writeHeader must be called before writeEnd")
+        self._write('\n')
+        self._cols = None
+        self.flush()
 
     def writeGrids(self, grids):
         """Write grids in extended haystack format (multigrid).
@@ -309,35 +774,36 @@ class ZincWriter(object):
     ######################### Implementation ###################
     ############################################################
 
-    def _writeMeta(self, meta):
+    def _writeMeta(self, line, meta):
         if meta.is_empty():
             return
         for name, val in meta.iteritems():
-            self.out.write(' ')
-            self.out.write(name)
+            line.append(' ')
+            line.append(name)
             if (val != HMarker.VAL):
-                self.out.write(':')
-                self.out.write(val.to_zinc())
-
-    def _writeCol(self, col):
-        #print('_writeCol: %s: %s' % (col.name, col.meta))
-        self.out.write(col.name)
-        self._writeMeta(col.meta)
-
-    def _writeRow(self, grid, row):
-        for i, col in enumerate(grid.cols):
-            val = row.get(col)
-            #print('_writeRow: %s' % type(val))
-            #print('_writeRow: %s' % val.to_zinc())
-            if i > 0:
-                self.out.write(',')
-            if val == None:
-                if i == 0:
-                    self.out.write('N')
-            else:
-                self.out.write(val.to_zinc())
+                line.append(':')
+                line.append(val.to_zinc())
+
+    def _writeCol(self, line, col):
+        line.append(col.name)
+        self._writeMeta(line, col.meta)
+
+    def _writeColumns(self, columns, numRows):
+        """Write rows of the cells of each column, encoded column by column."""
+        if not self._cols:
+            self._write('\n' * numRows)
+            return
+        # a row with a single null cell would be an empty line
+        columns = [zinc_column(vals, 'N' if i == 0 else '') for i, vals in enumerate(columns)]
+        self._write(''.join([','.join(line) + '\n' for line in zip(*columns)]))
+
+    def _writeCells(self, cells):
+        line = ['' if val is None else val.to_zinc() for val in cells]
+        # a row with a single null cell would be an empty line
+        if cells and cells[0] is None:
+            line[0] = 'N'
+        self._write(','.join(line) + '\n')
 
-ZINC_GRID_START = 'ver:"2.0"'
 class ZincReader(object):
 
     def __init__(self, s):
@@ -347,111 +813,138 @@ class ZincReader(object):
         multiple grids (extended haystack) are supported.
 
         Args:
-            s: string to parse
+            s: string to parse, or mmap of a file (see from_path)
 
         """
-        if not isinstance(s, basestring):
+        if not isinstance(s, (basestring, mmap.mmap)):
             raise ValueError("Only basestring can be read via ZincReader")
         #
-        # for multigrid, delineate individual grids
+        # for multigrid, delineate individual grids by offsets into
+        # the payload, grids are parsed in place without copies
         #
-        self.grid_strings = []
-        start = 0
-        curpos = 0
-
-        # init strings for multiple grids
-        str_boundaries = []
-        for m in re.finditer(ZINC_GRID_START, s):
-            str_boundaries.append(m.start())
+        self.buf = s
+        self.grid_ranges = grid_ranges(s)
 
-        str_boundaries.append(len(s))
+    @classmethod
+    def from_path(cls, path):
+        """Create reader for a zinc file. The file is memory mapped
+        and parsed in place, it is not read into memory.
 
+        The mapping is released by close() or when the reader and
+        the lazy grids read from it are garbage collected.
 
-        if len(str_boundaries) < 2:
-            # this is a dict, not a grid
-            self.grid_strings.append(s)
-        else:
-            for i in range(len(str_boundaries)-1):
-                self.grid_strings.append(s[str_boundaries[i]:str_boundaries[i+1]])
+        Args:
+            path: path of the file
 
+        Returns:
+            ZincReader instance
 
-    def _init_grid_read(self, grid_number = 0):
-        self.stream = StringIO.StringIO(self.grid_strings[grid_number])
-        self.lineNum = 1
-        self.version = None
-        self.cur = chr(0)
-        self.peek = chr(0)
-        self.is_filter = False
-        self._consume()
-        self._consume()
+        """
+        with open(path, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return cls('')
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def close(self):
+        """Release the file mapping of a reader created by from_path.
+        Lazy grids read from it can not be accessed anymore.
+        """
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
 
-    def readGrids(self):
+    def readGrids(self, lazy=False, cache_size=None, columnar=False):
         """Reads all grids from reader.
 
+        Args:
+            lazy: see readGrid
+            cache_size: see readGrid
+            columnar: see readGrid
+
+        Returns:
+            list of HGrid instances
+
+        """
+        return list(self.iterGrids(lazy, cache_size, columnar))
+
+    def readGridsParallel(self, executor=None, workers=None, threshold=PARALLEL_THRESHOLD, columnar=False):
+        """Reads all grids from reader using worker processes.
+
+        Grids, and row-aligned chunks of large grids, are parsed in
+        parallel and merged in order. Payloads smaller than threshold,
+        or read without executor on a single cpu, are read serially.
+
+        Args:
+            executor: object with a map(func, iterable) method used to run
+                the chunks, such as multiprocessing.Pool; by default a pool
+                is created for the call
+            workers: number of worker processes, default is the number of cpus
+            threshold: min payload size for parallel parsing
+            columnar: see readGrid
+
         Returns:
             list of HGrid instances
 
         """
-        grids = []
-        for i in range(len(self.grid_strings)):
-            grids.append(self.readGrid(i))
-        return grids
+        if len(self.buf) < threshold:
+            return self.readGrids(columnar=columnar)
+        return read_grids_parallel(self.buf, self.grid_ranges, executor, workers, columnar=columnar)
+
+    def iterGrids(self, lazy=False, cache_size=None, columnar=False):
+        """Generator of the grids of the reader, each grid
+        is parsed when it is requested.
+
+        Args:
+            lazy: see readGrid
+            cache_size: see readGrid
+            columnar: see readGrid
+
+        Returns:
+            generator of HGrid instances
+
+        """
+        for grid_index in xrange(len(self.grid_ranges)):
+            yield self.readGrid(grid_index, lazy, cache_size, columnar)
 
-    def readGrid(self, grid_index=0):
+    def readGrid(self, grid_index=0, lazy=False, cache_size=None, columnar=False):
         """Reads a single grid from reader.
 
         Args:
             grid_index: index of grid to read
+            lazy: only index the row boundaries and decode the cells
+                of a row when it is accessed, returns a HLazyGrid
+            cache_size: max number of decoded rows kept by a lazy grid,
+                by default all decoded rows are kept
+            columnar: store the cells column by column, returns a
+                HColumnGrid; not supported for lazy grids
 
         Returns:
             HGrid instance
 
         """
-        self._init_grid_read(grid_index)
-        b = HGridBuilder()
+        start, end = self.grid_ranges[grid_index]
+        if lazy:
+            if columnar:
+                raise ValueError("Lazy grids can not be columnar")
+            return ZincScanner(self.buf, start, end).readLazyGrid(cache_size)
+        return ZincScanner(self.buf, start, end).readGrid(columnar)
 
-        # meta line
-        self._readVer()
-        self._readMeta(b.meta)
-        self._consumeNewLine()
+    def readHis(self, grid_index=0):
+        """Reads a history grid with ts and val columns into a
+        compact columnar HHisGrid.
 
-        # read cols
-        numCols = 0
-        while True:
-            name = self._readId()
-            self._skipSpace()
-            numCols += 1
-            self._readMeta(b.addCol(name))
-            if self.cur != ",": break
-            self._consume()
-            self._skipSpace()
+        Timestamps are decoded into an array of epoch milliseconds and
+        values into an array of floats, timezone and unit are stored once
+        in the grid meta.
 
-        self._consumeNewLine()
+        Args:
+            grid_index: index of grid to read
 
-        # rows
+        Returns:
+            HHisGrid instance
 
-        while self.cur != "\n" and self.cur != "":
-            # preinit cells list to Nones
-            cells = [None] * numCols
-            for i in range(numCols):
-                self._skipSpace()
-                if self.cur != ',' and self.cur != '\n':
-                    cells[i] = self._readVal()
-                self._skipSpace()
-                if (i+1 < numCols):
-                    if self.cur != ',':
-                        self._err("Expecting comma in row")
-                    self._consume()
-            self._consumeNewLine()
-            b.addRow(cells)
-        if self.cur == '\n': self._consumeNewLine()
-        return b.toGrid()
-
-    #def readGrids(self):
-    #    acc = []
-    #    while self.cur > 0:
-    #        acc.append(self.readGrid())
-    #    return acc
+        """
+        start, end = self.grid_ranges[grid_index]
+        return ZincScanner(self.buf, start, end).readHis()
 
     def readDict(self):
         """ Read dict.
@@ -459,480 +952,888 @@ class ZincReader(object):
 
         :return:
         """
-        self._init_grid_read()
-        b = HDictBuilder()
-        self._readMeta(b)
-        if self.cur != "":
-            self._err("Expected end of stream")
-        return b.toDict()
-
-    def _readVer(self):
-        id = self._readId()
-        if not id == "ver":
-            self._err("Expecting zinc header 'ver:2.0', not '%s'" % id)
-        if self.cur != ':': self._err("Expecting ':' colon")
-        self._consume()
-        ver = self._readStrLiteral()
-        if ver == "2.0":
-            self.version = 2
-        else:
-            self._err("Expecting zinc version: %s" % ver)
-        self._skipSpace()
+        start, end = self.grid_ranges[0]
+        return ZincScanner(self.buf, start, end).readDict()
+
+
+class ZincStreamReader(object):
+    """ZincStreamReader reads zinc grids incrementally from a file-like
+    object or an iterator of chunks, e.g. requests' Response.iter_content.
+
+    The version and column lines of a grid are parsed first, rows are
+    then parsed one line at a time as they are iterated, so memory use does
+    not grow with the number of rows. Multiple grids (extended haystack)
+    are read one after the other.
+
+    Example:
+        reader = ZincStreamReader(open("his.zinc"))
+        grid = reader.readHeader()
+        for row in reader.iterRows():
+            print row.get("ts"), row.get("val")
+
+    """
+    def __init__(self, source, chunk_size=65536):
+        """ctor
 
-    def _readMeta(self, b):
-        """readMeta.
         Args:
-            b: HDictBuilder
-        """
-        while isIdStart(self.cur):
-            name = self._readId()
-            val = HMarker.VAL
-            self._skipSpace()
-            if self.cur == ':':
-                self._consume()
-                self._skipSpace()
-                val = self._readVal()
-                self._skipSpace()
-            b.add(name, val)
-            self._skipSpace()
+            source: file-like object with read(size), iterable of str chunks or str
+            chunk_size: size of reads from file-like source
+
+        """
+        if isinstance(source, basestring):
+            source = [source]
+        elif hasattr(source, "read"):
+            source = iter(lambda read=source.read: read(chunk_size), "")
+        self._lines = iter_lines(source, keepends=False)
+        self._pushed = None
+        self._inRows = False
+        self._scanner = ZincScanner("")
+        self.lineNum = 0
+        self.grid = None
+        # file opened by from_gzip
+        self._file = None
+
+    @classmethod
+    def from_gzip(cls, path, chunk_size=65536):
+        """Create reader for a gzip compressed zinc file, e.g. written by
+        ZincWriter.gridsToGzip. The file is decompressed as it is read.
+
+        The file is closed when it has been read completely, by close(),
+        or at the end of a with statement:
+
+            with ZincStreamReader.from_gzip("his.zinc.gz") as reader:
+                grids = list(reader.iterGrids())
+
+        Args:
+            path: path of the file
+            chunk_size: size of compressed reads from the file
+
+        Returns:
+            ZincStreamReader instance
+
+        """
+        f = open(path, 'rb')
+        reader = cls(decompress_chunks(read_chunks(f, chunk_size)))
+        reader._file = f
+        return reader
+
+    def close(self):
+        """Close the file of a reader created by from_gzip."""
+        if self._file is not None:
+            self._file.close()
 
-    def _readId(self):
-        if not isIdStart(self.cur):
-            self._err("Invalid name start char")
-        s = StringIO.StringIO()
-        while isId(self.cur):
-            s.write(self.cur)
-            self._consume()
-        ret = s.getvalue()
-        s.close()
-        return ret
+    def __enter__(self):
+        return self
 
+    def __exit__(self, *exc_info):
+        self.close()
 
+    def readHeader(self):
+        """Reads version/meta and column lines of the next grid.
+
+        Rows of the current grid which have not been iterated are skipped.
+
+        Returns:
+            HGrid instance with meta and cols but no rows,
+            None if there are no more grids in the stream
+
+        """
+        if self._inRows:
+            for cells in self.iterCells():
+                pass
+        line = self._readLine()
+        while line is not None and not line:
+            line = self._readLine()
+        if line is None:
+            self.grid = None
+            return None
+        cols = self._readLine()
+        if cols is None:
+            cols = ""
+        b = HGridBuilder()
+        ZincScanner("%s\n%s\n" % (line, cols), lineNum=self.lineNum - 1).readHeader(b)
+        self.grid = b.toGrid()
+        self._inRows = True
+        return self.grid
+
+    def iterCells(self):
+        """Generator of cell lists for the rows of the current grid.
+
+        Reads the header of the first grid if needed.
+        """
+        if self.grid is None and not self.readHeader():
+            return
+        numCols = self.grid.num_cols()
+        scanner = self._scanner
+        readLine = self._readLine
+        while self._inRows:
+            line = readLine()
+            if not line:
+                self._inRows = False
+            elif line.startswith("ver:"):
+                # next grid of multigrid without empty line separator
+                self._pushBack(line)
+                self._inRows = False
+            else:
+                scanner.buf = line
+                scanner.end = len(line)
+                scanner.lineNum = self.lineNum
+                yield scanner.readRow(0, scanner.end, numCols)
+
+    def iterRows(self):
+        """Generator of HRow instances for the rows of the current grid.
+
+        Rows refer to the header grid returned by readHeader.
+        """
+        for cells in self.iterCells():
+            yield HRow(self.grid.col_index, cells)
+
+    def readGrid(self):
+        """Reads the next grid including all of its rows.
+
+        Returns:
+            HGrid instance or None if there are no more grids in the stream
+
+        """
+        header = self.readHeader()
+        if header is None:
+            return None
+        return HGrid(header.meta, header.cols, list(self.iterCells()))
+
+    def iterGrids(self):
+        """Generator of the remaining grids of the stream, each grid
+        is read when it is requested.
+        """
+        grid = self.readGrid()
+        while grid is not None:
+            yield grid
+            grid = self.readGrid()
 
     ############################################################
-    ############################ HVals #########################
+    ######################### Implementation ###################
     ############################################################
 
-    def _readScalar(self):
-        """Read scalar value."""
-        val = self._readVal()
-        if self.cur >= 0:
-            self._err("Expected end of stream")
-
-    def _readVal(self):
-        """ Read a single scalar value from the stream."""
-        if isDigit(self.cur):
-            return self._readNumVal()
-        if isAlpha(self.cur):
-            return self._readWordVal()
-        if self.cur == '@':
-            return self._readRefVal()
-        elif self.cur == '"':
-            return self._readStrVal()
-        elif self.cur == '`':
-            return self._readUriVal()
-        elif self.cur == '-':
-            if self.peek == 'I':
-                return self._readWordVal()
-            else:
-                return self._readNumVal()
+    def _readLine(self):
+        if self._pushed is not None:
+            line, self._pushed = self._pushed, None
         else:
-            self._err("Unexpected char for start of value")
-
-    def _readRefVal(self):
-        self._consume()
-        s = StringIO.StringIO()
-        while is_id_char(self.cur):
-            if self.cur == "":
-                self._err("Unexpected end of ref literal")
-            if self.cur == "\n" or self.cur == "\r":
-                self._err("Unexpected newline of ref literal")
-            s.write(self.cur)
-            self._consume()
-        self._skipSpace()
-        dis = None
-        if self.cur == '"':
-            dis = self._readStrLiteral()
-        return HRef.make(s.getvalue(), dis)
+            line = next(self._lines, None)
+        if line is not None:
+            self.lineNum += 1
+        return line
+
+    def _pushBack(self, line):
+        self._pushed = line
+        self.lineNum -= 1
+
+def read_chunks(f, chunk_size):
+    """Generator of the chunks read from file f, the file is closed
+    when it has been read completely."""
+    try:
+        chunk = f.read(chunk_size)
+        while chunk:
+            yield chunk
+            chunk = f.read(chunk_size)
+    finally:
+        f.close()
 
+def decompress_chunks(chunks):
+    """Generator of the decompressed data of gzip or zlib compressed
+    chunks. Gzip streams of several members, as written by appending to
+    a gzip file, are decompressed as one stream.
 
-    def _readUriVal(self):
-        s = StringIO.StringIO()
-        # read string between backticks `...`
-        self._consume()
-        while self.cur != '`':
-            s.write(self.cur)
-            self._consume()
-        self._consume()
-        return HUri.make(s.getvalue())
+    Args:
+        chunks: iterable of compressed str chunks
 
+    """
+    # detect gzip or zlib header
+    wbits = 32 + zlib.MAX_WBITS
+    d = zlib.decompressobj(wbits)
+    for chunk in chunks:
+        while chunk:
+            data = d.decompress(chunk)
+            if data:
+                yield data
+            # data after the end of a gzip member is the next member
+            chunk = d.unused_data
+            if chunk:
+                d = zlib.decompressobj(wbits)
+    data = d.flush()
+    if data:
+        yield data
+
+class JsonReader(object):
+    """JsonReader reads grids in the haystack JSON encoding into typed HGrids.
+
+    Strings with a type prefix ("m:", "n:72.5 kW", "r:id dis",
+    "t:2015-06-08T15:47:41-04:00 New_York", ...) are decoded into the
+    corresponding HVal, other strings into HStr, JSON true/false into HBool.
+
+    A str or unicode payload is parsed at once by the JSON backend. Files
+    and chunk iterators are decoded incrementally: rows are decoded one
+    object at a time as they are iterated, so memory use does not grow with
+    the number of rows when meta and cols precede rows (as written by
+    JsonWriter). Multigrids, written as {"grids": [...]} or as a list of
+    grids, are read one grid after the other.
 
+    @see <a href='http://project-haystack.org/doc/Json'>Project Haystack</a>
 
-    def _readWordVal(self):
-        s = StringIO.StringIO()
-        while True:
-            s.write(self.cur)
-            self._consume()
-            try:
-                if not isAlpha(self.cur) and not isSpecialUnit(self.cur):
-                    break
-            except Exception, e:
-                self._err(e)
+    Example:
+        reader = JsonReader(open("points.json"))
+        grid = reader.readHeader()
+        for row in reader.iterRows():
+            print row.get("id"), row.get("curVal")
 
+    """
+    def __init__(self, source, chunk_size=65536, backend=None):
+        """ctor
 
-        word = s.getvalue()
+        Args:
+            source: str or unicode to parse, file-like object with
+                read(size) or iterable of str chunks
+            chunk_size: size of reads from file-like source
+            backend: JSON library, name or JsonBackend, see hs.jsonbackend;
+                by default the fastest importable one. Backends without
+                incremental parsing use the json module for files and chunks.
 
-        if self.is_filter:
-            if word == "true":
-                return HBool.TRUE
-            if word == "false":
-                return HBool.FALSE
-        else:
-            # this treats both of these None values properly as the same: ',N,' ',,'
-            # 2012-04-21T08:45:00-04:00 New_York,N,76.3
-            # 2012-04-21T08:45:00-04:00 New_York,,76.3
-            if word == "N" or word == "":
-                return None
-            elif word == "M":
-                return HMarker.VAL
-            elif word == "R":
-                return HStr.make("_remove_")
-            elif word == "T":
-                return HBool.TRUE
-            elif word == "F":
-                return HBool.FALSE
-            elif word == "Bin":
-                return self._readBinVal()
-            elif word == "C":
-                return self._readCoordVal()
-
-
-        if word == "NaN":
-            return HNum.NaN
-        elif word == "INF":
-            return HNum.POS_INF
-        elif word == "-INF":
-            return HNum.NEG_INF
-        self._err("Unknown value identifier: %s" % word)
-
-
-    def _readStrLiteral(self):
-        self._consume()
-        s = StringIO.StringIO()
-        while self.cur != '"':
-            if self.cur < 0:
-                self._err("Unexpected end of str literal")
-            if self.cur == '\n' or self.cur == '\r':
-                self._err("Unexpected newline in str literal")
-            if self.cur == '\\':
-                s.write(self._readEscChar())
-            else:
-                s.write(self.cur)
-                self._consume()
-        self._consume()
-        return s.getvalue()
-
-    def _readStrVal(self):
-        return HStr.make(self._readStrLiteral())
-
-    def _readNumVal(self):
-        # parse numeric part
-        s = StringIO.StringIO()
-        s.write(self.cur)
-        self._consume()
-        while isDigit(self.cur) or self.cur in [".", "_"]:
-            if self.cur != '_':
-                s.write(self.cur)
-            self._consume()
-            if self.cur in ['e', 'E']:
-                if self.peek in ['-', '+'] or isDigit(self.peek):
-                    s.write(self.cur)
-                    self._consume()
-                    s.write(self.cur)
-                    self._consume()
-        val = float(s.getvalue())
-
-        #  HDate - check for dash
-        date = None
-        time = None
-        hour = -1
-        if self.cur == "-":
-            try:
-                year = int(s.getvalue())
-            except Exception, ex:
-                self._err("Invalid year for date value: %s" % s)
-            self._consume()
-            month = self._readTwoDigits("Invalid digit for month in date value: %s" % s)
-            if self.cur != '-':
-                self._err("Expected '-' for date value: %s" % s)
-            self._consume()
-            day = self._readTwoDigits("Invalid digit for day in date value: %s" % s)
-            date = HDate.make(year, month, day)
-
-            if self.cur != 'T':
-                return date
-            self._consume()
-            hour = self._readTwoDigits("Invalid digit for hour in date time value")
-
-        # HTime - check for colon
-        if self.cur == ':':
-            if hour < 0:
-                if s.len != 2:
-                    self._err("Hour must be two digits for time value: %s" % s)
-                try:
-                    hour = int(s.getvalue())
-                except Exception, err:
-                    self._err("Invalid hour for time value: %s" % s)
-            self._consume()
-            min = self._readTwoDigits("Invalid digit for minute in time value")
-            if self.cur != ':':
-                self._err("Expected ':' for time value")
-            self._consume()
-            sec =     self._readTwoDigits("Invalid digit for seconds in time value")
-            ms = 0
-            if self.cur == '.':
-                self._consume()
-                places = 0
-                while isDigit(self.cur):
-                    ms = (ms*10) + (ord(self.cur) - ord('0'))
-                    self._consume()
-                    places += 1
-                if places == 1:
-                    ms *= 100
-                elif places == 2:
-                    ms *= 10
-                elif places == 3:
-                    pass
-                else:
-                    self._err("Too many digits for milliseconds in time value")
-
-            time = HTime.make(hour, min, sec, ms)
-            if date == None:
-                return time
-
-        zutc = False
-        if date != None:
-            tz_offset = 0
-            if self.cur == 'Z':
-                self._consume()
-                zutc = True
-            else:
-                neg = self.cur == '-'
-                if self.cur != '-' and self.cur != '+':
-                    self._err("Expected -/+ for timezone offset")
-                self._consume()
-                tz_hours = self._readTwoDigits("Invalid digit for timezone offset")
-                if self.cur != ':':
-                    self._err("Expected colon for timezone offset")
-                self._consume()
-                tz_mins = self._readTwoDigits("Invalid digit for timezone offset")
-                tz_offset = tz_hours * 3600 + tz_mins * 60
-                if neg:
-                    tz_offset = -tz_offset
-
-            # timezone name
-            if self.cur != ' ':
-                if not zutc:
-                    self._err("Expected space between timezone offset and name")
+        """
+        self.backend = get_backend(backend)
+        # payload parsed at once on the first read, and its grid objects
+        self._doc = None
+        self._docGrids = None
+        if isinstance(source, basestring):
+            self._doc = source
+            source = []
+        elif hasattr(source, "read"):
+            source = iter(lambda read=source.read: read(chunk_size), "")
+        self._chunks = iter(source)
+        self._buf = ""
+        self._pos = 0
+        self._rawDecode = self.backend.raw_decode or get_backend("json").raw_decode
+        self._scanner = ZincScanner("")
+        # None before the start of the payload, then True for multigrids
+        self._multi = None
+        self._grids = 0
+        self._inRows = False
+        self._rows = None
+        self._names = None
+        self.grid = None
+
+    def readGrids(self):
+        """Reads all grids from reader.
+
+        Returns:
+            list of HGrid instances
+
+        """
+        return list(self.iterGrids())
+
+    def iterGrids(self):
+        """Generator of the remaining grids of the reader, each grid
+        is read when it is requested.
+        """
+        grid = self.readGrid()
+        while grid is not None:
+            yield grid
+            grid = self.readGrid()
+
+    def readGrid(self):
+        """Reads the next grid including all of its rows.
+
+        Returns:
+            HGrid instance or None if there are no more grids
+
+        """
+        header = self.readHeader()
+        if header is None:
+            return None
+        return HGrid(header.meta, header.cols, list(self.iterCells()))
+
+    def readHeader(self):
+        """Reads meta and cols of the next grid.
+
+        Rows of the current grid which have not been iterated are skipped.
+
+        Returns:
+            HGrid instance with meta and cols but no rows,
+            None if there are no more grids
+
+        """
+        if self._inRows:
+            for cells in self.iterCells():
+                pass
+        if self._doc is not None:
+            if self._docGrids is None:
+                self._docGrids = iter(self._loadGrids(self._doc))
+                self._doc = ""
+            obj = next(self._docGrids, None)
+            if obj is None:
+                return self._end()
+            if not isinstance(obj, dict):
+                self._err("Expecting JSON object for grid")
+            rows = obj.get("rows")
+            self._rows = rows if rows is not None else []
+            self._inRows = True
+            return self._toHeader(obj.get("meta"), obj.get("cols"))
+        if self._multi is None:
+            if self._atEnd():
+                return self._end()
+            c = self._next()
+            if c == '[':
+                self._multi = True
+            elif c == '{':
+                key = self._readKey()
+                if key == "grids":
+                    self._expect(':')
+                    self._expect('[')
+                    self._multi = True
                 else:
-                    tz = HTimeZone.UTC
-            elif zutc and not (self.peek >= 'A' and self.peek <= 'Z' ):
-                tz = HTimeZone.UTC
+                    self._multi = False
+                    return self._readGrid(key)
             else:
-                self._consume()
-                if not isTz(self.cur):
-                    self._err("Expected timezone name")
-                s = StringIO.StringIO()
-                while isTz(self.cur):
-                    s.write(self.cur)
-                    self._consume()
-                tz = HTimeZone.make(s.getvalue())
-            return HDateTime.make(date, time, tz, tz_offset)
-
-        # this was not validated as time or date, it is then HNum
-        # if we have unit, parse that
-        unit = None
-        if isUnit(self.cur):
-            s = StringIO.StringIO()
-            while isUnit(self.cur):
-                s.write(self.cur)
-                self._consume()
-            unit = s.getvalue()
-        return HNum.make(val, unit);
-
-    def _readTwoDigits(self, errMsg):
-        if not isDigit(self.cur):
-            self._err(errMsg)
-        tens = (ord(self.cur) - ord('0')) * 10
-        self._consume()
-        if not isDigit(self.cur):
-            self._err(errMsg)
-        val = tens + (ord(self.cur) - ord('0'))
-        self._consume()
-        return val
+                self._err("Expecting JSON object or array")
+        elif not self._multi:
+            return self._end()
+        c = self._next()
+        if c == ']':
+            return self._end()
+        if self._grids:
+            if c != ',':
+                self._err("Expecting ',' or ']' after grid")
+            c = self._next()
+        if c != '{':
+            self._err("Expecting JSON object for grid")
+        return self._readGrid(self._readKey())
+
+    def iterCells(self):
+        """Generator of cell lists for the rows of the current grid.
+
+        Reads the header of the first grid if needed.
+        """
+        if self.grid is None and not self.readHeader():
+            return
+        names = self._names
+        decode = self._decodeVal
+        if self._rows is not None:
+            rows, self._rows = self._rows, None
+            self._inRows = False
+            for row in rows:
+                if type(row) is not dict:
+                    self._err("Expecting JSON object for row")
+                get = row.get
+                yield [decode(get(name)) for name in names]
+            return
+        next = self._next
+        first = True
+        while self._inRows:
+            c = next()
+            if c == ']':
+                self._inRows = False
+                self._readGridEnd()
+                return
+            if not first:
+                if c != ',':
+                    self._err("Expecting ',' or ']' after row")
+                c = next()
+            if c != '{':
+                self._err("Expecting JSON object for row")
+            first = False
+            self._pos -= 1
+            get = self._readValue().get
+            yield [decode(get(name)) for name in names]
+
+    def iterRows(self):
+        """Generator of HRow instances for the rows of the current grid.
+
+        Rows refer to the header grid returned by readHeader.
+        """
+        for cells in self.iterCells():
+            yield HRow(self.grid.col_index, cells)
 
-    def _readEscChar(self):
-        self._consume()
-        if self.cur == 'b':
-            self._consume()
-            return '\b'
-        elif self.cur == 'f':
-            self._consume()
-            return '\f'
-        elif self.cur == 'n':
-            self._consume()
-            return '\n'
-        elif self.cur == 'r':
-            self._consume()
-            return '\r'
-        elif self.cur == 't':
-            self._consume()
-            return '\t'
-        elif self.cur == '"':
-            self._consume()
-            return '"'
-        elif self.cur == '$':
-            self._consume()
-            return '$'
-        elif self.cur == '\\':
-            self._consume()
-            return '\\'
-
-        if self.cur == 'u':
-            self._consume()
-            n3 = self._toNibble(self.cur)
-            self._consume()
-            n2 = self._toNibble(self.cur)
-            self._consume()
-            n1 = self._toNibble(self.cur)
-            self._consume()
-            n0 = self._toNibble(self.cur)
-            self._consume()
-            return n3 << 12 | n2 << 8 | n1 << 4 | n0
-        self._err("Invalid hex char")
-
-    def _consumeNewLine(self):
-        if self.cur != "\n":
-            self._err("Expecting newline")
-        self._consume()
-
-    def _consume(self):
-        try:
-            self.cur = self.peek
-            self.peek = self.stream.read(1)
-            if self.cur == '\n':
-                self.lineNum += 1
-        except Exception, e:
-            self._err(e)
-
-
-    def _consumeCmp(self):
-        self._consume()
-        if self.cur == '=':
-            self._consume()
+    ############################################################
+    ######################### Implementation ###################
+    ############################################################
+
+    def _readGrid(self, key):
+        """Read keys of a grid object, starting with the first key, up to
+        the start of rows. Rows which precede meta or cols are buffered.
+        """
+        self._grids += 1
+        meta = cols = rows = None
+        while key is not None:
+            self._expect(':')
+            if key == "rows" and meta is not None and cols is not None:
+                self._expect('[')
+                self._inRows = True
+                break
+            val = self._readValue()
+            if key == "meta":
+                meta = val
+            elif key == "cols":
+                cols = val
+            elif key == "rows":
+                rows = val
+            key = self._readNextKey()
+        else:
+            self._inRows = rows is not None
+        self._rows = rows
+        return self._toHeader(meta, cols)
+
+    def _toHeader(self, meta, cols):
+        b = HGridBuilder()
+        for name, val in (meta or {}).iteritems():
+            # version of the haystack encoding, "ver:" by older JsonWriter
+            if name != "ver" and name != "ver:":
+                self._addTag(b.meta, name, val)
+        self._names = []
+        for col in cols or []:
+            name = col.get("name")
+            if not isinstance(name, basestring):
+                self._err("Expecting name of column")
+            colMeta = b.addCol(name)
+            for n, val in col.iteritems():
+                if n != "name":
+                    self._addTag(colMeta, n, val)
+            self._names.append(name)
+        self.grid = b.toGrid()
+        return self.grid
+
+    def _loadGrids(self, s):
+        """Parse complete payload, return list of grid objects."""
+        if not s.strip():
+            return []
+        doc = self.backend.loads(s)
+        if isinstance(doc, list):
+            return doc
+        if isinstance(doc, dict) and "grids" in doc and "cols" not in doc:
+            return doc["grids"]
+        return [doc]
+
+    def _readGridEnd(self):
+        # keys after rows are ignored
+        while self._readNextKey() is not None:
+            self._expect(':')
+            self._readValue()
+
+    def _end(self):
+        self.grid = None
+        return None
+
+    def _addTag(self, b, name, val):
+        val = self._decodeVal(val)
+        if val is not None:
+            b.add(name, val)
+
+    def _decodeVal(self, val):
+        t = type(val)
+        if t is unicode or t is str:
+            if val[1:2] == ':':
+                decoder = JSON_DECODERS.get(val[0])
+                if decoder is None:
+                    raise ValueError("Unsupported JSON value type: %s" % val[:80])
+                return decoder(self, val)
+            return HStr(val)
+        if val is None:
+            return None
+        if t is bool:
+            return HBool.TRUE if val else HBool.FALSE
+        if t is int or t is long or t is float:
+            return HNum(float(val))
+        raise ValueError("Unsupported JSON value: %r" % (val,))
+
+    def _decodeNum(self, s):
+        num, _, unit = s[2:].partition(' ')
+        return HNum(float(num), unit or None)
+
+    def _decodeRef(self, s):
+        val, sep, dis = s[2:].partition(' ')
+        return HRef.make(val, dis if sep else None)
+
+    def _decodeZinc(self, s):
+        return self._scanner.readScalar(s, 2)
+
+    def _readKey(self):
+        """Read object key, the opening brace has been consumed.
+        Returns None at the end of an empty object."""
+        c = self._next()
+        if c == '}':
+            return None
+        if c != '"':
+            self._err("Expecting object key")
+        self._pos -= 1
+        return self._readValue()
+
+    def _readNextKey(self):
+        """Read object key after a value, None at the end of the object."""
+        c = self._next()
+        if c == '}':
+            return None
+        if c != ',':
+            self._err("Expecting ',' or '}' in object")
+        return self._readKey()
+
+    def _readValue(self):
+        """Decode a complete JSON value at the current position."""
+        self._skipSpace()
+        while True:
+            try:
+                val, pos = self._rawDecode(self._buf, self._pos)
+            except ValueError:
+                # value may continue in the next chunks, read at least as
+                # much as is pending to keep retries linear
+                if not self._fill(len(self._buf) - self._pos):
+                    raise
+                continue
+            if pos == len(self._buf) and self._fill(1):
+                # a number may continue in the next chunk
+                continue
+            self._pos = pos
+            return val
+
+    def _next(self):
+        """Consume and return the next non-whitespace character."""
         self._skipSpace()
+        c = self._buf[self._pos]
+        self._pos += 1
+        return c
+
+    def _expect(self, expected):
+        if self._next() != expected:
+            self._err("Expecting '%s'" % expected)
 
     def _skipSpace(self):
-        while self.cur == ' ' or self.cur == '\t':
-            self._consume()
+        if self._atEnd():
+            self._err("Unexpected end of JSON payload")
+
+    def _atEnd(self):
+        """Skip whitespace, return True at the end of the payload."""
+        while True:
+            self._pos = JSON_SPACE_RE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return False
+            if not self._fill(1):
+                return True
+
+    def _fill(self, size):
+        """Append chunks of the source to the buffer.
 
+        Returns:
+            False if the source is exhausted
+        """
+        chunks = [self._buf[self._pos:]]
+        self._pos = 0
+        read = 0
+        for chunk in self._chunks:
+            chunks.append(chunk)
+            read += len(chunk)
+            if read >= size:
+                break
+        self._buf = "".join(chunks)
+        return read > 0
 
     def _err(self, msg):
-        s = "%s [Line %d]" % (msg, self.lineNum)
-        s += "; follows: %s" % self.stream.getvalue()[self.stream.tell():]
-        raise ValueError(s)
+        raise ValueError("%s; follows: %s" % (msg, self._buf[self._pos:self._pos + 80]))
+
+JSON_SPACE_RE = re.compile(r'[ \t\n\r]*')
+
+# decoders of JSON string values by their type prefix, e.g. "n:" for numbers
+JSON_DECODERS = {
+    'm': lambda reader, s: HMarker.VAL,
+    '-': lambda reader, s: HStr.make("_remove_"),
+    's': lambda reader, s: HStr(s[2:]),
+    'u': lambda reader, s: HUri(s[2:]),
+    'n': JsonReader._decodeNum.im_func,
+    'r': JsonReader._decodeRef.im_func,
+    'd': JsonReader._decodeZinc.im_func,
+    'h': JsonReader._decodeZinc.im_func,
+    't': JsonReader._decodeZinc.im_func,
+    # coord, bin and xstr values have no HVal type, they are kept as
+    # HStr of the encoded value, e.g. "c:37.55,-77.45"
+    'c': lambda reader, s: HStr(s),
+    'b': lambda reader, s: HStr(s),
+    'x': lambda reader, s: HStr(s),
+}
+
+class CsvReader(object):
+    """CsvReader reads grids in comma separated values format, as written
+    by CsvWriter, into HGrids.
+
+    Rows are parsed by the csv module one line at a time as they are
+    iterated, so memory use does not grow with the number of rows.
+    Quoting follows RFC 4180: quoted cells may contain the delimiter,
+    newlines, leading or trailing whitespace and doubled quotes.
+
+    The first row of a grid holds the column labels, labels which are
+    not tag names are converted with to_tag_name and kept as the dis
+    meta of the column. Grids of a multigrid are separated by an empty
+    line (see CsvWriter.writeGrids).
+
+    The type of each column is inferred from the first rows of the grid:
+    a column is decoded as markers (✓), bools (T/F, true/false), numbers
+    with units, refs, dates, times or datetimes when all non-empty cells of
+    those rows are of that kind, zinc encoding is used for numbers, refs
+    and dates. Cells of columns mixing these kinds are decoded one by one.
+    Other columns, and cells which can not be decoded, are read as HStr.
+    Empty cells are null.
+
+    @see <a href='http://project-haystack.org/doc/Csv'>Project Haystack</a>
+
+    Example:
+        reader = CsvReader(open("points.csv"))
+        grid = reader.readHeader()
+        for row in reader.iterRows():
+            print row.get("id"), row.get("curVal")
 
-    def _toNibble(self, c):
-        cc = ord(c)
-        if c >= ord('0') and c <= ord('9'): return cc - ord('0')
-        if c >= ord('a') and c <= ord('f'): return cc - ord('a') + 10
-        if c >= ord('A') and c <= ord('Z'): return cc - ord('A') + 10
-        self._err("Invalid hex char")
+    """
+    def __init__(self, source, delimiter=',', infer_rows=100):
+        """ctor
 
-############################################################
-######################### Char Types #######################
-############################################################
+        Args:
+            source: str or unicode to parse, file-like object or iterable
+                of str chunks; unicode is read as utf-8
+            delimiter: cell delimiter
+            infer_rows: number of rows used to infer the column types,
+                0 to read all cells as HStr
 
-def isDigit(c):
-    if c == "":
-        return False
-    cc = ord(c)
-    return cc > 0 and cc < 128 and (CHAR_TYPES[cc] & DIGIT) != 0
-
-def isAlpha(c):
-    if c == "":
-        return False
-    cc = ord(c)
-    return cc > 0 and cc < 128 and (CHAR_TYPES[cc] & ALPHA) != 0
-
-def isUnit(c):
-    if c == "":
-        return False
-    cc = ord(c)
-    return cc > 0 and cc < 128 and (CHAR_TYPES[cc] & UNIT) != 0
-
-def isTz(c):
-    if c == "":
-        return False
-    cc = ord(c)
-    return cc > 0 and cc < 128 and (CHAR_TYPES[cc] & TZ) != 0
-
-def isIdStart(c):
-    if c == "":
-        return False
-    cc = ord(c)
-    return cc > 0 and cc < 128 and (CHAR_TYPES[cc] & ID_START) != 0
-
-def isId(c):
-    if c == "":
-        return False
-    cc = ord(c)
-    return cc > 0 and cc < 128 and (CHAR_TYPES[cc] & ID) != 0
-
-def isSpecialUnit(c):
-    if c == "":
-        return False
-    #ret = c in SPECIAL_UNIT_CHARS
+        """
+        if isinstance(source, unicode):
+            source = source.encode('utf-8')
+        if isinstance(source, str):
+            source = StringIO.StringIO(source)
+        elif not hasattr(source, "read"):
+            source = iter_lines(source)
+        self._reader = csv.reader(source, delimiter=delimiter)
+        self.infer_rows = infer_rows
+        self._scanner = ZincScanner("")
+        self._pending = []
+        self._inRows = False
+        self._decoders = None
+        self.grid = None
 
-    try:
-        ret = c in SPECIAL_UNIT_CHARS
-    except:
-        #source = unicode(c, 'utf-8')
-        # ascii decode fail, first encode in utf-8
-        source = c.encode("utf-8")
-        ret = source in SPECIAL_UNIT_CHARS
-    return ret
+    def readGrids(self):
+        """Reads all grids from reader.
+
+        Returns:
+            list of HGrid instances
+
+        """
+        return list(self.iterGrids())
+
+    def iterGrids(self):
+        """Generator of the remaining grids of the reader, each grid
+        is read when it is requested.
+        """
+        grid = self.readGrid()
+        while grid is not None:
+            yield grid
+            grid = self.readGrid()
+
+    def readGrid(self):
+        """Reads the next grid including all of its rows.
+
+        Returns:
+            HGrid instance or None if there are no more grids
+
+        """
+        header = self.readHeader()
+        if header is None:
+            return None
+        return HGrid(header.meta, header.cols, list(self.iterCells()))
+
+    def readHeader(self):
+        """Reads the column labels of the next grid and infers the types
+        of the columns from its first rows.
+
+        Rows of the current grid which have not been iterated are skipped.
+
+        Returns:
+            HGrid instance with cols but no rows,
+            None if there are no more grids
+
+        """
+        if self._inRows:
+            for cells in self.iterCells():
+                pass
+        labels = self._readLine()
+        while labels is not None and not labels:
+            labels = self._readLine()
+        if labels is None:
+            self.grid = None
+            return None
 
-CHAR_TYPES = [0] * 128
-DIGIT    = 0x01
-ALPHA_LO = 0x02
-ALPHA_UP = 0x04
-ALPHA    = ALPHA_UP | ALPHA_LO
-UNIT     = 0x08
-TZ       = 0x10
-ID_START = 0x20
-ID       = 0x40
-SPECIAL_UNIT_CHARS = "²"
-
-def _init_chartypes():
-    for i in range(ord('a'), ord('z')+1):
-        CHAR_TYPES[i] = ALPHA_LO | UNIT | TZ | ID_START | ID
-    for i in range(ord('A'), ord('Z')+1):
-        CHAR_TYPES[i] = ALPHA_UP | UNIT | TZ | ID
-    for i in range(ord('0'), ord('9')+1):
-        CHAR_TYPES[i] = DIGIT | TZ | ID
-
-    CHAR_TYPES[ord('%')] = UNIT
-    CHAR_TYPES[ord('_')] = UNIT | TZ | ID
-    CHAR_TYPES[ord('/')] = UNIT
-    CHAR_TYPES[ord('$')] = UNIT
-    #CHAR_TYPES[ord('²')] = UNIT
-    CHAR_TYPES[ord('-')] = TZ
-    CHAR_TYPES[ord('+')] = TZ
-
-
-
-_init_chartypes()
+        b = HGridBuilder()
+        names = set()
+        for label in labels:
+            name = label if istagname(label) else to_tag_name(label)
+            unique = name
+            i = 1
+            while unique in names:
+                i += 1
+                unique = "%s%d" % (name, i)
+            names.add(unique)
+            meta = b.addCol(unique)
+            if unique != label:
+                meta.add("dis", label)
+        self.grid = b.toGrid()
+        self._numCols = len(labels)
+
+        # rows used for inference are read ahead
+        sample = []
+        while len(sample) < self.infer_rows:
+            cells = self._readLine()
+            if not cells:
+                self._pending.append(cells)
+                break
+            sample.append(cells)
+        self._pending[:0] = sample
+        kinds = [self._inferKind([cells[i] for cells in sample if i < len(cells)])
+                 for i in range(self._numCols)]
+        self._decoders = [CSV_DECODERS[kind] for kind in kinds]
+        self._inRows = True
+        return self.grid
+
+    def iterCells(self):
+        """Generator of cell lists for the rows of the current grid.
+
+        Reads the header of the first grid if needed.
+        """
+        if self.grid is None and not self.readHeader():
+            return
+        decoders = self._decoders
+        numCols = self._numCols
+        readLine = self._readLine
+        while self._inRows:
+            cells = readLine()
+            if not cells:
+                self._inRows = False
+                return
+            if len(cells) != numCols:
+                if len(cells) > numCols:
+                    raise ValueError("Row has %d cells, expected %d [Line %d]" % (
+                        len(cells), numCols, self._reader.line_num))
+                cells.extend([''] * (numCols - len(cells)))
+            yield [decode(self, s) for decode, s in zip(decoders, cells)]
+
+    def iterRows(self):
+        """Generator of HRow instances for the rows of the current grid.
+
+        Rows refer to the header grid returned by readHeader.
+        """
+        for cells in self.iterCells():
+            yield HRow(self.grid.col_index, cells)
+
+    ############################################################
+    ######################### Implementation ###################
+    ############################################################
+
+    def _readLine(self):
+        """Return cells of the next line, [] for an empty line,
+        None at the end of the source."""
+        if self._pending:
+            return self._pending.pop(0)
+        return next(self._reader, None)
+
+    def _inferKind(self, cells):
+        kinds = set([self._cellKind(s) for s in cells if s])
+        if len(kinds) == 1:
+            return kinds.pop()
+        # columns of mixed types, e.g. bools and numbers, decode each cell
+        return HVal if kinds and HStr not in kinds else HStr
+
+    def _cellKind(self, s):
+        if s in CSV_MARKERS:
+            return HMarker
+        if s in CSV_BOOLS:
+            return HBool
+        if s[0] in CSV_ZINC_START or s in CSV_NUM_WORDS:
+            try:
+                val = self._scanner.readScalar(s)
+            except ValueError:
+                return HStr
+            if type(val) in CSV_ZINC_KINDS:
+                return type(val)
+        return HStr
+
+    def _decodeStr(self, s):
+        return HStr(s) if s else None
+
+    def _decodeMarker(self, s):
+        if s in CSV_MARKERS:
+            return HMarker.VAL
+        return HStr(s) if s else None
+
+    def _decodeBool(self, s):
+        val = CSV_BOOLS.get(s)
+        if val is None and s:
+            return HStr(s)
+        return val
+
+    def _decodeAny(self, s):
+        if s in CSV_MARKERS:
+            return HMarker.VAL
+        val = CSV_BOOLS.get(s)
+        if val is not None:
+            return val
+        return self._decodeZinc(s)
+
+    def _decodeZinc(self, s):
+        if not s:
+            return None
+        try:
+            return self._scanner.readScalar(s)
+        except ValueError:
+            return HStr(s)
+
+CSV_MARKERS = frozenset([HMarker.JSON_VALUE, HMarker.JSON_VALUE.encode('utf-8')])
+CSV_BOOLS = {'T': HBool.TRUE, 'F': HBool.FALSE, 'true': HBool.TRUE, 'false': HBool.FALSE}
+# first characters of cells which may be zinc encoded values
+CSV_ZINC_START = frozenset('@`-0123456789')
+CSV_NUM_WORDS = frozenset(['INF', 'NaN'])
+CSV_ZINC_KINDS = frozenset([HNum, HRef, HUri, HDate, HTime, HDateTime])
+
+# decoders of cells by the kind of their column
+CSV_DECODERS = {
+    HStr: CsvReader._decodeStr.im_func,
+    HMarker: CsvReader._decodeMarker.im_func,
+    HBool: CsvReader._decodeBool.im_func,
+    HVal: CsvReader._decodeAny.im_func,
+}
+CSV_DECODERS.update(dict.fromkeys(CSV_ZINC_KINDS, CsvReader._decodeZinc.im_func))
+
+def iter_lines(chunks, keepends=True):
+    """Generator of the lines of an iterable of str chunks.
+
+    Parts of a line spread over several chunks are joined once, when the
+    end of the line is read.
+
+    Args:
+        chunks: iterable of str chunks
+        keepends: include the line ends in the lines
+
+    """
+    parts = []
+    for chunk in chunks:
+        if not chunk:
+            continue
+        lines = chunk.split("\n")
+        if len(lines) == 1:
+            parts.append(chunk)
+            continue
+        if parts:
+            parts.append(lines[0])
+            lines[0] = "".join(parts)
+            parts = []
+        pending = lines.pop()
+        if pending:
+            parts.append(pending)
+        if keepends:
+            for line in lines:
+                yield line + "\n"
+        else:
+            for line in lines:
+                yield line
+    if parts:
+        yield "".join(parts)
 
 
 
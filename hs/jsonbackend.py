@@ -0,0 +1,101 @@
+""" Pluggable JSON library used by JsonReader, JsonWriter and HClient.
+
+Accelerated JSON libraries are used when they are importable, the
+standard library json module otherwise:
+
+    simplejson (with its C speedups), ujson, json
+
+A backend may be selected by name for a reader, writer or client,
+e.g. JsonReader(payload, backend="ujson").
+"""
+import json
+from json.encoder import encode_basestring_ascii
+
+
+class JsonBackend(object):
+    """Functions of a JSON library used by pyhs."""
+
+    def __init__(self, name, loads, encode_str, raw_decode=None):
+        """ctor
+        Args:
+            name: name of the backend
+            loads: function parsing a complete JSON document
+            encode_str: function encoding a str or unicode as JSON string literal
+            raw_decode: function(s, idx) parsing the JSON value at index idx of s,
+                returning the value and the index after it; None when the
+                library can not parse incrementally
+        """
+        self.name = name
+        self.loads = loads
+        self.encode_str = encode_str
+        self.raw_decode = raw_decode
+
+    def __repr__(self):
+        return "JsonBackend(%s)" % self.name
+
+
+def _stdlib():
+    return JsonBackend("json", json.loads, encode_basestring_ascii,
+                       json.JSONDecoder().raw_decode)
+
+def _simplejson():
+    import simplejson
+    # raises ImportError when simplejson is installed without its C extension
+    from simplejson import _speedups
+    return JsonBackend("simplejson", simplejson.loads,
+                       simplejson.encoder.encode_basestring_ascii,
+                       simplejson.JSONDecoder().raw_decode)
+
+def _ujson():
+    import ujson
+    return JsonBackend("ujson", ujson.loads,
+                       lambda s: ujson.dumps(s, escape_forward_slashes=False))
+
+# backend factories by name, in order of preference
+BACKENDS = [
+    ("simplejson", _simplejson),
+    ("ujson", _ujson),
+    ("json", _stdlib),
+]
+
+_loaded = {}
+_default = None
+
+
+def get_backend(backend=None):
+    """Return JSON backend.
+
+    Args:
+        backend: name of a backend, JsonBackend instance or None for
+            the default, the first importable backend of BACKENDS
+    Returns:
+        JsonBackend instance
+    Raises:
+        ImportError if the named library is not installed
+    """
+    global _default
+    if isinstance(backend, JsonBackend):
+        return backend
+    if backend is None:
+        if _default is None:
+            _default = get_backend(available_backends()[0])
+        return _default
+    b = _loaded.get(backend)
+    if b is None:
+        factories = dict(BACKENDS)
+        if backend not in factories:
+            raise ValueError("Unknown JSON backend: %s" % backend)
+        b = _loaded[backend] = factories[backend]()
+    return b
+
+
+def available_backends():
+    """Return names of the importable backends, in order of preference."""
+    names = []
+    for name, factory in BACKENDS:
+        try:
+            get_backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
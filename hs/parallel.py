@@ -0,0 +1,114 @@
+# coding: utf8
+""" Parallel parsing of zinc payloads in worker processes.
+
+The parent process reads the header of each grid and splits the rows of
+the grids into row-aligned chunks of text. Chunks are parsed by worker
+processes, which return the rows as binary grid payloads (see hs.binary):
+those are small and decode several times faster than zinc, the parent
+only decodes them and concatenates the columns, in the order of the chunks.
+"""
+import gc
+import multiprocessing
+from grid import HGridBuilder, HGrid, HColumnGrid
+from scanner import ZincScanner
+
+# payloads smaller than this (in characters) are parsed serially
+PARALLEL_THRESHOLD = 1 << 20
+
+# rows of a grid are not split into chunks smaller than this
+MIN_CHUNK_SIZE = 1 << 18
+
+
+def read_grids_parallel(buf, ranges, executor=None, workers=None, chunk_size=None, columnar=False):
+    """Parse the grids in the given ranges of buf in worker processes.
+
+    Args:
+        buf: buffer with the zinc payload
+        ranges: list of (start, end) ranges of the grids, see grid_ranges
+        executor: object with a map(func, iterable) method, such as
+            multiprocessing.Pool; by default a pool of worker processes
+            is used for the call
+        workers: number of worker processes, default is the number of cpus;
+            without executor, grids are parsed serially if this is 1
+        chunk_size: max size of the rows text sent to a worker, by default
+            the payload is split into about four chunks per worker
+        columnar: return HColumnGrid instances, see ZincReader.readGrid
+
+    Returns:
+        list of HGrid instances
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if executor is None and workers <= 1:
+        return [ZincScanner(buf, start, end).readGrid(columnar) for start, end in ranges]
+    if chunk_size is None:
+        total = sum(end - start for start, end in ranges)
+        chunk_size = max(MIN_CHUNK_SIZE, total / (workers * 4))
+
+    headers = []
+    tasks = []
+    owners = []
+    for start, end in ranges:
+        b = HGridBuilder()
+        pos = ZincScanner(buf, start, end).readHeader(b)
+        headers.append(b.toGrid())
+        names = [col.name for col in b.cols]
+        rowsEnd = buf.find('\n\n', pos - 1, end)
+        rowsEnd = end if rowsEnd < 0 else rowsEnd + 1
+        # rows start on the third line of a grid
+        lineNum = 3
+        while pos < rowsEnd:
+            chunkEnd = rowsEnd
+            if rowsEnd - pos > chunk_size:
+                chunkEnd = buf.find('\n', pos + chunk_size, rowsEnd) + 1 or rowsEnd
+            text = buf[pos:chunkEnd]
+            tasks.append((text, names, lineNum))
+            owners.append(len(headers) - 1)
+            lineNum += text.count('\n')
+            pos = chunkEnd
+
+    if executor is None:
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(_read_rows, tasks, 1)
+        finally:
+            pool.terminate()
+    else:
+        results = list(executor.map(_read_rows, tasks))
+
+    from binary import BinaryReader
+    # cells of each column of each grid, number of rows of each grid
+    columns = [[[] for col in header.cols] for header in headers]
+    numRows = [0] * len(headers)
+    # the merge allocates many acyclic objects, cyclic garbage
+    # collection would only walk them over and over
+    gcEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        for owner, payload in zip(owners, results):
+            chunk = BinaryReader(payload).readGrid(columnar=True)
+            n = chunk.num_rows()
+            for cells, chunkCells in zip(columns[owner], chunk.col_slices(0, n)):
+                cells.extend(chunkCells)
+            numRows[owner] += n
+        grids = []
+        for header, cols, n in zip(headers, columns, numRows):
+            if columnar:
+                grids.append(HColumnGrid(header.meta, header.cols, cols, n))
+            else:
+                grids.append(HGrid(header.meta, header.cols, zip(*cols) if cols else [()] * n))
+        return grids
+    finally:
+        if gcEnabled:
+            gc.enable()
+
+
+def _read_rows(task):
+    """Worker: parse a chunk of row lines into a binary grid payload."""
+    from binary import BinaryWriter
+    text, names, lineNum = task
+    b = HGridBuilder()
+    for name in names:
+        b.addCol(name)
+    ZincScanner(text, 0, len(text), lineNum).readRows(b.rows, len(names), 0, len(text))
+    return BinaryWriter.gridToString(b.toGrid(columnar=True))
@@ -0,0 +1,707 @@
+# coding: utf8
+""" Regex based zinc scanner used by ZincReader.
+
+The scanner works on an index range [start, end) of a single buffer
+and matches whole tokens (numbers, strings, refs, dates/times) with
+precompiled regular expressions, instead of consuming the payload one
+character at a time.
+
+Rows in zinc never span lines (str literals can not contain a raw
+newline), so rows are scanned line by line with the line end as the
+upper bound for all token matches.
+"""
+import array
+import datetime
+import math
+import re
+from grid import HGridBuilder, HDictBuilder, HHisGrid, HLazyGrid, TS_TYPECODE, EPOCH_ORDINAL, epoch_millis
+from val import HMarker, HBool, HStr, HNum, HDate, HRef, HTime, HTimeZone, HDateTime, HUri
+
+############################################################
+########################## Tokens ##########################
+############################################################
+
+ID_RE = re.compile(r'[a-z][a-zA-Z0-9_]*')
+SPACE_RE = re.compile(r'[ \t]*')
+NUM_RE = re.compile(r'-?[0-9][0-9_]*(?:\.[0-9_]*)?(?:[eE][-+]?[0-9]+)?([a-zA-Z%_/$\x80-\xff]*)')
+DATE_RE = re.compile(r'([0-9]{4})-([0-9]{2})-([0-9]{2})')
+TIME_RE = re.compile(r'([0-9]{2}):([0-9]{2}):([0-9]{2})(?:\.([0-9]+))?')
+DATETIME_RE = re.compile(
+    r'([0-9]{4})-([0-9]{2})-([0-9]{2})T([0-9]{2}):([0-9]{2}):([0-9]{2})(?:\.([0-9]+))?'
+    r'(?:Z|([-+])([0-9]{2}):([0-9]{2}))(?: ([a-zA-Z0-9_+\-]+))?')
+# common datetime layout: date, time of day and zone with timezone name,
+# other layouts and errors are handled with DATETIME_RE
+FIXED_DATETIME_RE = re.compile(
+    r'([0-9]{4}-[0-9]{2}-[0-9]{2})T([0-9]{2}:[0-9]{2}:[0-9]{2}(?:\.[0-9]{1,3})?)'
+    r'(Z(?: [A-Z][a-zA-Z0-9_+\-]*)?|[-+][0-9]{2}:[0-9]{2} [A-Z][a-zA-Z0-9_+\-]*)')
+STR_RE = re.compile(r'"([^"\\\n\r]*)"')
+STR_ESC_RE = re.compile(r'"((?:[^"\\\n\r]|\\.)*)"')
+ESC_RE = re.compile(r'\\(u[0-9a-fA-F]{4}|.)')
+REF_RE = re.compile(r'@([a-zA-Z0-9_:\-.~]+)[ \t]*')
+URI_RE = re.compile(r'`([^`\n]*)`')
+WORD_RE = re.compile(r'-?[a-zA-Z]+')
+# common history row: timestamp with tz name, then an optional number
+HIS_ROW_RE = re.compile(
+    r'([0-9]{4}-[0-9]{2}-[0-9]{2})T([0-9]{2}:[0-9]{2}:[0-9]{2})(?:\.([0-9]{1,3}))?'
+    r'(Z|[-+][0-9]{2}:[0-9]{2}) ([A-Z][a-zA-Z0-9_+\-]*),'
+    r'(?:(-?[0-9]+(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?)([a-zA-Z%_/$\x80-\xff]*))?\n')
+# raw text of a single cell, used to skip cells without decoding them
+CELL_RE = re.compile(r'(?:"(?:[^"\\\n]|\\.)*"|`[^`\n]*`|[^,"`\n])*')
+
+ESC_CHARS = {
+    'b': '\b',
+    'f': '\f',
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+    '"': '"',
+    '$': '$',
+    '\\': '\\',
+}
+
+# scale of parsed millisecond digits by number of places
+MS_SCALE = (None, 100, 10, 1)
+
+# max number of entries in each of the datetime part caches of a scanner
+MAX_DATETIME_CACHE = 10000
+
+# sentinel to distinguish unknown words from the null word 'N'
+_UNKNOWN = object()
+
+WORDS = {
+    'N': None,
+    'M': HMarker.VAL,
+    'T': HBool.TRUE,
+    'F': HBool.FALSE,
+    'NaN': HNum.NaN,
+    'INF': HNum.POS_INF,
+    '-INF': HNum.NEG_INF,
+}
+
+DIGITS = '0123456789'
+
+LEADING_SPACE_RE = re.compile(r'\s*')
+
+# grids of a multigrid payload start with a version line
+GRID_START = 'ver:'
+
+
+def grid_ranges(buf, start=0, end=None):
+    """Find the (start, end) offsets of the grids in a zinc payload.
+
+    Str literals can not contain a raw newline and no value starts with
+    'v', so every line starting with 'ver:' starts a new grid. The buffer
+    is scanned once and not copied. Text before the first grid other
+    than whitespace is ignored. If there is no grid, the whole range is
+    returned as one range (e.g. for a dict).
+
+    Args:
+        buf: buffer to scan (str, unicode or mmap)
+        start: index to start at
+        end: index to end at, default is end of buffer
+    Returns:
+        list of (start, end) tuples
+    """
+    if end is None:
+        end = len(buf)
+    first = LEADING_SPACE_RE.match(buf, start, end).end()
+    starts = []
+    if buf[first:first + 4] == GRID_START:
+        starts.append(first)
+    pos = buf.find('\n' + GRID_START, first, end)
+    while pos >= 0:
+        starts.append(pos + 1)
+        pos = buf.find('\n' + GRID_START, pos + 1, end)
+    if not starts:
+        return [(start, end)]
+    return zip(starts, starts[1:] + [end])
+
+
+class ZincScanner(object):
+    """ZincScanner parses a single zinc grid or dict from
+    an index range of a buffer.
+
+    The buffer may be any object supporting slicing, find and regex
+    matching (str, unicode or mmap).
+    """
+
+    def __init__(self, buf, start=0, end=None, lineNum=1):
+        """ctor
+        Args:
+            buf: buffer to scan
+            start: index of first character of the grid or dict
+            end: index after the last character, default is end of buffer
+            lineNum: line number of start, used for error messages
+        """
+        self.buf = buf
+        self.start = start
+        self.end = len(buf) if end is None else end
+        self.pos = start
+        self.lineNum = lineNum
+        # date, time of day and zone strings of datetimes -> decoded parts,
+        # these repeat for most values of a payload
+        self._dates = {}
+        self._times = {}
+        self._zones = {}
+
+    def readGrid(self, columnar=False):
+        """Reads a grid from the scanned range.
+
+        Args:
+            columnar: see HGridBuilder.toGrid
+        Returns:
+            HGrid instance
+        """
+        b = HGridBuilder()
+        self.pos = self.readHeader(b)
+        self.pos = self.readRows(b.rows, len(b.cols), self.pos, self.end)
+        return b.toGrid(columnar)
+
+    def readLazyGrid(self, cache_size=None):
+        """Reads the grid header and indexes the row boundaries,
+        cells are decoded when they are accessed.
+
+        Args:
+            cache_size: max number of decoded rows kept by the grid
+        Returns:
+            HLazyGrid instance
+        """
+        b = HGridBuilder()
+        pos = self.readHeader(b)
+        rowIndex = ZincRowIndex(self, len(b.cols), pos)
+        self.pos = rowIndex.endPos
+        header = b.toGrid()
+        return HLazyGrid(header.meta, header.cols, rowIndex, cache_size)
+
+    def readHis(self):
+        """Reads a history grid with ts and val columns into typed arrays.
+
+        Common rows are decoded straight from the buffer without creating
+        HVal instances, other rows, and rows which change the unit or have
+        an out of range time of day, are read as cells and converted. All
+        timestamps must have the same timezone and all numbers the same
+        unit, or no unit; NaN, INF and -INF, which zinc writes without
+        unit, may be mixed with numbers of any unit.
+
+        Returns:
+            HHisGrid instance
+        """
+        b = HGridBuilder()
+        pos = self.readHeader(b)
+        if [col.name for col in b.cols] != ["ts", "val"]:
+            self._err("Expecting history grid with ts,val columns", self.start)
+
+        ts = array.array(TS_TYPECODE)
+        offsets = array.array('i')
+        vals = array.array('d')
+        tz = None
+        # unit of the numbers, '' for numbers without unit, None before the first number
+        unit = None
+        # parsed date, time of day and offset strings, these repeat for most rows
+        days = {}
+        secs = {}
+        zones = {'Z': 0}
+        nan = float('nan')
+        s = self.buf
+        end = self.end
+        match = HIS_ROW_RE.match
+        while pos < end and s[pos] != '\n':
+            m = match(s, pos, end)
+            if m is not None:
+                date, time, frac, zone, tzname, num, numUnit = m.groups()
+                sec = secs.get(time)
+                if sec is None:
+                    hour, minute, second = int(time[:2]), int(time[3:5]), int(time[6:])
+                    if hour < 24 and minute < 60 and second < 60:
+                        sec = secs[time] = hour * 3600 + minute * 60 + second
+                if sec is None or (num is not None and numUnit != unit and unit is not None):
+                    # rejected by the general path below
+                    m = None
+            if m is not None:
+                day = days.get(date)
+                if day is None:
+                    try:
+                        day = datetime.date(int(date[:4]), int(date[5:7]), int(date[8:])).toordinal()
+                    except ValueError, e:
+                        self._err("Invalid date value: %s" % e, pos)
+                    day = days[date] = day - EPOCH_ORDINAL
+                offset = zones.get(zone)
+                if offset is None:
+                    offset = (int(zone[1:3]) * 3600 + int(zone[4:6]) * 60) * (-1 if zone[0] == '-' else 1)
+                    zones[zone] = offset
+                millis = (day * 86400 + sec - offset) * 1000
+                if frac:
+                    millis += int(frac) * MS_SCALE[len(frac)]
+                if tzname != tz:
+                    if tz is not None:
+                        self._err("Mixed timezones in history grid: %s, %s" % (tz, tzname), pos)
+                    tz = tzname
+                if num is None:
+                    val = nan
+                else:
+                    val = float(num)
+                    if not math.isinf(val):
+                        unit = numUnit
+                pos = m.end()
+            else:
+                lineEnd = s.find('\n', pos, end)
+                if lineEnd < 0:
+                    lineEnd = end
+                dt, cell = self.readRow(pos, lineEnd, 2)
+                if not isinstance(dt, HDateTime):
+                    self._err("Expecting timestamp in history grid", pos)
+                if not (dt.time.hour < 24 and dt.time.min < 60 and dt.time.sec < 60):
+                    self._err("Invalid time value in history grid: %s" % dt.time.to_zinc(), pos)
+                millis = epoch_millis(dt)
+                offset = int(dt.tz_offset)
+                if str(dt.tz) != tz:
+                    if tz is not None:
+                        self._err("Mixed timezones in history grid: %s, %s" % (tz, dt.tz), pos)
+                    tz = str(dt.tz)
+                if cell is None:
+                    val = nan
+                elif isinstance(cell, HBool):
+                    val = 1.0 if cell.val else 0.0
+                elif isinstance(cell, HNum):
+                    val = cell.val
+                    cellUnit = cell.unit or ''
+                    if cellUnit != unit and not (math.isnan(val) or math.isinf(val)):
+                        if unit is not None:
+                            self._err("Mixed units in history grid: %s, %s" % (unit or 'none', cellUnit or 'none'), pos)
+                        unit = cellUnit
+                else:
+                    self._err("Unsupported value in history grid: %s" % cell, pos)
+                pos = self._consumeNewLine(lineEnd)
+            ts.append(millis)
+            offsets.append(offset)
+            vals.append(val)
+
+        if tz is not None and b.meta.missing("tz"):
+            b.meta.add("tz", tz)
+        if unit and b.meta.missing("unit"):
+            b.meta.add("unit", unit)
+        header = b.toGrid()
+        return HHisGrid(header.meta, header.cols, ts, offsets, vals)
+
+    def readDict(self):
+        """Reads a dict from the scanned range.
+
+        Returns:
+            HDict instance
+        """
+        b = HDictBuilder()
+        pos = self._readMeta(b, self.start, self.end)
+        if pos < self.end:
+            self._err("Expected end of stream", pos)
+        return b.toDict()
+
+    def readScalar(self, buf, start=0):
+        """Reads a single scalar value spanning buf[start:]. The scanner
+        may be reused for many values, decoded datetime parts are shared.
+
+        Args:
+            buf: string with the value
+            start: index of the first character of the value
+        Returns:
+            HVal instance or None
+        """
+        self.buf = buf
+        self.start = start
+        self.end = len(buf)
+        val, pos = self._readVal(start, self.end)
+        if pos != self.end:
+            self._err("Unexpected char after value", pos)
+        return val
+
+    def readHeader(self, b):
+        """Read version/meta line and column line into grid builder.
+
+        Args:
+            b: HGridBuilder
+        Returns:
+            position of the first row
+        """
+        lineEnd = self._lineEnd(self.pos)
+        pos = self._readVer(self.pos, lineEnd)
+        pos = self._readMeta(b.meta, pos, lineEnd)
+        pos = self._consumeNewLine(pos)
+
+        # cols
+        lineEnd = self._lineEnd(pos)
+        while True:
+            name, pos = self._readId(pos, lineEnd)
+            pos = SPACE_RE.match(self.buf, pos, lineEnd).end()
+            pos = self._readMeta(b.addCol(name), pos, lineEnd)
+            if pos >= lineEnd or self.buf[pos] != ',':
+                break
+            pos = SPACE_RE.match(self.buf, pos + 1, lineEnd).end()
+        return self._consumeNewLine(pos)
+
+    def readRows(self, rows, numCols, pos, end):
+        """Read rows up to empty line or end of range.
+
+        Args:
+            rows: list to which cell lists are appended
+            numCols: number of columns of the grid
+            pos: position of the first row
+            end: end of range to read
+        Returns:
+            position after the rows (and terminating empty line)
+        """
+        s = self.buf
+        find = s.find
+        readRow = self.readRow
+        append = rows.append
+        while pos < end and s[pos] != '\n':
+            lineEnd = find('\n', pos, end)
+            if lineEnd < 0:
+                lineEnd = end
+            append(readRow(pos, lineEnd, numCols))
+            pos = self._consumeNewLine(lineEnd)
+        if pos < end:
+            pos += 1
+        return pos
+
+    def readRow(self, pos, lineEnd, numCols):
+        """Read cells of a single row line.
+
+        Args:
+            pos: position of the first cell
+            lineEnd: position of the newline terminating the row
+            numCols: number of columns of the grid
+        Returns:
+            list of cells
+        """
+        s = self.buf
+        readers = VAL_READERS
+        spaceMatch = SPACE_RE.match
+        cells = [None] * numCols
+        last = numCols - 1
+        i = 0
+        while True:
+            c = s[pos] if pos < lineEnd else '\n'
+            if c == ' ' or c == '\t':
+                pos = spaceMatch(s, pos, lineEnd).end()
+                c = s[pos] if pos < lineEnd else '\n'
+            if c != ',' and c != '\n':
+                reader = readers.get(c)
+                if reader is None:
+                    if not c.isalpha():
+                        self._err("Unexpected char for start of value", pos)
+                    reader = ZincScanner._readWordVal.im_func
+                cells[i], pos = reader(self, pos, lineEnd)
+                c = s[pos] if pos < lineEnd else '\n'
+                if c == ' ' or c == '\t':
+                    pos = spaceMatch(s, pos, lineEnd).end()
+                    c = s[pos] if pos < lineEnd else '\n'
+            if i == last:
+                break
+            if c != ',':
+                self._err("Expecting comma in row", pos)
+            pos += 1
+            i += 1
+        if pos != lineEnd:
+            self._err("Expecting newline", pos)
+        return cells
+
+    ############################################################
+    ######################### Implementation ###################
+    ############################################################
+
+    def _lineEnd(self, pos):
+        lineEnd = self.buf.find('\n', pos, self.end)
+        return self.end if lineEnd < 0 else lineEnd
+
+    def _consumeNewLine(self, pos):
+        if pos >= self.end or self.buf[pos] != '\n':
+            self._err("Expecting newline", pos)
+        return pos + 1
+
+    def _readVer(self, pos, end):
+        name, pos = self._readId(pos, end)
+        if not name == "ver":
+            self._err("Expecting zinc header 'ver:2.0', not '%s'" % name, pos)
+        if pos >= end or self.buf[pos] != ':':
+            self._err("Expecting ':' colon", pos)
+        ver, pos = self._readStrLiteral(pos + 1, end)
+        if ver != "2.0":
+            self._err("Expecting zinc version: %s" % ver, pos)
+        return SPACE_RE.match(self.buf, pos, end).end()
+
+    def _readMeta(self, b, pos, end):
+        """Read name/value pairs into dict builder.
+        Args:
+            b: HDictBuilder
+        Returns:
+            position after the last pair
+        """
+        s = self.buf
+        while True:
+            m = ID_RE.match(s, pos, end)
+            if not m:
+                return pos
+            pos = SPACE_RE.match(s, m.end(), end).end()
+            val = HMarker.VAL
+            if pos < end and s[pos] == ':':
+                pos = SPACE_RE.match(s, pos + 1, end).end()
+                val, pos = self._readVal(pos, end)
+            b.add(m.group(), val)
+            pos = SPACE_RE.match(s, pos, end).end()
+
+    def _readId(self, pos, end):
+        m = ID_RE.match(self.buf, pos, end)
+        if not m:
+            self._err("Invalid name start char", pos)
+        return m.group(), m.end()
+
+    def _readVal(self, pos, end):
+        """ Read a single scalar value.
+        Returns:
+            tuple of value and position after the value
+        """
+        c = self.buf[pos] if pos < end else ''
+        reader = VAL_READERS.get(c)
+        if reader is None:
+            if not c.isalpha():
+                self._err("Unexpected char for start of value", pos)
+            return self._readWordVal(pos, end)
+        return reader(self, pos, end)
+
+    ############################################################
+    ############################ HVals #########################
+    ############################################################
+
+    def _readMinusVal(self, pos, end):
+        if self.buf[pos + 1:pos + 2] == 'I':
+            return self._readWordVal(pos, end)
+        return self._readNumVal(pos, end)
+
+    def _readWordVal(self, pos, end):
+        m = WORD_RE.match(self.buf, pos, end)
+        if not m:
+            self._err("Unexpected char for start of value", pos)
+        word = m.group()
+        val = WORDS.get(word, _UNKNOWN)
+        if val is _UNKNOWN:
+            if word == "R":
+                val = HStr.make("_remove_")
+            else:
+                self._err("Unknown value identifier: %s" % word, pos)
+        return val, m.end()
+
+    def _readStrLiteral(self, pos, end):
+        s = self.buf
+        m = STR_RE.match(s, pos, end)
+        if m:
+            return m.group(1), m.end()
+        m = STR_ESC_RE.match(s, pos, end)
+        if not m:
+            if pos >= end or s[pos] != '"':
+                self._err("Expecting '\"' for str literal", pos)
+            if end < self.end or s.find('\r', pos, end) >= 0:
+                self._err("Unexpected newline in str literal", pos)
+            self._err("Unexpected end of str literal", pos)
+        return ESC_RE.sub(lambda e: self._unescape(e, pos), m.group(1)), m.end()
+
+    def _unescape(self, m, pos):
+        esc = m.group(1)
+        if len(esc) == 5:
+            c = unichr(int(esc[1:], 16))
+            if isinstance(self.buf, unicode):
+                return c
+            return c.encode('utf-8')
+        c = ESC_CHARS.get(esc)
+        if c is None:
+            self._err("Invalid escape char: \\%s" % esc, pos)
+        return c
+
+    def _readStrVal(self, pos, end):
+        m = STR_RE.match(self.buf, pos, end)
+        if m:
+            return HStr(m.group(1)), m.end()
+        val, pos = self._readStrLiteral(pos, end)
+        return HStr(val), pos
+
+    def _readRefVal(self, pos, end):
+        m = REF_RE.match(self.buf, pos, end)
+        if not m:
+            self._err("Invalid ref id", pos)
+        pos = m.end()
+        dis = None
+        if pos < end and self.buf[pos] == '"':
+            dis, pos = self._readStrLiteral(pos, end)
+        return HRef.make(m.group(1), dis), pos
+
+    def _readUriVal(self, pos, end):
+        m = URI_RE.match(self.buf, pos, end)
+        if not m:
+            self._err("Unexpected end of uri literal", pos)
+        return HUri.make(m.group(1)), m.end()
+
+    def _readNumVal(self, pos, end):
+        s = self.buf
+        if s[pos + 4:pos + 5] == '-' and pos + 4 < end:
+            m = FIXED_DATETIME_RE.match(s, pos, end)
+            if m:
+                return self._toFixedDateTime(m), m.end()
+            m = DATETIME_RE.match(s, pos, end)
+            if m:
+                return self._toDateTime(m, pos)
+            if s[pos:pos + 4].isdigit():
+                return self._readDateVal(pos, end)
+        elif s[pos + 2:pos + 3] == ':' and pos + 2 < end and s[pos:pos + 2].isdigit():
+            return self._readTimeVal(pos, end)
+        m = NUM_RE.match(s, pos, end)
+        if not m:
+            self._err("Invalid number", pos)
+        numEnd = m.start(1)
+        num = s[pos:numEnd]
+        if '_' in num:
+            num = num.replace('_', '')
+        unit = m.group(1) or None
+        return HNum(float(num), unit), m.end()
+
+    def _readDateVal(self, pos, end):
+        m = DATE_RE.match(self.buf, pos, end)
+        if not m:
+            self._err("Invalid date value", pos)
+        if m.end() < end and self.buf[m.end()] == 'T':
+            self._err("Invalid date time value", pos)
+        y, mo, d = m.groups()
+        return HDate.make(int(y), int(mo), int(d)), m.end()
+
+    def _readTimeVal(self, pos, end):
+        m = TIME_RE.match(self.buf, pos, end)
+        if not m:
+            self._err("Invalid time value", pos)
+        h, mi, sec, frac = m.groups()
+        return HTime.make(int(h), int(mi), int(sec), self._toMillis(frac, pos)), m.end()
+
+    def _toMillis(self, frac, pos):
+        if not frac:
+            return 0
+        if len(frac) > 3:
+            self._err("Too many digits for milliseconds in time value", pos)
+        return int(frac) * MS_SCALE[len(frac)]
+
+    def _toFixedDateTime(self, m):
+        """Decode FIXED_DATETIME_RE match, parts already decoded
+        by the scanner are shared instead of parsed again.
+        """
+        date, time, zone = m.groups()
+        hdate = self._dates.get(date)
+        if hdate is None:
+            hdate = HDate.make(int(date[:4]), int(date[5:7]), int(date[8:]))
+            if len(self._dates) < MAX_DATETIME_CACHE:
+                self._dates[date] = hdate
+        htime = self._times.get(time)
+        if htime is None:
+            frac = time[9:]
+            ms = int(frac) * MS_SCALE[len(frac)] if frac else 0
+            htime = HTime(int(time[:2]), int(time[3:5]), int(time[6:8]), ms)
+            if len(self._times) < MAX_DATETIME_CACHE:
+                self._times[time] = htime
+        tz = self._zones.get(zone)
+        if tz is None:
+            if zone[0] == 'Z':
+                tz = (HTimeZone.make(zone[2:]) if len(zone) > 1 else HTimeZone.UTC, 0)
+            else:
+                offset = int(zone[1:3]) * 3600 + int(zone[4:6]) * 60
+                tz = (HTimeZone.make(zone[7:]), -offset if zone[0] == '-' else offset)
+            if len(self._zones) < MAX_DATETIME_CACHE:
+                self._zones[zone] = tz
+        return HDateTime(hdate, htime, tz[0], tz[1])
+
+    def _toDateTime(self, m, pos):
+        y, mo, d, h, mi, sec, frac, sign, tzh, tzm, tzname = m.groups()
+        valEnd = m.end()
+        if sign is None:
+            tz_offset = 0
+            # Z may be followed by a value which is not a timezone name
+            if tzname is not None and not ('A' <= tzname[0] <= 'Z'):
+                tzname = None
+                valEnd = m.start(11) - 1
+        else:
+            if tzname is None:
+                self._err("Expected space between timezone offset and name", valEnd)
+            tz_offset = int(tzh) * 3600 + int(tzm) * 60
+            if sign == '-':
+                tz_offset = -tz_offset
+        tz = HTimeZone.UTC if tzname is None else HTimeZone.make(tzname)
+        date = HDate.make(int(y), int(mo), int(d))
+        time = HTime.make(int(h), int(mi), int(sec), frac and self._toMillis(frac, pos))
+        return HDateTime.make(date, time, tz, tz_offset), valEnd
+
+    def _err(self, msg, pos):
+        lineNum = self.lineNum + self.buf[self.start:pos].count('\n')
+        s = "%s [Line %d]" % (msg, lineNum)
+        s += "; follows: %s" % self.buf[pos:min(pos + 80, self.end)]
+        raise ValueError(s)
+
+
+# value readers by first character of the value,
+# words (starting with a letter) are handled separately
+VAL_READERS = {
+    '"': ZincScanner._readStrVal.im_func,
+    '@': ZincScanner._readRefVal.im_func,
+    '`': ZincScanner._readUriVal.im_func,
+    '-': ZincScanner._readMinusVal.im_func,
+}
+VAL_READERS.update(dict.fromkeys(DIGITS, ZincScanner._readNumVal.im_func))
+
+
+class ZincRowIndex(object):
+    """Offsets of the row lines of a grid scanned by ZincScanner,
+    decodes rows and single cells on request. Used as the row source
+    of HLazyGrid.
+    """
+
+    def __init__(self, scanner, numCols, pos):
+        """ctor
+        Args:
+            scanner: ZincScanner of the grid
+            numCols: number of columns of the grid
+            pos: position of the first row
+        """
+        self.scanner = scanner
+        self.numCols = numCols
+        s = scanner.buf
+        end = scanner.end
+        find = s.find
+        # start of each row, plus the position after the last row
+        starts = array.array('l')
+        append = starts.append
+        while pos < end and s[pos] != '\n':
+            append(pos)
+            lineEnd = find('\n', pos, end)
+            if lineEnd < 0:
+                scanner._err("Expecting newline", end)
+            pos = lineEnd + 1
+        append(pos)
+        self.starts = starts
+        self.endPos = pos + 1 if pos < end else pos
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def readRow(self, index):
+        """Decode cells of the row at index"""
+        return self.scanner.readRow(self.starts[index], self.starts[index + 1] - 1, self.numCols)
+
+    def readCell(self, index, colIndex):
+        """Decode a single cell of the row at index, preceding
+        cells are skipped without decoding them.
+        """
+        scanner = self.scanner
+        s = scanner.buf
+        pos = self.starts[index]
+        lineEnd = self.starts[index + 1] - 1
+        for i in xrange(colIndex):
+            pos = CELL_RE.match(s, pos, lineEnd).end()
+            if pos >= lineEnd:
+                scanner._err("Expecting comma in row", pos)
+            pos += 1
+        pos = SPACE_RE.match(s, pos, lineEnd).end()
+        if pos >= lineEnd or s[pos] == ',':
+            return None
+        return scanner._readVal(pos, lineEnd)[0]
@@ -28,6 +28,9 @@ CONTENT_TYPE_HEADERS_DICT = {
     #"zinc":
 }
 
+# size of response body chunks returned by streaming requests
+STREAM_CHUNK_SIZE = 65536
+
 class HSession(object):
 
     def __init__(self, url, username = None, password = None):
@@ -74,9 +77,12 @@ class HSession(object):
         
         return self.doUrlRequest(url, body, 'POST')
 
-    def get(self, url):
-        """ Perform a GET request"""
-        return self.doUrlRequest(url)
+    def get(self, url, stream=False):
+        """ Perform a GET request.
+        If stream is True, return an iterator over decoded chunks of the
+        response body instead of the whole body.
+        """
+        return self.doUrlRequest(url, stream=stream)
 
     def put(self, url, body):
         """ Perform a PUT request using href with a body as target of PUT.
@@ -91,12 +97,13 @@ class HSession(object):
 
     #************** Private functions **************
 
-    def doUrlRequest(self, url, body = None, method = 'GET'):
+    def doUrlRequest(self, url, body = None, method = 'GET', stream = False):
         """Perform url request.
         Args:
             url: url to request
             in: HTTP POST body (needed only for POST requests)
             method: HTTP method to use
+            stream: if True, return iterator over response body chunks
         """
 
         #request.add_header('Connection', 'keep-alive')
@@ -107,7 +114,7 @@ class HSession(object):
         currentHeaders.update(self.headers)
         try:
             if method == 'GET':
-                res = self.session.get(url, headers=currentHeaders)
+                res = self.session.get(url, headers=currentHeaders, stream=stream)
             elif method == 'POST':
                 res = self.session.post(url, data=body, headers=currentHeaders)
             else:
@@ -115,7 +122,10 @@ class HSession(object):
             
             self.response = res.status_code
             res.encoding = "utf-8"
-            content = res.text 
+            if stream:
+                content = res.iter_content(chunk_size=STREAM_CHUNK_SIZE, decode_unicode=True)
+            else:
+                content = res.text 
         except Exception, err:
             raise Exception("Can't perform request to %s: %s" % (url, err))
         #except httplib.BadStatusLine, err:
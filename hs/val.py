@@ -4,8 +4,10 @@ Implementation of HVal classes.
 """
 import math
 import datetime
+import re
 import StringIO
 import dateutil.parser
+from core import LRUCache
 
 ############################################################
 ######################### Initialization ###################
@@ -43,6 +45,24 @@ def init_hsidchars():
 init_unitchars()
 init_hsidchars()
 
+# same characters as HSID_CHARS
+HSID_RE = re.compile(r'[a-zA-Z0-9_:\-.~]+\Z')
+
+# interning caches shared by readers and builders: values are immutable,
+# so equal timezones, units and refs can be the same instance
+
+# max number of cached timezones and unit names
+MAX_TZ_CACHE = 1000
+MAX_UNIT_CACHE = 1000
+# max number of cached refs, least recently used refs are evicted
+REF_CACHE_SIZE = 10000
+
+# timezone name -> HTimeZone instance
+_TZ_CACHE = {}
+
+# validated unit name -> the same unit name
+_UNIT_CACHE = {}
+
 ############################################################
 ################### Internal Helper Functions ##############
 ############################################################
@@ -53,23 +73,23 @@ def _is_unit_name(unit):
     elif not len(unit):
         ret = False
     else:
+        # any non-ascii character is a valid unit character
+        ret = True
         for i in range(len(unit)):
             c = ord(unit[i])
-            if c < 128 and c > 0 and UNIT_CHARS[c]:
-                ret = True
-            else:
+            if c < 128 and not UNIT_CHARS[c]:
                 ret = False
+                break
     return ret
 
 def _is_id(hsid):
     """Return True if the given string is a valid id for a reference.
     """
-    if not len(hsid): return False
-    for c in hsid:
-        cc = ord(c)
-        if cc < 0 or cc >= len(HSID_CHARS) or not HSID_CHARS[cc]:
-            return False
-    return True
+    return HSID_RE.match(hsid) is not None
+
+def _make_tz(name):
+    """Return shared timezone instance, used to unpickle HTimeZone"""
+    return HTimeZone.make(name)
 
 def is_id_char(c):
     """Return True if the given character is a valid id for a reference.
@@ -86,44 +106,47 @@ def is_id_char(c):
 ############################################################
 
 
+# chars escaped in zinc str literals
+ZINC_STR_ESC_RE = re.compile(r'[\x00-\x1f"\\]')
+
+# escape sequences of the chars matched by ZINC_STR_ESC_RE
+ZINC_STR_ESCAPES = dict((chr(i), '\\u%04x' % i) for i in range(0x20))
+ZINC_STR_ESCAPES.update({
+    '\n': '\\n',
+    '\r': '\\r',
+    '\t': '\\t',
+    '"': '\\"',
+    '\\': '\\\\',
+})
+
+# zinc of the special float values, by their '%g' format
+NUM_ZINC_SPECIALS = {'nan': 'NaN', 'inf': 'INF', '-inf': '-INF'}
+
+def num_to_zinc(val):
+    """Encode number as zinc, without unit."""
+    s = "%g" % val
+    # handle special values NaN/INF/-INF
+    return NUM_ZINC_SPECIALS.get(s, s)
+
+def tz_offset_to_zinc(offset):
+    """Encode timezone offset in seconds as zinc, 'Z' or +/-hh:mm"""
+    if offset == 0:
+        return "Z"
+    sign = '-' if offset < 0 else '+'
+    offset = abs(offset)
+    return '%s%02d:%02d' % (sign, offset / 3600, (offset % 3600) / 60)
+
+def _zinc_str_escape(m):
+    return ZINC_STR_ESCAPES[m.group()]
+
 def str_to_zinc(val = None):
     """Encode using double quotes and back slash escapes.
-    Converts a string value to zinc, including
-    handling of non-ascii chars.
+    Converts a string value to zinc, non-ascii chars are
+    not escaped.
     """
-    s = StringIO.StringIO()
-    s.write('"')
-    for c in val:
-        if c < " " or c == '"' or c == "\\":
-            s.write("\\")
-            if c == "\n":
-                s.write("n")
-            elif c == "\r":
-                s.write("r")
-            elif c == "\t":
-                s.write("t")
-            elif c == '"':
-                s.write('"')
-            elif c == "\\":
-                s.write("\\")
-            else:
-                """
-                corresponding java code:
-                    s.append('u').append('0').append('0');
-                    if (c <= 0xf) s.append('0');
-                    s.append(Integer.toHexString(c));
-
-                """
-                s.write("u")
-                s.write("0")
-                s.write("0")
-                if ord(c) < 0xf:
-                    s.write("0")
-                s.write(hex(ord(c)))
-        else:
-            s.write(c)
-    s.write('"')
-    return s.getvalue()
+    if ZINC_STR_ESC_RE.search(val) is None:
+        return '"' + val + '"'
+    return '"' + ZINC_STR_ESC_RE.sub(_zinc_str_escape, val) + '"'
 
 
 ############################################################
@@ -140,6 +163,12 @@ class HVal(object):
     def __str__(self):
         return self.to_zinc()
 
+    # zinc encoding of values which cache it, see to_zinc of subclasses
+    _zinc = None
+
+    # values are pickled by __reduce__ of subclasses as the args of their
+    # constructor, singletons by reference; the cached zinc is not pickled
+
     def to_zinc(self):
         raise NotImplementedError("Must be implemented by subclass %s" % type(self))
 
@@ -178,6 +207,9 @@ class HMarker(HVal):
     def __str__(self):
         return "marker"
 
+    def __reduce__(self):
+        return (getattr, (HMarker, "VAL"))
+
     def to_zinc(self):
         return "M"
 
@@ -194,11 +226,17 @@ class HStr(HVal):
     def make(s):
         return HStr(s)
 
+    def __reduce__(self):
+        return (HStr, (self.val,))
+
     def __str__(self):
         return self.val
 
     def to_zinc(self):
-        return str_to_zinc(self.val)
+        zinc = self._zinc
+        if zinc is None:
+            zinc = self._zinc = str_to_zinc(self.val)
+        return zinc
 
     def to_code(self):
         """Encode using double quotes and back slash escapes.
@@ -218,6 +256,9 @@ class HBool(HVal):
     def make(v):
         return HBool(v)
 
+    def __reduce__(self):
+        return (getattr, (HBool, "TRUE" if self.val else "FALSE"))
+
     def to_zinc(self):
         return "T" if self.val else "F"
 
@@ -263,8 +304,13 @@ class HDate(HVal):
         """
         return HDate(dt.year, dt.month, dt.day)
 
+    def __reduce__(self):
+        return (HDate, (self.year, self.month, self.day))
+
     def to_zinc(self, stream = None):
-        ret = '%d-%02d-%02d' % ( self.year, self.month, self.day)
+        ret = self._zinc
+        if ret is None:
+            ret = self._zinc = '%d-%02d-%02d' % ( self.year, self.month, self.day)
         if stream:
             stream.write(ret)
         return ret
@@ -346,26 +392,14 @@ class HDateTime(HVal):
     def now():
         return HDateTime.make_from_dt(datetime.datetime.utcnow())
 
-    def to_zinc(self):
-        s = StringIO.StringIO()
-        self.date.to_zinc(s)
-        s.write('T')
-        self.time.to_zinc(s)
-        if self.tz_offset == 0:
-            s.write("Z")
-        else:
-            offset = self.tz_offset
-            if offset < 0:
-                s.write('-')
-                offset = -offset
-            else:
-                s.write('+')
-            zh = offset / 3600
-            zm = (offset % 3600) / 60
-            s.write('%02d:%02d' % (zh, zm))
+    def __reduce__(self):
+        return (HDateTime, (self.date, self.time, self.tz, self.tz_offset))
 
-        s.write(' %s' % self.tz)
-        ret = s.getvalue()
+    def to_zinc(self):
+        ret = self._zinc
+        if ret is None:
+            ret = self._zinc = '%sT%s%s %s' % (self.date.to_zinc(), self.time.to_zinc(),
+                                               tz_offset_to_zinc(self.tz_offset), self.tz)
         return ret
 
 
@@ -410,11 +444,17 @@ class HTime(HVal):
         dt = dateutil.parser.parse(s)
         return HTime(dt.hour, dt.minute, dt.second, dt.microsecond/1000)
 
+    def __reduce__(self):
+        return (HTime, (self.hour, self.min, self.sec, self.ms))
+
     def to_zinc(self, stream = None):
-        if not self.ms:
-            ret = '%02d:%02d:%02d' % ( self.hour, self.min, self.sec)
-        else:
-            ret = '%02d:%02d:%02d.%03d' % ( self.hour, self.min, self.sec, self.ms)
+        ret = self._zinc
+        if ret is None:
+            if not self.ms:
+                ret = '%02d:%02d:%02d' % ( self.hour, self.min, self.sec)
+            else:
+                ret = '%02d:%02d:%02d.%03d' % ( self.hour, self.min, self.sec, self.ms)
+            self._zinc = ret
         if stream:
             stream.write(ret)
         return ret
@@ -451,11 +491,21 @@ class HTimeZone(HVal):
 
     @staticmethod
     def make(name):
-        return HTimeZone(name)
+        """Return timezone for name, instances are shared for the same name."""
+        tz = _TZ_CACHE.get(name)
+        if tz is None:
+            tz = HTimeZone(name)
+            if len(_TZ_CACHE) < MAX_TZ_CACHE:
+                _TZ_CACHE[name] = tz
+        return tz
 
     def __str__(self):
         return self.name;
 
+    def __reduce__(self):
+        # unpickled timezones are shared instances, like HTimeZone.UTC
+        return (_make_tz, (self.name,))
+
     #def to_zinc(self, stream = None):
 
 
@@ -475,11 +525,17 @@ class HUri(HVal):
         #    return HUri.EMPTY
         return HUri(val)
 
+    def __reduce__(self):
+        return (HUri, (self.val,))
+
     def __str__(self):
         return self.val
 
     def to_zinc(self):
-        return '`%s`' % self.val
+        zinc = self._zinc
+        if zinc is None:
+            zinc = self._zinc = '`%s`' % self.val
+        return zinc
 
 HUri.EMPTY = HUri.make("")
 
@@ -487,8 +543,15 @@ class HNum(HVal):
     """HNum wraps a 64-bit floating point number and optional unit name."""
     
     def __init__(self, val, unit = None):
-        if not _is_unit_name(unit):
-            raise ValueError("Invalid unit name: " + unit)
+        if unit is not None:
+            cached = _UNIT_CACHE.get(unit)
+            if cached is None:
+                if not _is_unit_name(unit):
+                    raise ValueError("Invalid unit name: " + unit)
+                if len(_UNIT_CACHE) < MAX_UNIT_CACHE:
+                    _UNIT_CACHE[unit] = unit
+            else:
+                unit = cached
         self.val = val
         self.unit = unit
 
@@ -496,19 +559,24 @@ class HNum(HVal):
     def make(val, unit = None):
         return HNum(val, unit)
 
+    def __reduce__(self):
+        for name in ("NaN", "POS_INF", "NEG_INF"):
+            if self is getattr(HNum, name):
+                return (getattr, (HNum, name))
+        if self.unit is None:
+            return (HNum, (self.val,))
+        return (HNum, (self.val, self.unit))
+
     def to_zinc(self):
-        # handle special values NaN/INF/-INF
-        if math.isnan(self.val):
-            s = "NaN"
-        elif self.val == float("inf"):
-            s = "INF"
-        elif self.val == float("-inf"):
-            s = "-INF"
-        else:
-            s = "%g" % self.val
-        #s = '{0:g}'.format(self.val)
+        s = self._zinc
+        if s is None:
+            s = self._zinc = self._to_zinc()
+        return s
+
+    def _to_zinc(self):
+        s = num_to_zinc(self.val)
         if self.unit:
-            s += " %s" % self.unit
+            s += self.unit
         return s
 
     def __eq__(self, other):
@@ -568,7 +636,15 @@ class HRef(HVal):
 
     @staticmethod
     def make(val, dis = None):
-        return HRef(val, dis)
+        """Return ref for id and display name, recently used refs
+        are shared instances.
+        """
+        key = val if dis is None else (val, dis)
+        ref = HRef.CACHE.get(key)
+        if ref is None:
+            ref = HRef(val, dis)
+            HRef.CACHE.set(key, ref)
+        return ref
 
     @property
     def dis(self):
@@ -578,6 +654,9 @@ class HRef(HVal):
     def __str__(self):
         return self.val;
 
+    def __reduce__(self):
+        return (HRef, (self.val, self._dis))
+
     #def __eq__(self, other):
     #    str(self) == str(other)
 
@@ -585,11 +664,16 @@ class HRef(HVal):
         return '@%s' % self.val
 
     def to_zinc(self):
-        s = '@%s' % self.val
-        if self._dis != None:
-            s += ' %s' % HStr(self._dis).to_zinc()
+        s = self._zinc
+        if s is None:
+            s = '@%s' % self.val
+            if self._dis != None:
+                s += ' %s' % str_to_zinc(self._dis)
+            self._zinc = s
         return s
 
 
 
 
+
+HRef.CACHE = LRUCache(REF_CACHE_SIZE)
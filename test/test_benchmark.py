@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# coding: utf8
+"""
+Test benchmark payload generators
+
+
+"""
+import unittest
+from benchmark.generators import GENERATORS, his_grid
+from hs.io import ZincReader
+
+
+class GeneratorsTest(unittest.TestCase):
+
+    def test_generators(self):
+        """Test generated payloads are valid and repeatable
+        """
+        for name, generate in GENERATORS.items():
+            payload = generate(100, seed=3)
+            self.assertEqual(payload, generate(100, seed=3))
+            self.assertNotEqual(payload, generate(100, seed=4))
+            grids = ZincReader(payload).readGrids()
+            self.assertEqual(sum(grid.num_rows() for grid in grids), 100, name)
+        self.assertEqual(ZincReader(his_grid(10)).readHis().unit, "kWh")
+
+
+if __name__ == '__main__':
+    unittest.main()
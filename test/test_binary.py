@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# coding: utf8
+"""
+Test binary grid codec
+
+"""
+import unittest
+import StringIO
+from hs.grid import HDict, HDictBuilder, HGridBuilder, HGrid, HColumn
+from hs.val import HMarker, HStr, HDateTime, HDate, HTime, HTimeZone, HNum, HRef, HUri, HBool
+from hs.io import ZincReader, ZincWriter
+from hs.binary import BinaryReader, BinaryWriter
+
+
+zinc_grid = """ver:"2.0" id:@p.1 "Point 1" hisStart:2015-01-01T00:00:00-05:00 New_York dis:"caf\xc3\xa9"
+id,dis,mark,flag,val unit:"kW",mixed,ts,day,time,uri,empty
+@a "Site A","A",M,T,1.5kW,T,2015-01-01T00:00:00-05:00 New_York,2015-01-01,10:00:00,`http://a`,
+@b,"caf\xc3\xa9 \\"q\\"",,F,-INF,1200ft\xc2\xb2,2015-03-08T03:00:00.250-04:00 New_York,1969-12-31,23:59:59.999,`b`,
+@c,"",M,,NaN,"x",1969-12-31T23:00:00Z UTC,,00:00:00,,
+@a "Site A","A",M,T,2,,2015-01-01T00:15:00Z London,2015-01-01,10:00:00,`http://a`,
+"""
+
+
+def rows_grid(num_rows):
+    lines = ['ver:"2.0"', 'id,val,ts,flag']
+    for i in range(num_rows):
+        lines.append('@p.%d,%d.5kW,2015-01-01T%02d:%02d:00-05:00 New_York,%s' % (
+            i, i, i / 60 % 24, i % 60, "M" if i % 3 else ""))
+    return ZincReader("\n".join(lines) + "\n").readGrid()
+
+
+class BinaryTest(unittest.TestCase):
+
+    def test_roundtrip(self):
+        grid = ZincReader(zinc_grid).readGrid()
+        s = BinaryWriter.gridToString(grid)
+        back = BinaryReader(s).readGrid()
+        self.assertEqual(ZincWriter.gridToString(back), ZincWriter.gridToString(grid))
+        self.assertEqual(back.col("val").meta.get("unit"), HStr("kW"))
+        self.assertTrue(back.row(0).get("mark") is HMarker.VAL)
+        self.assertTrue(back.row(1).get("flag") is HBool.FALSE)
+        self.assertEqual(back.row(1).get("ts").time, HTime.make(3, 0, 0, 250))
+        self.assertEqual(back.row(1).get("ts").tz_offset, -4 * 3600)
+        self.assertEqual(back.row(1).get("mixed"), HNum(1200, "ft\xc2\xb2"))
+        self.assertEqual(back.row(3).get("ts").tz, HTimeZone.make("London"))
+        self.assertTrue(back.row(0).get("id") is back.row(3).get("id"))
+        self.assertEqual(back.row(0).get("id").dis, "Site A")
+        self.assertIsNone(back.row(2).get("flag"))
+        self.assertIsNone(back.row(0).get("empty"))
+        # unicode strings are read as utf-8 str
+        grid = HGridBuilder().dictToGrid(HDict({"s": HStr(u"caf\xe9"), "u": HUri(u"\xe9")}))
+        back = BinaryReader(BinaryWriter.gridToString(grid)).readGrid()
+        self.assertEqual(back.row(0).get("s").val, "caf\xc3\xa9")
+        self.assertEqual(back.row(0).get("u").val, "\xc3\xa9")
+        # shorter than zinc
+        self.assertTrue(len(s) < len(zinc_grid))
+
+    def test_blocks(self):
+        grid = rows_grid(1000)
+        zinc = ZincWriter.gridToString(grid)
+        for block_rows in (1, 7, 100, 4096):
+            out = StringIO.StringIO()
+            BinaryWriter(out, block_rows=block_rows).writeGrid(grid)
+            s = out.getvalue()
+            self.assertEqual(ZincWriter.gridToString(BinaryReader(s).readGrid()), zinc, block_rows)
+            # rows and columns which are not requested are skipped
+            part = BinaryReader(s).readGrid(cols=["ts", "id", "other"], start=95, end=205)
+            self.assertEqual([col.name for col in part.cols], ["id", "ts"])
+            self.assertEqual([col.index for col in part.cols], [0, 1])
+            self.assertEqual(part.num_rows(), 110)
+            self.assertEqual(part.row(0).get("id"), HRef.make("p.95"))
+            self.assertEqual(part.row(109).get("ts"), grid.row(204).get("ts"))
+            self.assertEqual(BinaryReader(s).readGrid(start=990, end=2000).num_rows(), 10)
+            self.assertEqual(BinaryReader(s).readGrid(cols=[], end=3).num_rows(), 3)
+        # delta encoded timestamps of a regular interval
+        self.assertTrue(len(BinaryWriter.gridToString(grid)) < len(zinc) / 2)
+
+    def test_columnar(self):
+        grid = rows_grid(1000)
+        zinc = ZincWriter.gridToString(grid)
+        for block_rows in (1, 7, 4096):
+            out = StringIO.StringIO()
+            BinaryWriter(out, block_rows=block_rows).writeGrid(grid)
+            s = out.getvalue()
+            back = BinaryReader(s).readGrid(columnar=True)
+            # numbers of one unit and timestamps of one timezone are typed columns
+            columns = back.to_columns()
+            self.assertEqual(columns["val"].kind, "number")
+            self.assertEqual(columns["val"].unit, "kW")
+            self.assertEqual(columns["val"].values[3], 3.5)
+            self.assertEqual(columns["ts"].kind, "datetime")
+            self.assertEqual(columns["ts"].tz, "New_York")
+            self.assertEqual(columns["ts"].tz_offset[0], -5 * 3600)
+            self.assertEqual(list(columns["flag"].mask[:3]), [1, 0, 0])
+            self.assertEqual(columns["id"].kind, "object")
+            # cells are made on access
+            self.assertTrue(isinstance(back._columns[1], HColumn))
+            self.assertEqual(back.row(1).get("val"), HNum(1.5, "kW"))
+            self.assertEqual(ZincWriter.gridToString(back), zinc, block_rows)
+            part = BinaryReader(s).readGrid(cols=["ts", "val"], start=95, end=205, columnar=True)
+            self.assertEqual(part.num_rows(), 110)
+            self.assertEqual(part.row(109).get("ts"), grid.row(204).get("ts"))
+            # typed columns are written from their arrays
+            back = BinaryReader(s).readGrid(columnar=True)
+            out = StringIO.StringIO()
+            BinaryWriter(out, block_rows=block_rows).writeGrid(back)
+            self.assertEqual(out.getvalue(), s, block_rows)
+            self.assertTrue(isinstance(back._columns[1], HColumn))
+        typed = HGrid.from_columns(grid.to_columns(), grid.meta, columnar=True)
+        self.assertEqual(ZincWriter.gridToString(BinaryReader(BinaryWriter.gridToString(typed)).readGrid()), zinc)
+        # columns of several units or timezones are read as cells
+        grid = ZincReader(zinc_grid).readGrid()
+        back = BinaryReader(BinaryWriter.gridToString(grid)).readGrid(columnar=True)
+        self.assertEqual(ZincWriter.gridToString(back), ZincWriter.gridToString(grid))
+        self.assertEqual([type(column) is HColumn for column in back._columns],
+                         [False, True, False, True, False, False, False, False, False, False, False])
+
+    def test_multigrid(self):
+        grids = [ZincReader(zinc_grid).readGrid(), rows_grid(10), ZincReader('ver:"2.0"\nempty\n').readGrid()]
+        s = BinaryWriter.gridsToString(iter(grids))
+        reader = BinaryReader(StringIO.StringIO(s))
+        self.assertEqual(ZincWriter.gridsToString(reader.readGrids()), ZincWriter.gridsToString(grids))
+        self.assertIsNone(reader.readGrid())
+        # grids share the string table, they are read in order
+        reader = BinaryReader(s)
+        reader.readGrid(cols=[])
+        self.assertEqual(reader.readGrid().row(9).get("id"), HRef.make("p.9"))
+        self.assertEqual(BinaryReader("").readGrids(), [])
+
+    def test_dict_val(self):
+        d = HDictBuilder().add("site").add("dis", "Site").add("area", 1200, "ft\xc2\xb2") \
+            .add("ref", HRef.make("s.1", "S")).add("date", HDate.make(2015, 1, 2)).toDict()
+        back = BinaryReader(BinaryWriter.dictToString(d)).readDict()
+        self.assertEqual(back, d)
+        for val in (None, HMarker.VAL, HBool.TRUE, HStr("s"), HNum(-1.25, "kW"), HNum.POS_INF,
+                    HRef.make("a"), HUri("u"), HDate.make(1900, 1, 1), HTime.make(23, 59, 59, 999),
+                    HDateTime.make(HDate.make(1960, 6, 1), HTime.make(1, 2, 3), HTimeZone.make("Tokyo"), 9 * 3600)):
+            back = BinaryReader(BinaryWriter.valToString(val)).readVal()
+            self.assertEqual(back, val)
+            self.assertEqual(type(back), type(val))
+        out = StringIO.StringIO()
+        w = BinaryWriter(out)
+        w.writeDict(d)
+        w.writeVal(HRef.make("s.1", "S"))
+        grid = ZincReader(zinc_grid).readGrid()
+        w.writeGrid(grid)
+        reader = BinaryReader(out.getvalue())
+        self.assertEqual(reader.readDict(), d)
+        self.assertTrue(reader.readVal() is HRef.make("s.1", "S"))
+        self.assertEqual(ZincWriter.gridToString(reader.readGrid()), ZincWriter.gridToString(grid))
+
+    def test_errors(self):
+        s = BinaryWriter.gridToString(ZincReader(zinc_grid).readGrid())
+        self.assertRaises(ValueError, BinaryReader(zinc_grid).readGrid)
+        self.assertRaises(ValueError, BinaryReader(s).readDict)
+        self.assertRaises(ValueError, BinaryReader(s[:-1]).readGrid)
+        self.assertRaises(ValueError, BinaryReader(s[:len(s) / 2]).readGrid)
+        self.assertRaises(ValueError, BinaryReader(BinaryWriter.dictToString(HDict({}))).readVal)
+        self.assertRaises(ValueError, BinaryWriter.valToString, HTimeZone.UTC)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# coding: utf8
+"""
+Test csv reader
+
+"""
+import unittest
+import StringIO
+from hs.grid import to_tag_name
+from hs.val import HMarker, HStr, HDateTime, HDate, HTime, HTimeZone, HNum, HRef, HBool
+from hs.io import CsvReader, CsvWriter, ZincReader, ZincWriter
+
+
+zinc_grid = """ver:"2.0"
+id,dis,site,area,on,curVal,ts,note
+@a "Site A","Site, A",M,1200ft²,T,72.5°F,2015-01-01T00:00:00-05:00 New_York," padded "
+@b,"B \\"quoted\\"",,,F,T,2015-01-01T00:15:00-05:00 New_York,"two\\nlines"
+@c,"C",M,900ft²,,-INF,,
+"""
+
+csv_grid = (u'id,dis,site,area,on,curVal,ts,note\n'
+            u'"@a ""Site A""","Site, A",✓,1200ft\xb2,T,72.5\xb0F,2015-01-01T00:00:00-05:00 New_York," padded "\n'
+            u'@b,"B ""quoted""","","",F,T,2015-01-01T00:15:00-05:00 New_York,"two\nlines"\n'
+            u'@c,C,✓,900ft\xb2,"",-INF,"",""\n')
+
+
+class CsvTest(unittest.TestCase):
+
+    def test_write(self):
+        self.assertEqual(CsvWriter.gridToString(ZincReader(zinc_grid).readGrid()), csv_grid.encode('utf-8'))
+        # output is str, in the encoding of the writer
+        self.assertEqual(type(CsvWriter.gridToString(ZincReader('ver:"2.0"\na\n"x"\n').readGrid())), str)
+        out = StringIO.StringIO()
+        CsvWriter(out, encoding='latin-1').writeGrid(ZincReader('ver:"2.0"\na\n"caf\xc3\xa9"\n').readGrid())
+        self.assertEqual(out.getvalue(), 'a\ncaf\xe9\n')
+
+    def test_write_quoting(self):
+        grid = ZincReader('ver:"2.0"\na,b,c\n"x",2,"caf\xc3\xa9"\n" y","tab\\t","z"\n'
+                          '"z\\t",N,"a;b"\n').readGrid()
+        self.assertEqual(CsvWriter.gridToString(grid),
+                         'a,b,c\nx,2,caf\xc3\xa9\n" y","tab\t",z\n"z\t","",a;b\n')
+        out = StringIO.StringIO()
+        CsvWriter(out, delimiter=';', encoding='utf-8').writeGrid(grid)
+        self.assertEqual(out.getvalue(), 'a;b;c\nx;2;caf\xc3\xa9\n" y";"tab\t";z\n"z\t";"";"a;b"\n')
+
+    def test_read(self):
+        grid = CsvReader(csv_grid).readGrid()
+        self.assertEqual([col.name for col in grid.cols],
+                         ["id", "dis", "site", "area", "on", "curVal", "ts", "note"])
+        row = grid.row(0)
+        self.assertEqual(row.get("id"), HRef.make("a", "Site A"))
+        self.assertEqual(row.get("dis"), HStr("Site, A"))
+        self.assertTrue(row.get("site") is HMarker.VAL)
+        self.assertEqual(row.get("area"), HNum(1200, "ft\xc2\xb2"))
+        self.assertTrue(row.get("on") is HBool.TRUE)
+        self.assertEqual(row.get("curVal"), HNum(72.5, "\xc2\xb0F"))
+        self.assertEqual(row.get("ts"),
+                         HDateTime.make(HDate.make(2015, 1, 1), HTime.make(0, 0, 0),
+                                        HTimeZone.make("New_York"), -5 * 3600))
+        self.assertEqual(row.get("note"), HStr(" padded "))
+        row = grid.row(1)
+        self.assertEqual(row.get("dis"), HStr('B "quoted"'))
+        self.assertIsNone(row.get("area"))
+        # mixed column of numbers and bools
+        self.assertTrue(row.get("curVal") is HBool.TRUE)
+        self.assertEqual(row.get("note"), HStr("two\nlines"))
+        self.assertEqual(grid.row(2).get("curVal"), HNum.NEG_INF)
+        # nulls are written as empty quoted strings
+        self.assertIsNone(grid.row(1).get("site"))
+        self.assertIsNone(grid.row(2).get("ts"))
+
+    def test_infer(self):
+        s = "Point Name,val,2nd,val\nA,1kW,x,\nB,2kW,y,\nC,3,z,abc\n"
+        grid = CsvReader(s).readGrid()
+        self.assertEqual([col.name for col in grid.cols], ["pointName", "val", "v2nd", "val2"])
+        self.assertEqual(grid.col(0).meta.get("dis"), HStr("Point Name"))
+        self.assertEqual(grid.col(0).dis, "Point Name")
+        self.assertEqual(grid.col(1).meta.get("dis"), None)
+        self.assertEqual([row.get("val") for row in grid.rows], [HNum(1, "kW"), HNum(2, "kW"), HNum(3)])
+        # only the first rows are used for inference
+        grid = CsvReader("a\n1\n2\nx\n", infer_rows=2).readGrid()
+        self.assertEqual([row.get("a") for row in grid.rows], [HNum(1), HNum(2), HStr("x")])
+        grid = CsvReader("a\n1\n2\n", infer_rows=0).readGrid()
+        self.assertEqual([row.get("a") for row in grid.rows], [HStr("1"), HStr("2")])
+        self.assertEqual(to_tag_name("Zone Air-Temp"), "zoneAirTemp")
+        self.assertEqual(to_tag_name("%"), "v")
+
+    def test_stream(self):
+        grids = ZincReader(zinc_grid + "\n" + zinc_grid).readGrids()
+        s = CsvWriter.gridsToString(grids)
+        # chunks, file and string sources
+        chunks = [s[i:i + 7] for i in range(0, len(s), 7)]
+        for source in (chunks, StringIO.StringIO(s), s):
+            back = CsvReader(source).readGrids()
+            self.assertEqual(len(back), 2)
+            self.assertEqual(CsvWriter.gridsToString(back), CsvWriter.gridsToString(grids))
+        reader = CsvReader(s, infer_rows=1)
+        header = reader.readHeader()
+        self.assertEqual(header.num_rows(), 0)
+        # rows of the first grid are skipped
+        self.assertEqual(reader.readHeader().num_cols(), 8)
+        rows = list(reader.iterRows())
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[2].get("area"), HNum(900, "ft\xc2\xb2"))
+        self.assertIsNone(reader.readHeader())
+        self.assertEqual(CsvReader("").readGrids(), [])
+
+    def test_errors(self):
+        grid = CsvReader("a,b\n1\n").readGrid()
+        self.assertEqual(grid.row(0).cells, (HNum(1), None))
+        self.assertRaises(ValueError, CsvReader("a,b\n1,2,3\n").readGrid)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,10 +5,15 @@ Test grid
 
  
 """
+import cPickle
+import math
+import pickle
 import unittest
 from hs import grid
-from hs.val import HRef, HDate, HMarker, HStr, HNum
-from hs.io import ZincWriter
+from hs.core import Storage
+from hs.val import HRef, HDate, HMarker, HStr, HNum, HBool, HTimeZone
+from hs.io import ZincReader, ZincWriter, JsonWriter, CsvWriter
+from hs.binary import BinaryReader, BinaryWriter
 
 class GridTest(unittest.TestCase):
 
@@ -126,6 +131,42 @@ class GridTest(unittest.TestCase):
         # iterator
         self.verifyGridIterator(g)
 
+    def test_row(self):
+        b = grid.HGridBuilder()
+        b.addCol("id")
+        b.addCol("dis")
+        b.addCol("area")
+        b.addRow([HRef.make("a", "Site A"), HStr.make("Alpha"), None])
+        b.addRow([HRef.make("b", "Site B"), None, HNum.make(1200)])
+        g = b.toGrid()
+        r = g.row(0)
+        self.assertEqual(r.cells, (HRef.make("a", "Site A"), HStr.make("Alpha"), None))
+        self.assertTrue(r.has("dis"))
+        self.assertTrue(r.missing("area"))
+        self.assertTrue(r.missing("fooBar"))
+        self.assertEqual(r.dis, "Alpha")
+        self.assertEqual(g.row(1).dis, "Site B")
+        self.assertEqual(r.get(g.col("dis")), HStr.make("Alpha"))
+        self.assertEqual(r["dis"], HStr.make("Alpha"))
+        self.assertRaises(KeyError, r.__getitem__, "fooBar")
+        self.assertTrue("area" in r and "fooBar" not in r)
+        self.assertEqual(r.keys(), ["id", "dis", "area"])
+        self.assertEqual(r.items()[1], ("dis", HStr.make("Alpha")))
+        self.assertEqual(r.values(), [HRef.make("a", "Site A"), HStr.make("Alpha"), None])
+        self.assertEqual(list(r.itervalues()), r.values())
+        self.assertEqual(list(r.iterkeys()), r.keys())
+        self.assertTrue(r.has_key("area") and not r.has_key("fooBar"))
+        self.assertFalse(r.is_empty())
+        # rows are not dicts, to_dict returns one
+        self.assertFalse(isinstance(r, dict))
+        self.assertEqual(r, {"id": r.get("id"), "dis": r.get("dis"), "area": None})
+        self.assertEqual(r.to_dict(), grid.HDict({"id": r.get("id"), "dis": r.get("dis")}))
+        self.assertEqual(len(r), 3)
+        # rows share the column index of the grid and have no instance dict
+        self.assertTrue(r._index is g.row(1)._index)
+        self.assertFalse(hasattr(r, "__dict__"))
+        self.assertRaises(AttributeError, setattr, r, "grid", g)
+
     def test_other_ops(self):
         hdicts = []
         d = grid.HDictBuilder() \
@@ -137,6 +178,154 @@ class GridTest(unittest.TestCase):
         hdicts.append(d)
         grid.HGridBuilder().dictsToGrid(grid.HDict.EMPTY, hdicts)
 
+    def test_pickle(self):
+        s = ('ver:"2.0" dis:"Title"\nid,site,on,area unit:"ft\xc2\xb2",ts,date,time,uri,val\n'
+             '@a "Alpha",M,T,1200ft\xc2\xb2,2015-01-01T00:00:00-05:00 New_York,2015-01-01,10:00:00,`http://a`,NaN\n'
+             '@b,,F,,2015-01-01T00:15:00Z UTC,,,,-INF\n')
+        for g in (ZincReader(s).readGrid(), ZincReader(s).readGrid(lazy=True)):
+            for protocol in (0, pickle.HIGHEST_PROTOCOL):
+                back = pickle.loads(pickle.dumps(g, protocol))
+                self.assertEqual(type(back), grid.HGrid)
+                self.assertEqual(ZincWriter.gridToString(back), ZincWriter.gridToString(g))
+                row = back.row(0)
+                self.assertTrue(row._index is back.col_index)
+                self.assertEqual(row.get("area"), HNum(1200, "ft\xc2\xb2"))
+                # singletons are unpickled by reference
+                self.assertTrue(row.get("site") is HMarker.VAL)
+                self.assertTrue(row.get("on") is HBool.TRUE)
+                self.assertTrue(row.get("val") is HNum.NaN)
+                self.assertTrue(back.row(1).get("val") is HNum.NEG_INF)
+                self.assertTrue(back.row(1).get("ts").tz is HTimeZone.UTC)
+                self.assertTrue(row.get("ts").tz is HTimeZone.make("New_York"))
+                self.assertTrue(back.col("id").meta is grid.HDict.EMPTY)
+        g = ZincReader(s).readGrid()
+        row = cPickle.loads(cPickle.dumps(g.row(1), 2))
+        self.assertEqual(row.get("ts"), g.row(1).get("ts"))
+        self.assertEqual(row.keys(), g.row(1).keys())
+        # cached zinc is not pickled
+        ts = g.row(0).get("ts")
+        ts.to_zinc()
+        self.assertTrue("_zinc" not in cPickle.dumps(ts, 2))
+        self.assertEqual(pickle.loads(pickle.dumps(grid.HGrid.EMPTY, 2)).num_cols(), 1)
+        d = Storage(a=1)
+        self.assertEqual(cPickle.loads(cPickle.dumps(d, 2)).a, 1)
+
+    def test_columns(self):
+        s = ('ver:"2.0" dis:"Title"\nts,val unit:"kW",on,dis,id,mixed\n'
+             '2015-01-01T00:00:00-05:00 New_York,1.5kW,T,"a",@a,1\n'
+             '2015-01-01T00:15:00.250-05:00 New_York,,,,,\n'
+             '1969-12-31T23:00:00-05:00 New_York,-2kW,F,"b",,2kW\n')
+        g = ZincReader(s).readGrid()
+        cols = g.to_columns()
+        self.assertEqual(cols.keys(), ["ts", "val", "on", "dis", "id", "mixed"])
+        self.assertEqual([c.kind for c in cols.values()], ["datetime", "number", "bool", "str", "object", "object"])
+        ts = cols["ts"]
+        self.assertEqual(list(ts.values), [1420088400000, 1420089300250, 14400000])
+        self.assertEqual(list(ts.tz_offset), [-18000] * 3)
+        self.assertEqual(ts.tz, "New_York")
+        val = cols["val"]
+        self.assertEqual(val.unit, "kW")
+        self.assertEqual(val.meta.get("unit"), HStr("kW"))
+        self.assertEqual(val.values[0], 1.5)
+        self.assertTrue(math.isnan(val.values[1]))
+        self.assertEqual(val.values[2], -2)
+        self.assertEqual(list(val.mask), [0, 1, 0])
+        self.assertEqual(list(cols["on"].values), [1, 0, 0])
+        self.assertEqual(cols["dis"].values, ["a", None, "b"])
+        # numbers of different units are not converted
+        self.assertEqual(cols["mixed"].values, [HNum(1), None, HNum(2, "kW")])
+        self.assertEqual(g.to_columns(cols=["val"]).keys(), ["val"])
+        # and back
+        back = grid.HGrid.from_columns(cols, g.meta)
+        self.assertEqual(ZincWriter.gridToString(back), ZincWriter.gridToString(g))
+        self.assertTrue(back.row(1).get("val") is None)
+        back = grid.HGrid.from_columns([grid.HColumn("ts", "datetime", [0, 86400000], tz_offset=[0, 3600]),
+                                        grid.HColumn("v", "number", [1, 2], mask=[0, 1], unit="kW")])
+        self.assertEqual(ZincWriter.gridToString(back), 'ver:"2.0"\nts,v\n'
+                         '1970-01-01T00:00:00Z UTC,1kW\n1970-01-02T01:00:00+01:00 UTC,\n')
+        self.assertRaises(ValueError, grid.HGrid.from_columns,
+                          [grid.HColumn("a", "str", ["x"]), grid.HColumn("b", "str", [])])
+        self.assertRaises(ValueError, grid.HColumn, "a", "float", [])
+
+    def test_columnar(self):
+        s = ('ver:"2.0" dis:"Title"\nid,dis,area unit:"ft\xc2\xb2",ts\n'
+             '@a "Alpha","A",1200ft\xc2\xb2,2015-01-01T00:00:00-05:00 New_York\n'
+             '@b,,,2015-01-01T00:15:00-05:00 New_York\n'
+             'N,"C",-INF,\n')
+        g = ZincReader(s).readGrid()
+        cg = ZincReader(s).readGrid(columnar=True)
+        self.assertTrue(isinstance(cg, grid.HColumnGrid))
+        self.assertEqual(cg.num_rows(), 3)
+        self.assertEqual(cg.col_vals("dis"), g.col_vals("dis"))
+        self.assertEqual(cg.col_vals("fooBar"), [None] * 3)
+        self.assertEqual(cg.col_slices(1, 3), g.col_slices(1, 3))
+        # rows are views of the columns
+        r = cg.row(-3)
+        self.assertTrue(isinstance(r, grid.HRow))
+        self.assertEqual(r.cells, g.row(0).cells)
+        self.assertEqual(r.get("area"), HNum(1200, "ft\xc2\xb2"))
+        self.assertEqual(r.get(cg.col(1)), HStr("A"))
+        self.assertEqual(r["id"], HRef.make("a", "Alpha"))
+        self.assertEqual(r.dis, "A")
+        self.assertTrue(cg.row(1).missing("dis"))
+        self.assertEqual(r, g.row(0))
+        self.assertEqual([row.get("dis") for row in cg], [HStr("A"), None, HStr("C")])
+        self.assertEqual(len(cg.rows), 3)
+        self.assertRaises(IndexError, cg.row, 3)
+        # writers read the columns
+        for writer in (ZincWriter, JsonWriter, CsvWriter, BinaryWriter):
+            self.assertEqual(writer.gridToString(cg), writer.gridToString(g))
+        self.assertEqual(ZincWriter.gridToString(pickle.loads(pickle.dumps(cg, 2))), ZincWriter.gridToString(g))
+        self.assertEqual(ZincWriter.gridToString(BinaryReader(BinaryWriter.gridToString(g)).readGrid(columnar=True)),
+                         ZincWriter.gridToString(g))
+        # builder
+        b = grid.HGridBuilder()
+        b.addCol("a")
+        b.addCol("b")
+        b.addRow([HNum(1), None])
+        cg = b.toGrid(columnar=True)
+        self.assertEqual(cg.row(0).cells, (HNum(1), None))
+        self.assertEqual(grid.HGridBuilder().toGrid(columnar=True).num_rows(), 0)
+        b.rows.append([HNum(2)])
+        self.assertRaises(ValueError, b.toGrid, columnar=True)
+        self.assertRaises(ValueError, ZincReader(s).readGrid, lazy=True, columnar=True)
+
+    def test_columnar_typed(self):
+        s = ('ver:"2.0"\nts,val\n'
+             '2015-01-01T00:00:00-05:00 New_York,1.5kW\n'
+             '2015-01-01T00:15:00-05:00 New_York,\n')
+        g = ZincReader(s).readGrid()
+        cg = grid.HGrid.from_columns(g.to_columns(), g.meta, columnar=True)
+        self.assertTrue(isinstance(cg, grid.HColumnGrid))
+        # typed columns are returned without conversion, cells are made on access
+        self.assertEqual(cg._cells, [None, None])
+        cols = cg.to_columns()
+        self.assertEqual(list(cols["val"].values)[0], 1.5)
+        self.assertEqual(cg._cells, [None, None])
+        self.assertEqual(cg.col_vals("val"), [HNum(1.5, "kW"), None])
+        self.assertEqual(cg._cells[0], None)
+        self.assertEqual(cg.row(0).get("ts"), g.row(0).get("ts"))
+        self.assertEqual(ZincWriter.gridToString(cg), ZincWriter.gridToString(g))
+
+    def test_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            raise unittest.SkipTest("numpy is not installed")
+        s = ('ver:"2.0"\nts,val,on,dis\n'
+             '2015-01-01T00:00:00-05:00 New_York,1.5kW,T,"a"\n'
+             '2015-01-01T00:15:00-05:00 New_York,,F,\n')
+        g = ZincReader(s).readGrid()
+        cols = g.to_numpy()
+        self.assertEqual(cols["ts"].values.dtype, numpy.dtype("datetime64[ms]"))
+        self.assertEqual(cols["ts"].values[0], numpy.datetime64("2015-01-01T05:00:00.000"))
+        self.assertEqual(cols["val"].values.dtype, numpy.float64)
+        self.assertEqual(cols["val"].mask.tolist(), [False, True])
+        self.assertEqual(cols["on"].values.tolist(), [True, False])
+        self.assertEqual(cols["dis"].values.dtype, numpy.dtype(object))
+        back = grid.HGrid.from_columns(cols)
+        self.assertEqual(ZincWriter.gridToString(back), ZincWriter.gridToString(g))
+
     def verifyCol(self, g, i, n):
         col = g.col(i)
         self.assertEqual(col, g.col(n))
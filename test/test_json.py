@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# coding: utf8
+"""
+Test json reader
+
+"""
+import unittest
+import json
+import StringIO
+from hs.grid import HDict
+from hs.val import HMarker, HStr, HDateTime, HDate, HTime, HTimeZone, HNum, HRef, HUri, HBool
+from hs.io import JsonReader, JsonWriter, ZincReader, ZincWriter
+from hs.jsonbackend import JsonBackend, get_backend, available_backends
+
+
+json_grid = """{
+"meta": {"ver": "2.0", "id": "r:p.1 Point 1", "hisStart": "t:2015-01-01T00:00:00-05:00 New_York"},
+"cols": [{"name": "ts"}, {"name": "val", "unit": "kW"}, {"name": "flag"}],
+"rows": [
+    {"ts": "t:2015-01-01T00:00:00-05:00 New_York", "val": "n:1.5 kW", "flag": "m:"},
+    {"ts": "t:2015-01-01T00:15:00.5Z UTC", "val": "n:-INF", "flag": true},
+    {"ts": "d:2015-01-02", "val": "plain", "other": "n:1"},
+    {"ts": "h:10:00:00", "val": "u:http://x", "flag": "s:a:b"}
+]}
+"""
+
+zinc_grid = """ver:"2.0" hisStart:2015-01-01T00:00:00-05:00 New_York id:@p.1 "Point 1"
+ts,val unit:"kW",flag
+2015-01-01T00:00:00-05:00 New_York,1.5kW,M
+2015-01-01T00:15:00.500Z UTC,-INF,T
+2015-01-02,"plain",
+10:00:00,`http://x`,"a:b"
+"""
+
+
+class JsonTest(unittest.TestCase):
+
+    def test_read(self):
+        grid = JsonReader(json_grid).readGrid()
+        self.assertEqual(grid.meta.get("id"), HRef.make("p.1", "Point 1"))
+        self.assertEqual(grid.meta.get("hisStart"),
+                         HDateTime.make(HDate.make(2015, 1, 1), HTime.make(0, 0, 0),
+                                        HTimeZone.make("New_York"), -5 * 3600))
+        self.assertEqual(grid.col(1).meta.get("unit"), HStr("kW"))
+        row = grid.row(0)
+        self.assertEqual(row.get("val"), HNum(1.5, "kW"))
+        self.assertEqual(row.get("val").unit, "kW")
+        self.assertTrue(row.get("flag") is HMarker.VAL)
+        self.assertTrue(grid.row(1).get("flag") is HBool.TRUE)
+        self.assertEqual(grid.row(1).get("ts").time, HTime.make(0, 15, 0, 500))
+        self.assertEqual(grid.row(2).get("ts"), HDate.make(2015, 1, 2))
+        self.assertEqual(grid.row(2).get("val"), HStr("plain"))
+        self.assertIsNone(grid.row(2).get("flag"))
+        self.assertEqual(grid.row(3).get("val"), HUri("http://x"))
+        self.assertEqual(grid.row(3).get("flag"), HStr("a:b"))
+        self.assertEqual(ZincWriter.gridToString(grid), zinc_grid)
+
+    def test_stream(self):
+        # values split across chunks of all sizes
+        for size in (1, 2, 7, 64):
+            chunks = [json_grid[i:i + size] for i in range(0, len(json_grid), size)]
+            self.assertEqual(ZincWriter.gridToString(JsonReader(chunks).readGrid()), zinc_grid)
+        reader = JsonReader(StringIO.StringIO(json_grid), chunk_size=16)
+        header = reader.readHeader()
+        self.assertEqual(header.num_rows(), 0)
+        self.assertEqual([col.name for col in header.cols], ["ts", "val", "flag"])
+        rows = list(reader.iterRows())
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0].get("val"), HNum(1.5, "kW"))
+        self.assertIsNone(reader.readHeader())
+
+    def test_rows_before_cols(self):
+        s = '{"rows": [{"a": "n:1"}, {}], "cols": [{"name": "a"}], "meta": {"ver:": "2.0"}}'
+        self.assertEqual(ZincWriter.gridToString(JsonReader(s).readGrid()),
+                         'ver:"2.0"\na\n1\nN\n')
+
+    def test_multigrid(self):
+        second = json_grid.replace('r:p.1', 'r:p.2')
+        for s in ('{"grids": [%s, %s]}' % (json_grid, second), '[%s, %s]' % (json_grid, second)):
+            grids = JsonReader(s).readGrids()
+            self.assertEqual(len(grids), 2)
+            self.assertEqual(grids[1].meta.get("id"), HRef.make("p.2", "Point 1"))
+            self.assertEqual(grids[1].num_rows(), 4)
+        # rows of the first grid are skipped
+        reader = JsonReader('{"grids": [%s, %s]}' % (json_grid, second))
+        reader.readHeader()
+        self.assertEqual(reader.readHeader().meta.get("id").val, "p.2")
+        self.assertEqual(len(list(reader.iterCells())), 4)
+        self.assertEqual(JsonReader(" ").readGrids(), [])
+        self.assertEqual(JsonReader('{"grids": []}').readGrids(), [])
+
+    def test_errors(self):
+        for s in ('{"meta": {}, "cols": [{"name": "a"}], "rows": [{"a": "q:1"}]}',
+                  '{"meta": {}, "cols": [{"name": "a"}], "rows": [1]}',
+                  '{"meta": {}, "cols": [{"name": "a"}], "rows": [{"a": "n:1"}',
+                  '{"meta": {}, "cols": [{"name": "a"}], "rows": [{"a": {}}]}',
+                  '"grid"'):
+            self.assertRaises(ValueError, JsonReader(s).readGrid)
+
+    def test_unmodeled_kinds(self):
+        grid = JsonReader('{"meta": {"ver": "2.0"}, "cols": [{"name": "a"}, {"name": "b"}], "rows": ['
+                          '{"a": "c:37.55,-77.45", "b": "x:Span:2015-01-01"}, {"a": "b:text/plain"}]}').readGrid()
+        self.assertEqual(grid.row(0).get("a"), HStr("c:37.55,-77.45"))
+        self.assertEqual(grid.row(0).get("b"), HStr("x:Span:2015-01-01"))
+        self.assertEqual(grid.row(1).get("a"), HStr("b:text/plain"))
+
+    def test_write(self):
+        grid = ZincReader(zinc_grid).readGrid()
+        out = JsonWriter.gridToString(grid)
+        obj = json.loads(out)
+        self.assertEqual(obj["meta"]["ver"], "2.0")
+        self.assertEqual(obj["meta"]["id"], "r:p.1 Point 1")
+        self.assertEqual(obj["cols"][1], {"name": "val", "unit": "kW"})
+        self.assertEqual(obj["rows"][0], {"ts": "t:2015-01-01T00:00:00-05:00 New_York",
+                                          "val": "n:1.5 kW", "flag": "m:"})
+        self.assertEqual(obj["rows"][1]["val"], "n:-INF")
+        self.assertEqual(obj["rows"][1]["flag"], True)
+        # null cells are omitted
+        self.assertEqual(obj["rows"][2], {"ts": "d:2015-01-02", "val": "plain"})
+        self.assertEqual(obj["rows"][3], {"ts": "h:10:00:00", "val": "u:http://x", "flag": "s:a:b"})
+        # name is only reserved in column dicts
+        grid = ZincReader('ver:"2.0" name:"meta"\nname,b dis:"B"\n"x",1\n').readGrid()
+        back = JsonReader(JsonWriter.gridToString(grid)).readGrid()
+        self.assertEqual(back.meta.get("name"), HStr("meta"))
+        self.assertEqual(ZincWriter.gridToString(back), ZincWriter.gridToString(grid))
+        self.assertEqual(ZincWriter.gridToString(JsonReader(out).readGrid()), zinc_grid)
+
+    def test_write_stream(self):
+        out = StringIO.StringIO()
+        w = JsonWriter(out)
+        w.writeHeader(HDict.EMPTY, ["id", "dis"])
+        w.writeRow([HRef.make("a"), HStr(u"caf\xe9")])
+        w.writeRows([{"id": HRef.make("b", "B")}, [None, None]])
+        w.writeEnd()
+        self.assertEqual(out.getvalue(), '{"meta":{"ver":"2.0"},"cols":[{"name":"id"},{"name":"dis"}],'
+                                         '"rows":[{"id":"r:a","dis":"caf\\u00e9"},{"id":"r:b B"},{}]}')
+        self.assertRaises(ValueError, w.writeRow, [None, None])
+
+        # multigrid of a generator
+        grids = (ZincReader(zinc_grid).readGrid() for i in range(3))
+        out = JsonWriter.gridsToString(grids)
+        self.assertEqual(len(json.loads(out)["grids"]), 3)
+        self.assertEqual(ZincWriter.gridsToString(JsonReader(out).readGrids()),
+                         zinc_grid * 3)
+
+    def test_backends(self):
+        self.assertTrue("json" in available_backends())
+        self.assertEqual(get_backend().name, available_backends()[0])
+        self.assertTrue(get_backend("json") is get_backend(get_backend("json")))
+        self.assertRaises(ValueError, get_backend, "nosuchjson")
+        grid = ZincReader(zinc_grid).readGrid()
+        multi = '{"grids": [%s, %s]}' % (json_grid, json_grid)
+        for name in available_backends():
+            self.assertEqual(ZincWriter.gridToString(JsonReader(json_grid, backend=name).readGrid()),
+                             zinc_grid, name)
+            self.assertEqual(len(JsonReader(multi, backend=name).readGrids()), 2, name)
+            # incremental parsing, by the json module for backends without raw_decode
+            reader = JsonReader(StringIO.StringIO(json_grid), chunk_size=16, backend=name)
+            self.assertEqual(ZincWriter.gridToString(reader.readGrid()), zinc_grid, name)
+            out = StringIO.StringIO()
+            JsonWriter(out, backend=name).writeGrid(grid)
+            self.assertEqual(json.loads(out.getvalue()), json.loads(JsonWriter.gridToString(grid)), name)
+            self.assertRaises(ValueError, JsonReader('{"rows": [', backend=name).readGrid)
+        backend = JsonBackend("loads only", json.loads, get_backend("json").encode_str)
+        self.assertEqual(ZincWriter.gridToString(JsonReader(json_grid, backend=backend).readGrid()),
+                         zinc_grid)
+
+
+if __name__ == '__main__':
+    unittest.main()
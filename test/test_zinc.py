@@ -5,12 +5,17 @@ Test zinc read and writer
 
 """
 import unittest
+import math
 import json
 import csv
 import StringIO
-from hs.grid import HDict, HDictBuilder
-from hs.val import HMarker, HStr, HDateTime, HDate, HTime, HTimeZone, HNum, HRef
-from hs.io import ZincReader, ZincWriter, JsonWriter, CsvWriter
+import os
+import tempfile
+import gzip
+from hs.grid import HDict, HDictBuilder, HColumnGrid
+from hs.val import HMarker, HStr, HDateTime, HDate, HTime, HTimeZone, HNum, HRef, HUri, HBool
+from hs.io import ZincReader, ZincWriter, JsonWriter, CsvWriter, ZincStreamReader, decompress_chunks, iter_lines
+from hs.parallel import read_grids_parallel
 
 
 grid1 = """ver:"2.0"
@@ -154,6 +159,14 @@ all_single_grid_payloads = [ grid1, grid2, zinc_hisRead2, zinc_hisRead, zinc_his
 # these don't pass zinc read test:
 to_fix = [ zinc_hisRead_err1, err1,  ]
 
+zinc_scalars = \
+"""ver:"2.0" num:-3.5e2 unit:1_000kW date:2015-01-02 time:12:30:00.5 ref:@a.b-c "Dis" uri:`http://x` str:"a\\tb\\"c\\\\" bool:F inf:-INF utc:2015-01-02T00:00:00.123Z
+x,y
+1,2
+,N
+  M , R
+"""
+
 multigrid = \
     """ver:"2.0"
 header_label,header_value,type
@@ -180,6 +193,18 @@ class ZincTest(unittest.TestCase):
         self.verifyZinc(HNum.make(float("inf")), "INF")
         self.verifyZinc(HNum.make(float("-inf")), "-INF")
 
+    def testStr(self):
+        """Test HStr and HRef zinc escaping and cached encoding."""
+        self.verifyZinc(HStr.make("plain"), '"plain"')
+        self.verifyZinc(HStr.make('a"b\\c\nd\te'), '"a\\"b\\\\c\\nd\\te"')
+        self.verifyZinc(HStr.make("x\x01y\x1f"), '"x\\u0001y\\u001f"')
+        self.verifyZinc(HStr.make(u"caf\u00e9"), u'"caf\u00e9"')
+        self.verifyZinc(HRef.make("a", 'b "c"'), '@a "b \\"c\\""')
+        s = HStr.make("x\x01y")
+        self.assertTrue(s.to_zinc() is s.to_zinc())
+        grid = ZincReader('ver:"2.0"\na\n%s\n' % s.to_zinc()).readGrid()
+        self.assertEqual(grid.row(0).get("a"), s)
+
 
     def test_csv(self):
         for s in all_single_grid_payloads:
@@ -306,6 +331,369 @@ class ZincTest(unittest.TestCase):
 
 
 
+    def test_scalars(self):
+        """Test zinc scalar values in grid meta
+        """
+        grid = ZincReader(zinc_scalars).readGrid()
+        self.assertEqual(grid.meta.get("num"), HNum.make(-350))
+        self.assertEqual(grid.meta.get("unit"), HNum.make(1000, "kW"))
+        self.assertEqual(grid.meta.get("unit").unit, "kW")
+        self.assertEqual(grid.meta.get("date"), HDate.make(2015, 1, 2))
+        self.assertEqual(grid.meta.get("time"), HTime.make(12, 30, 0, 500))
+        self.assertEqual(grid.meta.get("ref"), HRef.make("a.b-c", "Dis"))
+        self.assertEqual(grid.meta.get("ref").dis, "Dis")
+        self.assertEqual(grid.meta.get("uri"), HUri.make("http://x"))
+        self.assertEqual(grid.meta.get("str"), HStr.make('a\tb"c\\'))
+        self.assertEqual(grid.meta.get("bool"), HBool.FALSE)
+        self.assertEqual(grid.meta.get("inf"), HNum.NEG_INF)
+        self.assertEqual(grid.meta.get("utc"),
+                         HDateTime.make(HDate.make(2015,1,2), HTime.make(0,0,0,123), HTimeZone.UTC, 0))
+        self.assertEqual(grid.row(1).get("x"), None)
+        self.assertEqual(grid.row(1).get("y"), None)
+        self.assertEqual(grid.row(2).get("x"), HMarker.VAL)
+        self.assertEqual(grid.row(2).get("y"), HStr.make("_remove_"))
+
+    def test_read_errors(self):
+        """Test parse errors report the line of the error
+        """
+        for s, msg in [('ver:"2.0"\nx\n"unterminated\n', "Unexpected newline in str literal [Line 3]"),
+                       ('ver:"2.0"\nx,y\n1,2\n1\n', "Expecting comma in row [Line 4]"),
+                       ('ver:"2.0"\nx\n1,2\n', "Expecting newline [Line 3]"),
+                       ('ver:"2.0"\nx\nfoo\n', "Unknown value identifier: foo [Line 3]"),
+                       ('ver:"2.0"\nX\n1\n', "Invalid name start char [Line 2]"),
+                       ]:
+            try:
+                ZincReader(s).readGrid()
+                self.fail("Expected parse error for %r" % s)
+            except ValueError, e:
+                self.assertTrue(str(e).startswith(msg), str(e))
+
+    def test_stream(self):
+        """Test incremental read from chunks and file-like objects
+        """
+        chunks = [zinc_hisRead3[i:i+7] for i in range(0, len(zinc_hisRead3), 7)]
+        reader = ZincStreamReader(iter(chunks))
+        header = reader.readHeader()
+        self.assertEqual(header.num_rows(), 0)
+        self.assertEqual(header.meta.get("id"), HRef.make("Gaithersburg.RTU-2.ZoneTemp"))
+        expected = ZincReader(zinc_hisRead3).readGrid()
+        rows = list(reader.iterRows())
+        self.assertEqual(len(rows), expected.num_rows())
+        for i, row in enumerate(rows):
+            self.assertEqual(row.get("ts"), expected.row(i).get("ts"))
+            self.assertEqual(row.get("val"), expected.row(i).get("val"))
+        self.assertIsNone(reader.readHeader())
+
+        # multigrid, second grid is read without iterating rows of the first
+        reader = ZincStreamReader(StringIO.StringIO(multigrid), chunk_size=5)
+        self.assertEqual(reader.readHeader().col(0).name, "header_label")
+        grid = reader.readGrid()
+        self.assertEqual(ZincWriter.gridToString(grid),
+                         ZincWriter.gridToString(ZincReader(multigrid).readGrid(1)))
+        self.assertIsNone(reader.readGrid())
+
+        # lines spread over many chunks
+        s = "a\n" + "x" * 1000 + "\n\nb"
+        chunks = [s[i:i+3] for i in range(0, len(s), 3)]
+        self.assertEqual(list(iter_lines(chunks)), ["a\n", "x" * 1000 + "\n", "\n", "b"])
+        self.assertEqual(list(iter_lines(["a\nb\n", "", "\n"], keepends=False)), ["a", "b", ""])
+
+        try:
+            list(ZincStreamReader('ver:"2.0"\nx\n1\n2\n3,4\n').iterCells())
+            self.fail("Expected parse error")
+        except ValueError, e:
+            self.assertTrue(str(e).startswith("Expecting newline [Line 5]"), str(e))
+
+    def test_stream_write(self):
+        """Test writing rows without building a grid
+        """
+        grid = ZincReader(multigrid).readGrid(1)
+        out = StringIO.StringIO()
+        writer = ZincWriter(out)
+        self.assertRaises(ValueError, writer.writeRow, [None])
+        writer.writeHeader(grid.meta, grid.cols)
+        writer.writeRow(grid.row(0))
+        writer.writeRows(row.cells for row in grid.rows[1:])
+        self.assertEqual(out.getvalue(), ZincWriter.gridToString(grid))
+        self.assertRaises(ValueError, writer.writeRow, [None])
+
+        out = StringIO.StringIO()
+        writer = ZincWriter(out)
+        writer.writeHeader(HDict.EMPTY, ["a", "b"])
+        writer.writeRows([[HNum.make(1), HStr.make("x")], {"b": HMarker.VAL}, [None, None]])
+        self.assertEqual(out.getvalue(), 'ver:"2.0"\na,b\n1,"x"\nN,M\nN,\n')
+
+        # rows buffered by writeRow are written by writeEnd, grids are separated by empty lines
+        out = StringIO.StringIO()
+        writer = ZincWriter(out)
+        for grid in ZincReader(multigrid).readGrids():
+            writer.writeHeader(grid.meta, grid.cols)
+            for row in grid.rows:
+                writer.writeRow(row)
+            self.assertRaises(ValueError, writer.writeRow, [None] * 5)
+            writer.writeEnd()
+        self.assertRaises(ValueError, writer.writeEnd)
+        self.assertTrue(out.getvalue().endswith('"ENERGY CHARGE"\n\n'))
+        self.assertEqual(ZincWriter.gridsToString(ZincStreamReader(out.getvalue()).iterGrids()),
+                         ZincWriter.gridsToString(ZincReader(multigrid).readGrids()))
+
+    def test_column_encoders(self):
+        """Test column encoded grids match cell by cell encoding
+        """
+        grid = ZincReader('ver:"2.0"\n'
+            'a,m,n,u,b,ts,mixed\n'
+            ',M,1kW,1kW,T,2015-01-02T10:00:00-05:00 New_York,M\n'
+            '1,,-2.5kW,NaN,F,2015-07-02T10:00:00.5-04:00 New_York,1\n'
+            ',,INF,3,,2015-01-02T10:00:00Z UTC,\n'
+            '"x",M,,4m,T,,"s"\n').readGrid()
+        out = StringIO.StringIO()
+        writer = ZincWriter(out)
+        writer.writeHeader(grid.meta, grid.cols)
+        for row in grid.rows:
+            writer.writeRow(row.cells)
+        writer.flush()
+        self.assertEqual(ZincWriter.gridToString(grid), out.getvalue())
+        self.assertTrue("\nN,M,1kW," in out.getvalue())
+
+        csv = CsvWriter.gridToString(grid).splitlines()
+        self.assertEqual(csv[1], u'"",\u2713,1kW,1kW,T,2015-01-02T10:00:00-05:00 New_York,\u2713'.encode('utf-8'))
+        self.assertEqual(csv[3], u'"","",INF,3,"",2015-01-02T10:00:00Z UTC,""')
+
+        # the column encoders fill and reuse the zinc cached on values
+        grid = ZincReader('ver:"2.0"\nn,ts\n1kW,2015-01-02T10:00:00-05:00 New_York\n'
+                          '2,2015-01-02T10:00:00Z UTC\n').readGrid()
+        zinc = ZincWriter.gridToString(grid)
+        self.assertEqual(grid.row(0).get("n")._zinc, "1kW")
+        self.assertEqual(grid.row(1).get("ts")._zinc, "2015-01-02T10:00:00Z UTC")
+        grid.row(0).get("n")._zinc = "5kW"
+        self.assertEqual(ZincWriter.gridToString(grid), zinc.replace("1kW", "5kW"))
+
+    def test_buffered_write(self):
+        """Test writers buffer output into chunks and encode unicode
+        """
+        class Out(object):
+            def __init__(self):
+                self.chunks = []
+            def write(self, s):
+                self.chunks.append(s)
+
+        grids = ZincReader(multigrid).readGrids()
+        for cls in (ZincWriter, JsonWriter, CsvWriter):
+            out = Out()
+            cls(out).writeGrids(grids)
+            self.assertTrue(len(out.chunks) <= len(grids))
+            self.assertEqual("".join(out.chunks), cls.gridsToString(grids))
+            out = Out()
+            cls(out, chunk_size=20).writeGrids(grids)
+            self.assertTrue(len(out.chunks) > 2)
+            self.assertEqual("".join(out.chunks), cls.gridsToString(grids))
+
+        grid = ZincReader(u'ver:"2.0"\na\n"caf\u00e9"\n').readGrid()
+        out = Out()
+        ZincWriter(out, encoding="utf-8").writeGrid(grid)
+        self.assertEqual(out.chunks, ['ver:"2.0"\na\n"caf\xc3\xa9"\n'])
+        self.assertTrue(all(type(chunk) is str for chunk in out.chunks))
+
+    def test_gzip(self):
+        """Test appending grids to gzip archives and reading them back
+        """
+        grids = ZincReader(multigrid).readGrids()
+        his = ZincReader(zinc_hisRead3).readGrids()
+        fd, path = tempfile.mkstemp(suffix=".zinc.gz")
+        os.close(fd)
+        try:
+            ZincWriter.gridsToGzip(grids, path, append=False)
+            size = os.path.getsize(path)
+            ZincWriter.gridsToGzip(his, path)
+            expected = ZincWriter.gridsToString(grids + his)
+            self.assertEqual(gzip.open(path).read(), expected)
+            reader = ZincStreamReader.from_gzip(path, chunk_size=16)
+            read = list(reader.iterGrids())
+            self.assertEqual(ZincWriter.gridsToString(read), expected)
+            # the file is closed when read completely or at the end of with
+            self.assertTrue(reader._file.closed)
+            with ZincStreamReader.from_gzip(path, chunk_size=16) as reader:
+                self.assertEqual(reader.readHeader().num_cols(), grids[0].num_cols())
+            self.assertTrue(reader._file.closed)
+
+            # chunks ending at the end of a gzip member
+            data = open(path, "rb").read()
+            self.assertEqual("".join(decompress_chunks([data[:size], data[size:]])), expected)
+        finally:
+            os.remove(path)
+
+    def test_multigrid_ranges(self):
+        """Test multigrid boundaries are found at line starts only
+        """
+        s = 'ver:"2.0"\nuri\n`http://x/?ver:"2.0"`\n\nver:"2.0" b\nx\n1\n2\n'
+        reader = ZincReader(s)
+        self.assertEqual(len(reader.grid_ranges), 2)
+        self.assertEqual(reader.readGrid(0).row(0).get("uri"), HUri.make('http://x/?ver:"2.0"'))
+        self.assertEqual(reader.readGrid(1).num_rows(), 2)
+        grids = reader.iterGrids()
+        self.assertEqual(next(grids).col(0).name, "uri")
+        self.assertEqual(next(grids).meta.get("b"), HMarker.VAL)
+        self.assertRaises(StopIteration, next, grids)
+
+    def test_datetime_parts(self):
+        """Test datetimes of a grid share decoded date and timezone parts
+        """
+        grid = ZincReader('ver:"2.0"\nts\n'
+                          '2015-01-02T10:00:00-05:00 New_York\n'
+                          '2015-01-02T10:15:00.5-05:00 New_York\n'
+                          '2015-01-02T10:15:00Z\n').readGrid()
+        a, b, c = [row.get("ts") for row in grid]
+        self.assertTrue(a.date is b.date)
+        self.assertTrue(a.tz is b.tz)
+        self.assertEqual((b.time.min, b.time.ms, b.tz_offset), (15, 500, -18000))
+        self.assertEqual((c.tz, c.tz_offset), (HTimeZone.UTC, 0))
+
+    def test_lazy(self):
+        """Test lazy grids decode rows on access
+        """
+        s = 'ver:"2.0"\na,b,c\n1,"x, y",@r "dis, z"\n2,N,\n3,bad,`u`\n'
+        eager = ZincReader(s.replace("bad", '"ok"')).readGrid()
+        grid = ZincReader(s.replace("bad", '"ok"')).readGrid(lazy=True)
+        self.assertEqual(grid.num_rows(), 3)
+        self.assertEqual(grid.col_vals("c"), eager.col_vals("c"))
+        self.assertEqual([r.cells for r in grid], [r.cells for r in eager.rows])
+        self.assertEqual(grid.rows[-1].get("a"), HNum.make(3))
+        self.assertEqual(len(grid.rows[1:]), 2)
+        self.assertRaises(IndexError, grid.row, 3)
+
+        # invalid cells are only reported when they are decoded
+        grid = ZincReader(s).readGrid(lazy=True, cache_size=1)
+        self.assertEqual(grid.col_vals("a"), [HNum.make(1), HNum.make(2), HNum.make(3)])
+        self.assertEqual(grid.row(0).get("b"), HStr.make("x, y"))
+        self.assertTrue(grid.row(0) is grid.row(0))
+        self.assertRaises(ValueError, grid.row, 2)
+        self.assertRaises(ValueError, ZincReader('ver:"2.0"\na\n1').readGrid, lazy=True)
+
+    def test_parallel(self):
+        """Test grids parsed in chunks by worker processes
+        """
+        s = multigrid + 'ver:"2.0"\nid,v,ts\n' + ''.join(
+            '@p%d "P %d",%d%s,2015-01-0%dT10:00:00-05:00 New_York\n' % (i, i, i, "kW" if i % 2 else "", i % 9 + 1)
+            for i in range(200))
+        reader = ZincReader(s)
+        expected = [ZincWriter.gridToString(grid) for grid in reader.readGrids()]
+        grids = read_grids_parallel(s, reader.grid_ranges, workers=2, chunk_size=100)
+        self.assertEqual([ZincWriter.gridToString(grid) for grid in grids], expected)
+        grids = reader.readGridsParallel(workers=2, threshold=0)
+        self.assertEqual([ZincWriter.gridToString(grid) for grid in grids], expected)
+        # chunks run in this process
+        executor = type("Executor", (object,), {"map": staticmethod(map)})()
+        grids = read_grids_parallel(s, reader.grid_ranges, executor, chunk_size=100, columnar=True)
+        self.assertTrue(isinstance(grids[2], HColumnGrid))
+        self.assertEqual([ZincWriter.gridToString(grid) for grid in grids], expected)
+        # serial without executor on one cpu
+        grids = read_grids_parallel(s, reader.grid_ranges, workers=1)
+        self.assertEqual([ZincWriter.gridToString(grid) for grid in grids], expected)
+
+        bad = 'ver:"2.0"\na\n1\n2\nfoo\n'
+        try:
+            read_grids_parallel(bad, [(0, len(bad))], workers=2, chunk_size=1)
+            self.fail("expected ValueError")
+        except ValueError as e:
+            self.assertTrue("[Line 5]" in str(e))
+
+    def test_from_path(self):
+        """Test reading memory mapped files
+        """
+        fd, path = tempfile.mkstemp(suffix=".zinc")
+        try:
+            os.write(fd, multigrid + "\n" + zinc_hisRead3)
+            os.close(fd)
+            reader = ZincReader.from_path(path)
+            expected = ZincReader(multigrid + "\n" + zinc_hisRead3)
+            self.assertEqual(len(reader.grid_ranges), 3)
+            self.assertEqual([ZincWriter.gridToString(g) for g in reader.readGrids()],
+                             [ZincWriter.gridToString(g) for g in expected.readGrids()])
+            self.assertEqual(list(reader.readHis(2).ts), list(expected.readHis(2).ts))
+            lazy = reader.readGrid(1, lazy=True)
+            self.assertEqual(lazy.row(0).cells, expected.readGrid(1).row(0).cells)
+            reader.close()
+            self.assertRaises(ValueError, lazy.row, 1)
+
+            open(path, "wb").close()
+            self.assertEqual(ZincReader.from_path(path).grid_ranges, [(0, 0)])
+        finally:
+            os.remove(path)
+
+    def test_his(self):
+        """Test columnar read of history grids
+        """
+        his = ZincReader(zinc_hisRead3).readHis()
+        self.assertEqual(his.num_rows(), 9)
+        self.assertEqual(his.tz, "New_York")
+        self.assertEqual(his.meta.get("tz"), HStr.make("New_York"))
+        self.assertEqual(his.unit, None)
+        # 2015-11-27T00:15:00-05:00
+        self.assertEqual(his.ts[0], 1448601300000)
+        self.assertEqual(his.tz_offset[0], -18000)
+        self.assertEqual(his.val[0], 67.2741)
+
+        # converted back to grid rows match the regular read
+        grid = ZincReader(zinc_hisRead3).readGrid()
+        for i, row in enumerate(his.toGrid()):
+            self.assertEqual(row.get("ts"), grid.row(i).get("ts"))
+            self.assertEqual(row.get("val"), grid.row(i).get("val"))
+
+        his = ZincReader('ver:"2.0"\nts,val\n'
+                         '2015-01-01T00:00:00.5Z UTC,5kW\n'
+                         '2015-01-01T00:15:00Z UTC,T\n'
+                         '2015-01-01T00:30:00Z,N\n'
+                         '2015-01-01T00:45:00Z UTC,\n').readHis()
+        self.assertEqual(list(his.ts), [1420070400500, 1420071300000, 1420072200000, 1420073100000])
+        self.assertEqual(his.val[:2].tolist(), [5.0, 1.0])
+        self.assertTrue(math.isnan(his.val[2]) and math.isnan(his.val[3]))
+        self.assertEqual(his.unit, "kW")
+        self.assertEqual(his.tz, "UTC")
+
+        # NaN and INF are written without unit
+        for special in ("NaN", "INF", "-INF"):
+            for vals in (("1kW", special, "2kW"), (special, "1kW", "2kW"), ("1kW", "N", special)):
+                his = ZincReader('ver:"2.0"\nts,val\n'
+                                 '2015-01-01T00:00:00Z UTC,%s\n'
+                                 '2015-01-01T00:15:00Z UTC,%s\n'
+                                 '2015-01-01T00:30:00Z UTC,%s\n' % vals).readHis()
+                self.assertEqual(his.unit, "kW")
+                self.assertEqual(his.val[vals.index("1kW")], 1.0)
+        his = ZincReader('ver:"2.0"\nts,val\n'
+                         '2015-01-01T00:00:00Z UTC,1kW\n'
+                         '2015-01-01T00:15:00Z UTC,INF\n').readHis()
+        self.assertEqual(his.val[1], float('inf'))
+
+        self.assertRaises(ValueError, ZincReader(zinc_hisWriteMulti).readHis)
+        self.assertRaises(ValueError, ZincReader('ver:"2.0"\nts,val\n'
+                                                 '2015-01-01T00:00:00Z UTC,5kW\n'
+                                                 '2015-01-01T00:15:00Z UTC,5W\n').readHis)
+        # numbers without unit after numbers with unit and the reverse
+        for vals in (("5kW", "5"), ("5", "5kW")):
+            self.assertRaises(ValueError, ZincReader('ver:"2.0"\nts,val\n'
+                                                     '2015-01-01T00:00:00Z UTC,%s\n'
+                                                     '2015-01-01T00:15:00Z UTC,%s\n' % vals).readHis)
+        # out of range time of day
+        for time in ("24:00:00", "10:60:00", "10:00:60"):
+            self.assertRaises(ValueError, ZincReader('ver:"2.0"\nts,val\n'
+                                                     '2015-01-01T00:00:00Z UTC,5\n'
+                                                     '2015-01-01T%sZ UTC,5\n' % time).readHis)
+
+    def test_interning(self):
+        """Test timezones, units and refs are shared instances
+        """
+        grid = ZincReader('ver:"2.0"\nid,siteRef,ts,area\n'
+                          '@a,@s "Site",2015-01-01T00:00:00-05:00 New_York,10ft\n'
+                          '@b,@s "Site",2015-01-01T00:15:00-05:00 New_York,20ft\n').readGrid()
+        a, b = grid.row(0), grid.row(1)
+        self.assertIs(a.get("siteRef"), b.get("siteRef"))
+        self.assertIs(a.get("siteRef"), HRef.make("s", "Site"))
+        self.assertIsNot(a.get("siteRef"), HRef.make("s"))
+        self.assertIs(a.get("ts").tz, b.get("ts").tz)
+        self.assertIs(a.get("ts").tz, HTimeZone.make("New_York"))
+        self.assertIs(a.get("area").unit, b.get("area").unit)
+        self.assertIs(HTimeZone.make("UTC"), HTimeZone.UTC)
+
     #@unittest.skip("Disabled while testing other functions")
     def test_singlegrid(self):
         """Test single grid read